@@ -0,0 +1,84 @@
+"""
+Module that keeps a local DuckDB copy of AGG_Truck_Hourly for the dashboard,
+filled from the Parquet snapshots the pipeline exports after each load
+"""
+from datetime import datetime
+import duckdb
+import pandas as pd
+from analytics_snapshot import list_hourly_totals_snapshots, read_hourly_totals_snapshot
+
+CREATE_STORE_QUERIES = [
+    """CREATE TABLE IF NOT EXISTS hourly_totals (
+        event_hour TIMESTAMP NOT NULL,
+        truck_id SMALLINT NOT NULL,
+        payment_method_id SMALLINT NOT NULL,
+        total_transactions BIGINT NOT NULL,
+        total_profits DOUBLE NOT NULL,
+        updated_at TIMESTAMP NOT NULL,
+        imported_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (event_hour, truck_id, payment_method_id));""",
+    """CREATE TABLE IF NOT EXISTS imported_snapshots (
+        snapshot_name VARCHAR PRIMARY KEY,
+        imported_at TIMESTAMP NOT NULL DEFAULT current_timestamp);"""
+]
+
+
+def open_analytics_store(store_path: str) -> duckdb.DuckDBPyConnection:
+    """Returns a connection to the DuckDB analytics store, creating its tables if needed"""
+    store = duckdb.connect(store_path)
+    for sql_query in CREATE_STORE_QUERIES:
+        store.execute(sql_query)
+    return store
+
+
+def get_imported_snapshots(store: duckdb.DuckDBPyConnection) -> set[str]:
+    """Returns the names of the snapshots already imported into the store"""
+    return {row[0] for row in store.execute(
+        'SELECT snapshot_name FROM imported_snapshots;').fetchall()}
+
+
+def import_hourly_totals_snapshot(store: duckdb.DuckDBPyConnection, snapshot_path: str,
+                                  snapshot_name: str) -> None:
+    """
+    Replaces the hourly totals in the store with those in a snapshot, noting when they
+    were imported, and records the snapshot as imported, in one transaction
+    """
+    snapshot_totals = read_hourly_totals_snapshot(snapshot_path, snapshot_name)
+    store.begin()
+    try:
+        store.register('snapshot_totals', snapshot_totals)
+        store.execute("""INSERT OR REPLACE INTO hourly_totals SELECT event_hour, truck_id,
+            payment_method_id, total_transactions, total_profits, updated_at,
+            CAST(now() AS TIMESTAMP) FROM snapshot_totals;""")
+        store.execute('INSERT INTO imported_snapshots (snapshot_name) VALUES (?);',
+                      [snapshot_name])
+        store.commit()
+    except duckdb.Error:
+        store.rollback()
+        raise
+    finally:
+        store.unregister('snapshot_totals')
+
+
+def import_new_snapshots(store: duckdb.DuckDBPyConnection, snapshot_path: str) -> int:
+    """
+    Imports every snapshot not yet in the store in the order they were exported,
+    so later totals for an hour replace earlier ones, and returns how many were imported
+    """
+    imported_snapshots = get_imported_snapshots(store)
+    new_snapshots = [snapshot_name for snapshot_name in list_hourly_totals_snapshots(snapshot_path)
+                     if snapshot_name not in imported_snapshots]
+    for snapshot_name in new_snapshots:
+        import_hourly_totals_snapshot(store, snapshot_path, snapshot_name)
+    return len(new_snapshots)
+
+
+def load_hourly_totals_from_store(store: duckdb.DuckDBPyConnection,
+                                  imported_since: datetime) -> pd.DataFrame:
+    """
+    Returns the hourly totals imported into the store since the given time, with the
+    import time as updated_at, so totals from a snapshot exported late are not missed
+    """
+    return store.execute("""SELECT event_hour, truck_id, payment_method_id AS type,
+        total_transactions, total_profits, imported_at AS updated_at FROM hourly_totals
+        WHERE imported_at >= ? ORDER BY event_hour, truck_id, type;""", [imported_since]).df()
@@ -1,140 +1,228 @@
 """Module to run the Streamlit Financial Dashboard"""
 from os import environ
+from datetime import datetime, timedelta
+from threading import Lock
+from time import monotonic
 import pandas as pd
 import streamlit as st
-import pymysql.cursors
 import pymysql
 import altair as alt
+import duckdb
 from dotenv import load_dotenv
+from dimension_cache import get_payment_method_names, get_truck_column, \
+    clear_dimension_cache
+from database_connection import pooled_connection
+from analytics_store import open_analytics_store, import_new_snapshots, \
+    load_hourly_totals_from_store
+
+HOURLY_TOTAL_KEYS = ['event_hour', 'truck_id', 'type']
+HOURLY_TOTAL_VALUES = ['total_transactions', 'total_profits']
+DASHBOARD_REFRESH_SECONDS = int(environ.get('DASHBOARD_REFRESH_SECONDS', 60))
+DASHBOARD_CACHE_MAX_MEGABYTES = int(environ.get('DASHBOARD_CACHE_MAX_MEGABYTES', 512))
+EARLIEST_UPDATE = datetime(1970, 1, 1)
+UPDATE_OVERLAP = timedelta(minutes=5)
+
+
+def add_payment_method_names(conn: pymysql.connections.Connection,
+                             hourly_totals: pd.DataFrame) -> pd.DataFrame:
+    """Returns the hourly totals typed, with each payment method id replaced by its name"""
+    payment_method_names = get_payment_method_names(conn)
+    return hourly_totals.assign(
+        type=hourly_totals['type'].map(payment_method_names).astype(
+            pd.CategoricalDtype(payment_method_names.values()))).astype({
+                'event_hour': 'datetime64[ns]', 'truck_id': 'int16', 'total_transactions': int,
+                'total_profits': float, 'updated_at': 'datetime64[ns]'})
+
+
+def load_hourly_totals_from_database(conn: pymysql.connections.Connection,
+                                     updated_since: datetime = None) -> pd.DataFrame:
+    """
+    Returns the number and value of the transactions for each hour, truck and payment
+    method from the AGG_Truck_Hourly rollup, only including the totals updated since
+    the given time when one is given
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("""SELECT event_hour, truck_id, payment_method_id AS type,
+                       total_transactions, total_profits, updated_at FROM AGG_Truck_Hourly
+                       WHERE updated_at >= %s""", (updated_since or EARLIEST_UPDATE,))
+        totals_from_db = pd.DataFrame(cursor.fetchall(), columns=HOURLY_TOTAL_KEYS + [
+            'total_transactions', 'total_profits', 'updated_at'])
+    return add_payment_method_names(conn, totals_from_db)
 
 
-def get_connection() -> pymysql.connections.Connection:
-    """Returns a connection object that connects to the remote database"""
-    return pymysql.connections.Connection(host=environ.get('DB_HOST'),
-                                          user=environ.get('DB_USER'),
-                                          password=environ.get('DB_PASSWORD'),
-                                          database=environ.get('DB_NAME'),
-                                          cursorclass=pymysql.cursors.DictCursor)
+@st.cache_resource
+def get_analytics_store() -> duckdb.DuckDBPyConnection:
+    """Returns the local analytics store shared by every Streamlit rerun and session"""
+    return open_analytics_store(environ.get('ANALYTICS_STORE_PATH', 'analytics.duckdb'))
 
 
-def load_transaction_data_from_database(conn: pymysql.connections.Connection) \
-        -> pd.DataFrame:
-    """Returns a dataframe containing the data within the cloud database"""
-    with conn.cursor() as cursor:
-        cursor.execute("""SELECT event_at, payment_method, total_price, truck_id FROM
-                       FACT_Transaction AS t
-                       JOIN DIM_Payment_Method AS pm ON 
-                       pm.payment_method_id = t.payment_method_id""")
-        transaction_data_from_db = pd.DataFrame(cursor.fetchall())
-        transaction_data_from_db.columns = [
-            'timestamp',  'type',  'total',  'truck_id']
-    return transaction_data_from_db
+def load_hourly_totals_from_analytics_store(conn: pymysql.connections.Connection,
+                                            snapshot_path: str,
+                                            updated_since: datetime = None) -> pd.DataFrame:
+    """
+    Returns the hourly totals updated since the given time from the local analytics store,
+    first importing the snapshots the pipeline has exported since the last refresh.
+    The database is only used when the payment method names are not cached
+    """
+    analytics_store = get_analytics_store()
+    import_new_snapshots(analytics_store, snapshot_path)
+    return add_payment_method_names(conn, load_hourly_totals_from_store(
+        analytics_store, updated_since or EARLIEST_UPDATE))
 
 
-def draw_title(title: str):
-    """Draws a title on the dashboard"""
-    return st.title(title)
+def load_hourly_totals(conn: pymysql.connections.Connection,
+                       updated_since: datetime = None) -> pd.DataFrame:
+    """
+    Returns the hourly totals updated since the given time from the local analytics store
+    when ANALYTICS_SNAPSHOT_PATH is set, otherwise from the database
+    """
+    snapshot_path = environ.get('ANALYTICS_SNAPSHOT_PATH')
+    if snapshot_path:
+        return load_hourly_totals_from_analytics_store(conn, snapshot_path, updated_since)
+    return load_hourly_totals_from_database(conn, updated_since)
 
 
-def add_day_column_to_data(transaction_data: pd.DataFrame) -> pd.DataFrame:
-    """Returns the transaction data with an additional day column"""
-    transaction_data['day_of_transaction'] = transaction_data['timestamp'].map(
-        lambda row: str(row).split()[0][-2:])
-    return transaction_data
+@st.cache_resource
+def get_transaction_cache() -> dict:
+    """Returns the hourly transaction totals shared by every Streamlit rerun and session"""
+    return {'hourly_totals': None, 'last_updated_at': None, 'refreshed_at': None,
+            'rows_dropped': 0, 'lock': Lock()}
 
 
-def get_total_transactions_per_day(transaction_data: pd.DataFrame) -> pd.DataFrame:
-    """Returns a dataframe containing the total transactions made by each day"""
-    total_transactions = transaction_data.copy()
+def invalidate_transaction_cache(transaction_cache: dict) -> None:
+    """Empties the cached totals so the next refresh reloads every transaction"""
+    with transaction_cache['lock']:
+        transaction_cache.update({'hourly_totals': None, 'last_updated_at': None,
+                                  'refreshed_at': None, 'rows_dropped': 0})
+
+
+def get_megabytes_used(transaction_data: pd.DataFrame) -> float:
+    """Returns the memory used by the transaction data in megabytes"""
+    return transaction_data.memory_usage(deep=True).sum() / 1024 ** 2
 
-    total_transactions = add_day_column_to_data(total_transactions)
-    total_transactions = total_transactions.drop(
-        columns=['type', 'total', 'truck_id'])
-    return total_transactions.groupby(
-        ['day_of_transaction'], as_index=False)['timestamp'].count()
 
+def trim_transaction_data_to_budget(transaction_data: pd.DataFrame,
+                                    max_megabytes: float) -> pd.DataFrame:
+    """Returns the most recent transaction totals that fit within the memory budget"""
+    megabytes_used = get_megabytes_used(transaction_data)
+    if megabytes_used <= max_megabytes:
+        return transaction_data
+    rows_to_keep = int(len(transaction_data) * max_megabytes / megabytes_used)
+    return transaction_data.tail(rows_to_keep)
 
-def get_percentage_profits_per_day(transaction_data: pd.DataFrame) -> pd.DataFrame:
+
+def append_new_hourly_totals(cached_hourly_totals: pd.DataFrame | None,
+                             new_hourly_totals: pd.DataFrame) -> pd.DataFrame:
     """
-    Returns a dataframe containing the increase or decrease 
-    in average profits per day as a percentage
+    Returns the cached hourly totals with the newly fetched ones added, replacing
+    the hours that the pipeline has recomputed since the last refresh
     """
-    percentage_of_profits = transaction_data.copy()
-    percentage_of_profits = add_day_column_to_data(percentage_of_profits)
-
-    total_average = round(percentage_of_profits['total'].sum(
-    ) / percentage_of_profits['total'].count(), 2)
-
-    average_profit_by_day = round(percentage_of_profits.groupby(
-        ['day_of_transaction'], as_index=False)['total'].sum()['total'] /
-        percentage_of_profits.groupby(
-        ['day_of_transaction'], as_index=False)['total'].count()['total'], 2)
-
-    average_profit_for_day = pd.DataFrame({'day_of_transaction':
-                                           percentage_of_profits['day_of_transaction'].unique(
-                                           ),
-                                           'average_profit_by_day': average_profit_by_day
-                                           })
-    average_profit_for_day['percentage_profit_increase_per_day'] = \
-        average_profit_for_day['average_profit_by_day'].map(
-        lambda row: f'{round((row - total_average) * 100 / total_average, 1)} %')
+    if cached_hourly_totals is None:
+        return new_hourly_totals.sort_values(HOURLY_TOTAL_KEYS)
+    if new_hourly_totals.empty:
+        return cached_hourly_totals
+    return pd.concat([cached_hourly_totals, new_hourly_totals]).drop_duplicates(
+        HOURLY_TOTAL_KEYS, keep='last').sort_values(HOURLY_TOTAL_KEYS)
 
-    return average_profit_for_day
 
+def refresh_transaction_cache(transaction_cache: dict,
+                              conn: pymysql.connections.Connection) -> pd.DataFrame:
+    """
+    Returns the cached hourly totals, first fetching only the totals updated since the
+    last refresh when it is older than the refresh interval. Totals updated shortly before
+    the last one seen are fetched again in case their transaction committed later.
+    The oldest hours are dropped when the totals grow beyond the memory budget
+    """
+    with transaction_cache['lock']:
+        refreshed_at = transaction_cache['refreshed_at']
+        if refreshed_at is not None and monotonic() - refreshed_at < DASHBOARD_REFRESH_SECONDS:
+            return transaction_cache['hourly_totals']
+
+        last_updated_at = transaction_cache['last_updated_at']
+        new_hourly_totals = load_hourly_totals(
+            conn, last_updated_at - UPDATE_OVERLAP if last_updated_at else None)
+        hourly_totals = append_new_hourly_totals(transaction_cache['hourly_totals'],
+                                                 new_hourly_totals)
+        trimmed_hourly_totals = trim_transaction_data_to_budget(
+            hourly_totals, DASHBOARD_CACHE_MAX_MEGABYTES)
+
+        if not new_hourly_totals.empty:
+            transaction_cache['last_updated_at'] = new_hourly_totals['updated_at'].max(
+            ).to_pydatetime()
+        transaction_cache['rows_dropped'] += len(hourly_totals) - len(trimmed_hourly_totals)
+        transaction_cache['hourly_totals'] = trimmed_hourly_totals
+        transaction_cache['refreshed_at'] = monotonic()
+        return trimmed_hourly_totals
+
+
+def draw_cache_controls(transaction_cache: dict) -> None:
+    """
+    Draws a button in the sidebar to reload every transaction and the truck and payment
+    method names, and notes how much is cached
+    """
+    if st.sidebar.button('Reload all data'):
+        invalidate_transaction_cache(transaction_cache)
+        clear_dimension_cache()
+    hourly_totals = transaction_cache['hourly_totals']
+    if hourly_totals is not None:
+        st.sidebar.caption(f'{len(hourly_totals)} hourly totals cached '
+                           f'({get_megabytes_used(hourly_totals):.1f} MB), '
+                           f'refreshed every {DASHBOARD_REFRESH_SECONDS}s')
+    if transaction_cache['rows_dropped']:
+        st.sidebar.warning(f'The oldest {transaction_cache["rows_dropped"]} hourly totals were '
+                           f'dropped to stay within {DASHBOARD_CACHE_MAX_MEGABYTES} MB')
 
-def extract_hour_and_day_from_timestamp(timestamp: str) -> str:
-    """Returns a string containing the hour and date extracted from a timestamp"""
-    time_of_day = ['am', 'pm']
-    hour = f'{str(timestamp).split()[1][:2]} {time_of_day[0]}'
 
-    if int(hour[:2]) > 11:
-        hour = f'{str(timestamp).split()[1][:2]} {time_of_day[1]}'
+def draw_title(title: str):
+    """Draws a title on the dashboard"""
+    return st.title(title)
 
-    return f'{hour}, {str(timestamp).split()[0]}'
 
+def add_day_column_to_data(hourly_totals: pd.DataFrame) -> pd.DataFrame:
+    """Returns the hourly totals with an additional column for the day they fall on"""
+    return hourly_totals.assign(day_of_transaction=hourly_totals['event_hour'].dt.floor('D'))
 
-def get_total_profits_overtime_by_truck(transaction_data: pd.DataFrame) -> pd.DataFrame:
-    """Returns a dataframe containing the total profits made by each truck over time"""
-    total_profits = transaction_data.copy()
 
-    total_profits['day_and_hour_of_transaction'] = total_profits['timestamp'].map(
-        lambda row: extract_hour_and_day_from_timestamp(row))
-    total_profits.drop(columns=['type'])
+def get_total_transactions_per_day(hourly_totals: pd.DataFrame) -> pd.DataFrame:
+    """Returns a dataframe containing the total transactions made by each day"""
+    total_transactions = add_day_column_to_data(hourly_totals).groupby(
+        ['day_of_transaction'], as_index=False)['total_transactions'].sum()
+    return total_transactions.rename(columns={'total_transactions': 'timestamp'})
 
-    return total_profits.groupby(
-        ['truck_id', 'day_and_hour_of_transaction'], as_index=False)['total'].sum()
 
+def get_percentage_profits_per_day(hourly_totals: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns a dataframe containing the increase or decrease 
+    in average profits per day as a percentage
+    """
+    total_average = round(hourly_totals['total_profits'].sum() /
+                          hourly_totals['total_transactions'].sum(), 2)
+
+    average_profit_for_day = add_day_column_to_data(hourly_totals).groupby(
+        ['day_of_transaction'], as_index=False)[HOURLY_TOTAL_VALUES].sum()
+    average_profit_for_day['average_profit_by_day'] = round(
+        average_profit_for_day['total_profits'] /
+        average_profit_for_day['total_transactions'], 2)
+    average_profit_for_day['percentage_profit_increase_per_day'] = \
+        average_profit_for_day['average_profit_by_day'].map(
+        lambda row: f'{round((row - total_average) * 100 / total_average, 1)} %')
 
-def get_total_transactions_and_profits_by_truck(transaction_data: pd.DataFrame) -> pd.DataFrame:
-    """Returns a dataframe containing the total transactions and profits made by each truck"""
-    total_transactions_profits = transaction_data.copy()
+    return average_profit_for_day.drop(columns=HOURLY_TOTAL_VALUES)
 
-    total_transactions_profits.drop(columns=['type'])
 
-    total_transactions_profits = \
-        pd.DataFrame({'truck_id': total_transactions_profits['truck_id'].unique(),
-                      'total_transactions': total_transactions_profits.groupby(
-                          ['truck_id'], as_index=False)['timestamp'].count()['timestamp'],
-                      'total_profits': total_transactions_profits.groupby(
-                          ['truck_id'], as_index=False)['total'].sum()['total']})
-    return total_transactions_profits
+def get_total_profits_overtime_by_truck(hourly_totals: pd.DataFrame) -> pd.DataFrame:
+    """Returns a dataframe containing the total profits made by each truck in each hour"""
+    total_profits = hourly_totals.assign(
+        day_and_hour_of_transaction=hourly_totals['event_hour'].dt.floor('h'))
 
+    return total_profits.groupby(
+        ['truck_id', 'day_and_hour_of_transaction'], as_index=False)['total_profits'].sum(
+    ).rename(columns={'total_profits': 'total'})
 
-def get_truck_table(conn: pymysql.connections.Connection):
-    """
-    Returns the truck table as a dictionary with key: truck_id
-    and value: fsa_rating
-    """
-    with conn.cursor() as cursor:
-        cursor.execute("""SELECT truck_id, fsa_rating FROM
-                       DIM_Truck;""")
-        truck = cursor.fetchall()
 
-    truck_table = {}
-    for method in truck:
-        truck_table[method['truck_id']
-                    ] = method['fsa_rating']
-    return truck_table
+def get_total_transactions_and_profits_by_truck(hourly_totals: pd.DataFrame) -> pd.DataFrame:
+    """Returns a dataframe containing the total transactions and profits made by each truck"""
+    return hourly_totals.groupby(['truck_id'], as_index=False)[HOURLY_TOTAL_VALUES].sum()
 
 
 def replace_truck_id_in_column(
@@ -146,14 +234,14 @@ def replace_truck_id_in_column(
 
 
 def get_total_transactions_by_fsa_rating(conn: pymysql.connections.Connection,
-                                         transaction_data: pd.DataFrame) -> pd.DataFrame:
+                                         hourly_totals: pd.DataFrame) -> pd.DataFrame:
     """Returns a dataframe containing the count of transactions by fsa rating"""
-    truck_table = get_truck_table(conn)
-    fsa_rating_transactions = transaction_data.copy()
-    fsa_rating_transactions['fsa_rating'] = fsa_rating_transactions['truck_id'].map(
-        lambda row: replace_truck_id_in_column(row, truck_table))
-    fsa_rating_transactions.drop(columns=['type'])
-    return fsa_rating_transactions.groupby(['fsa_rating'], as_index=False)['timestamp'].count()
+    truck_table = get_truck_column(conn, 'fsa_rating')
+    fsa_rating_transactions = hourly_totals.assign(
+        fsa_rating=hourly_totals['truck_id'].map(
+            lambda row: replace_truck_id_in_column(row, truck_table)))
+    return fsa_rating_transactions.groupby(['fsa_rating'], as_index=False)[
+        'total_transactions'].sum().rename(columns={'total_transactions': 'timestamp'})
 
 
 def containerise_dashboard() -> tuple:
@@ -186,10 +274,10 @@ def draw_kpis(transaction_data: pd.DataFrame, profit_data: pd.DataFrame,
     """
     selected_day_t = st.multiselect(
         "Filter Transactions by day", transaction_data['day_of_transaction'],
-        key='transaction'
+        format_func=lambda day: day.strftime('%Y-%m-%d'), key='transaction'
     )
     if not selected_day_t:
-        selected_day_t = ['13']
+        selected_day_t = [transaction_data['day_of_transaction'].max()]
     value_at_day = transaction_data[transaction_data['day_of_transaction']
                                     == selected_day_t[0]]['timestamp']
 
@@ -250,30 +338,23 @@ def draw_dashboard(total_transaction_by_day: pd.DataFrame,
 
 def main():
     """Runs the Streamlit Financial Dashboard"""
-    conn = get_connection()
-    try:
-        transaction_data = load_transaction_data_from_database(conn)
-    except ValueError as err:
-        print(err)
-    finally:
-        conn.close()
-
-    total_transaction_by_day = get_total_transactions_per_day(transaction_data)
+    transaction_cache = get_transaction_cache()
+    draw_cache_controls(transaction_cache)
+    with pooled_connection() as conn:
+        try:
+            hourly_totals = refresh_transaction_cache(transaction_cache, conn)
+            fsa_rating_transactions = get_total_transactions_by_fsa_rating(
+                conn, hourly_totals)
+        except ValueError as err:
+            print(err)
+
+    total_transaction_by_day = get_total_transactions_per_day(hourly_totals)
     percentage_profits_per_day = get_percentage_profits_per_day(
-        transaction_data)
+        hourly_totals)
     total_profits_by_time = get_total_profits_overtime_by_truck(
-        transaction_data)
+        hourly_totals)
     total_transactions_profits_by_truck = get_total_transactions_and_profits_by_truck(
-        transaction_data)
-
-    conn = get_connection()
-    try:
-        fsa_rating_transactions = get_total_transactions_by_fsa_rating(
-            conn, transaction_data)
-    except ValueError as err:
-        print(err)
-    finally:
-        conn.close()
+        hourly_totals)
 
     draw_dashboard(total_transaction_by_day, percentage_profits_per_day,
                    total_transactions_profits_by_truck, fsa_rating_transactions,
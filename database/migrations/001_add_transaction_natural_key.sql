@@ -0,0 +1,26 @@
+-- Adds the natural key to an existing FACT_Transaction table.
+-- Rows that are already duplicated are numbered rather than deleted,
+-- since a duplicate may be a repeat purchase rather than a re-load.
+-- total_price becomes a DECIMAL first, as a FLOAT in a unique key only matches
+-- a re-loaded price if it rounds to exactly the same binary value.
+
+USE tul_abuelhia;
+
+ALTER TABLE FACT_Transaction
+    MODIFY total_price DECIMAL(10, 2) NOT NULL,
+    ADD COLUMN transaction_sequence SMALLINT NOT NULL DEFAULT 0;
+
+UPDATE FACT_Transaction AS t
+JOIN (
+    SELECT transaction_id,
+           ROW_NUMBER() OVER (
+               PARTITION BY truck_id, event_at, total_price, payment_method_id
+               ORDER BY transaction_id) - 1 AS transaction_sequence
+    FROM FACT_Transaction
+) AS numbered ON numbered.transaction_id = t.transaction_id
+SET t.transaction_sequence = numbered.transaction_sequence
+WHERE numbered.transaction_sequence > 0;
+
+ALTER TABLE FACT_Transaction
+    ADD CONSTRAINT unique_transaction_natural_key
+        UNIQUE (truck_id, event_at, total_price, payment_method_id, transaction_sequence);
@@ -0,0 +1,23 @@
+-- Adds the AGG_Truck_Hourly rollup and fills it from the transactions already loaded.
+
+USE tul_abuelhia;
+
+CREATE TABLE AGG_Truck_Hourly (
+    event_hour DATETIME NOT NULL,
+    truck_id SMALLINT NOT NULL,
+    payment_method_id SMALLINT NOT NULL,
+    total_transactions INT NOT NULL,
+    total_profits DECIMAL(14, 2) NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW() ON UPDATE NOW(),
+    PRIMARY KEY (event_hour, truck_id, payment_method_id),
+    INDEX index_updated_at (updated_at),
+    FOREIGN KEY (truck_id) REFERENCES DIM_Truck(truck_id),
+    FOREIGN KEY (payment_method_id) REFERENCES DIM_Payment_Method(payment_method_id)
+);
+
+INSERT INTO AGG_Truck_Hourly
+    (event_hour, truck_id, payment_method_id, total_transactions, total_profits)
+SELECT DATE_FORMAT(event_at, '%Y-%m-%d %H:00:00') AS event_hour, truck_id,
+    payment_method_id, COUNT(*), SUM(total_price)
+FROM FACT_Transaction
+GROUP BY event_hour, truck_id, payment_method_id;
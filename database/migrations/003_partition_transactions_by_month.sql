@@ -0,0 +1,64 @@
+-- Adds a covering index on event_at and partitions FACT_Transaction by month.
+-- The foreign keys are dropped and the primary key gains event_at, since MySQL
+-- requires both of these on a partitioned table. Rebuilding the table can take
+-- a while on a large database, so run it outside of the pipeline's schedule.
+
+USE tul_abuelhia;
+
+-- The foreign keys were named by MySQL when schema.sql created them, so their names
+-- are looked up rather than assumed. Does nothing if they have already been dropped.
+SET @drop_foreign_keys = (
+    SELECT COALESCE(CONCAT('ALTER TABLE FACT_Transaction ', GROUP_CONCAT(
+               CONCAT('DROP FOREIGN KEY `', CONSTRAINT_NAME, '`') SEPARATOR ', ')), 'DO 0')
+    FROM information_schema.REFERENTIAL_CONSTRAINTS
+    WHERE CONSTRAINT_SCHEMA = DATABASE() AND TABLE_NAME = 'FACT_Transaction');
+PREPARE drop_foreign_keys FROM @drop_foreign_keys;
+EXECUTE drop_foreign_keys;
+DEALLOCATE PREPARE drop_foreign_keys;
+
+ALTER TABLE FACT_Transaction
+    MODIFY event_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    DROP PRIMARY KEY,
+    ADD PRIMARY KEY (transaction_id, event_at),
+    ADD INDEX index_event_at_totals (event_at, truck_id, payment_method_id, total_price);
+
+ALTER TABLE FACT_Transaction
+PARTITION BY RANGE (UNIX_TIMESTAMP(event_at)) (
+    PARTITION p2025_01 VALUES LESS THAN (UNIX_TIMESTAMP('2025-02-01 00:00:00')),
+    PARTITION p2025_02 VALUES LESS THAN (UNIX_TIMESTAMP('2025-03-01 00:00:00')),
+    PARTITION p2025_03 VALUES LESS THAN (UNIX_TIMESTAMP('2025-04-01 00:00:00')),
+    PARTITION p2025_04 VALUES LESS THAN (UNIX_TIMESTAMP('2025-05-01 00:00:00')),
+    PARTITION p2025_05 VALUES LESS THAN (UNIX_TIMESTAMP('2025-06-01 00:00:00')),
+    PARTITION p2025_06 VALUES LESS THAN (UNIX_TIMESTAMP('2025-07-01 00:00:00')),
+    PARTITION p2025_07 VALUES LESS THAN (UNIX_TIMESTAMP('2025-08-01 00:00:00')),
+    PARTITION p2025_08 VALUES LESS THAN (UNIX_TIMESTAMP('2025-09-01 00:00:00')),
+    PARTITION p2025_09 VALUES LESS THAN (UNIX_TIMESTAMP('2025-10-01 00:00:00')),
+    PARTITION p2025_10 VALUES LESS THAN (UNIX_TIMESTAMP('2025-11-01 00:00:00')),
+    PARTITION p2025_11 VALUES LESS THAN (UNIX_TIMESTAMP('2025-12-01 00:00:00')),
+    PARTITION p2025_12 VALUES LESS THAN (UNIX_TIMESTAMP('2026-01-01 00:00:00')),
+    PARTITION p2026_01 VALUES LESS THAN (UNIX_TIMESTAMP('2026-02-01 00:00:00')),
+    PARTITION p2026_02 VALUES LESS THAN (UNIX_TIMESTAMP('2026-03-01 00:00:00')),
+    PARTITION p2026_03 VALUES LESS THAN (UNIX_TIMESTAMP('2026-04-01 00:00:00')),
+    PARTITION p2026_04 VALUES LESS THAN (UNIX_TIMESTAMP('2026-05-01 00:00:00')),
+    PARTITION p2026_05 VALUES LESS THAN (UNIX_TIMESTAMP('2026-06-01 00:00:00')),
+    PARTITION p2026_06 VALUES LESS THAN (UNIX_TIMESTAMP('2026-07-01 00:00:00')),
+    PARTITION p2026_07 VALUES LESS THAN (UNIX_TIMESTAMP('2026-08-01 00:00:00')),
+    PARTITION p2026_08 VALUES LESS THAN (UNIX_TIMESTAMP('2026-09-01 00:00:00')),
+    PARTITION p2026_09 VALUES LESS THAN (UNIX_TIMESTAMP('2026-10-01 00:00:00')),
+    PARTITION p2026_10 VALUES LESS THAN (UNIX_TIMESTAMP('2026-11-01 00:00:00')),
+    PARTITION p2026_11 VALUES LESS THAN (UNIX_TIMESTAMP('2026-12-01 00:00:00')),
+    PARTITION p2026_12 VALUES LESS THAN (UNIX_TIMESTAMP('2027-01-01 00:00:00')),
+    PARTITION p2027_01 VALUES LESS THAN (UNIX_TIMESTAMP('2027-02-01 00:00:00')),
+    PARTITION p2027_02 VALUES LESS THAN (UNIX_TIMESTAMP('2027-03-01 00:00:00')),
+    PARTITION p2027_03 VALUES LESS THAN (UNIX_TIMESTAMP('2027-04-01 00:00:00')),
+    PARTITION p2027_04 VALUES LESS THAN (UNIX_TIMESTAMP('2027-05-01 00:00:00')),
+    PARTITION p2027_05 VALUES LESS THAN (UNIX_TIMESTAMP('2027-06-01 00:00:00')),
+    PARTITION p2027_06 VALUES LESS THAN (UNIX_TIMESTAMP('2027-07-01 00:00:00')),
+    PARTITION p2027_07 VALUES LESS THAN (UNIX_TIMESTAMP('2027-08-01 00:00:00')),
+    PARTITION p2027_08 VALUES LESS THAN (UNIX_TIMESTAMP('2027-09-01 00:00:00')),
+    PARTITION p2027_09 VALUES LESS THAN (UNIX_TIMESTAMP('2027-10-01 00:00:00')),
+    PARTITION p2027_10 VALUES LESS THAN (UNIX_TIMESTAMP('2027-11-01 00:00:00')),
+    PARTITION p2027_11 VALUES LESS THAN (UNIX_TIMESTAMP('2027-12-01 00:00:00')),
+    PARTITION p2027_12 VALUES LESS THAN (UNIX_TIMESTAMP('2028-01-01 00:00:00')),
+    PARTITION p_future VALUES LESS THAN MAXVALUE
+);
@@ -2,6 +2,7 @@
 
 USE tul_abuelhia;
 
+DROP TABLE IF EXISTS AGG_Truck_Hourly;
 DROP TABLE IF EXISTS FACT_Transaction;
 DROP TABLE IF EXISTS DIM_Payment_Method;
 DROP TABLE IF EXISTS DIM_Truck;
@@ -20,15 +21,84 @@ CREATE TABLE DIM_Truck (
     
 );
 
+-- Partitioned by month on event_at so time-window queries only read the months they cover.
+-- MySQL does not allow foreign keys on a partitioned table, so the pipeline resolves
+-- truck and payment method ids through the dimension cache instead, and every unique
+-- key includes event_at. New months are split from p_future with e.g:
+-- ALTER TABLE FACT_Transaction REORGANIZE PARTITION p_future INTO (
+--     PARTITION p2028_01 VALUES LESS THAN (UNIX_TIMESTAMP('2028-02-01 00:00:00')),
+--     PARTITION p_future VALUES LESS THAN MAXVALUE);
 CREATE TABLE FACT_Transaction (
-    transaction_id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    transaction_id BIGINT NOT NULL AUTO_INCREMENT,
     truck_id SMALLINT NOT NULL,
     payment_method_id SMALLINT NOT NULL,
-    total_price FLOAT NOT NULL,
-    event_at TIMESTAMP DEFAULT NOW(),
+    total_price DECIMAL(10, 2) NOT NULL,
+    event_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    transaction_sequence SMALLINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (transaction_id, event_at),
+    CONSTRAINT check_total_price_not_zero CHECK (total_price > 0.0),
+    -- Identical transactions in the same truck file are numbered by transaction_sequence,
+    -- so re-loading a file skips every row it has already inserted.
+    -- total_price is a DECIMAL so the same price always compares equal in the key.
+    -- It also serves queries on a truck over a time window
+    CONSTRAINT unique_transaction_natural_key
+        UNIQUE (truck_id, event_at, total_price, payment_method_id, transaction_sequence),
+    -- Covers the hourly totals over a time window without reading the rows
+    INDEX index_event_at_totals (event_at, truck_id, payment_method_id, total_price)
+)
+PARTITION BY RANGE (UNIX_TIMESTAMP(event_at)) (
+    PARTITION p2025_01 VALUES LESS THAN (UNIX_TIMESTAMP('2025-02-01 00:00:00')),
+    PARTITION p2025_02 VALUES LESS THAN (UNIX_TIMESTAMP('2025-03-01 00:00:00')),
+    PARTITION p2025_03 VALUES LESS THAN (UNIX_TIMESTAMP('2025-04-01 00:00:00')),
+    PARTITION p2025_04 VALUES LESS THAN (UNIX_TIMESTAMP('2025-05-01 00:00:00')),
+    PARTITION p2025_05 VALUES LESS THAN (UNIX_TIMESTAMP('2025-06-01 00:00:00')),
+    PARTITION p2025_06 VALUES LESS THAN (UNIX_TIMESTAMP('2025-07-01 00:00:00')),
+    PARTITION p2025_07 VALUES LESS THAN (UNIX_TIMESTAMP('2025-08-01 00:00:00')),
+    PARTITION p2025_08 VALUES LESS THAN (UNIX_TIMESTAMP('2025-09-01 00:00:00')),
+    PARTITION p2025_09 VALUES LESS THAN (UNIX_TIMESTAMP('2025-10-01 00:00:00')),
+    PARTITION p2025_10 VALUES LESS THAN (UNIX_TIMESTAMP('2025-11-01 00:00:00')),
+    PARTITION p2025_11 VALUES LESS THAN (UNIX_TIMESTAMP('2025-12-01 00:00:00')),
+    PARTITION p2025_12 VALUES LESS THAN (UNIX_TIMESTAMP('2026-01-01 00:00:00')),
+    PARTITION p2026_01 VALUES LESS THAN (UNIX_TIMESTAMP('2026-02-01 00:00:00')),
+    PARTITION p2026_02 VALUES LESS THAN (UNIX_TIMESTAMP('2026-03-01 00:00:00')),
+    PARTITION p2026_03 VALUES LESS THAN (UNIX_TIMESTAMP('2026-04-01 00:00:00')),
+    PARTITION p2026_04 VALUES LESS THAN (UNIX_TIMESTAMP('2026-05-01 00:00:00')),
+    PARTITION p2026_05 VALUES LESS THAN (UNIX_TIMESTAMP('2026-06-01 00:00:00')),
+    PARTITION p2026_06 VALUES LESS THAN (UNIX_TIMESTAMP('2026-07-01 00:00:00')),
+    PARTITION p2026_07 VALUES LESS THAN (UNIX_TIMESTAMP('2026-08-01 00:00:00')),
+    PARTITION p2026_08 VALUES LESS THAN (UNIX_TIMESTAMP('2026-09-01 00:00:00')),
+    PARTITION p2026_09 VALUES LESS THAN (UNIX_TIMESTAMP('2026-10-01 00:00:00')),
+    PARTITION p2026_10 VALUES LESS THAN (UNIX_TIMESTAMP('2026-11-01 00:00:00')),
+    PARTITION p2026_11 VALUES LESS THAN (UNIX_TIMESTAMP('2026-12-01 00:00:00')),
+    PARTITION p2026_12 VALUES LESS THAN (UNIX_TIMESTAMP('2027-01-01 00:00:00')),
+    PARTITION p2027_01 VALUES LESS THAN (UNIX_TIMESTAMP('2027-02-01 00:00:00')),
+    PARTITION p2027_02 VALUES LESS THAN (UNIX_TIMESTAMP('2027-03-01 00:00:00')),
+    PARTITION p2027_03 VALUES LESS THAN (UNIX_TIMESTAMP('2027-04-01 00:00:00')),
+    PARTITION p2027_04 VALUES LESS THAN (UNIX_TIMESTAMP('2027-05-01 00:00:00')),
+    PARTITION p2027_05 VALUES LESS THAN (UNIX_TIMESTAMP('2027-06-01 00:00:00')),
+    PARTITION p2027_06 VALUES LESS THAN (UNIX_TIMESTAMP('2027-07-01 00:00:00')),
+    PARTITION p2027_07 VALUES LESS THAN (UNIX_TIMESTAMP('2027-08-01 00:00:00')),
+    PARTITION p2027_08 VALUES LESS THAN (UNIX_TIMESTAMP('2027-09-01 00:00:00')),
+    PARTITION p2027_09 VALUES LESS THAN (UNIX_TIMESTAMP('2027-10-01 00:00:00')),
+    PARTITION p2027_10 VALUES LESS THAN (UNIX_TIMESTAMP('2027-11-01 00:00:00')),
+    PARTITION p2027_11 VALUES LESS THAN (UNIX_TIMESTAMP('2027-12-01 00:00:00')),
+    PARTITION p2027_12 VALUES LESS THAN (UNIX_TIMESTAMP('2028-01-01 00:00:00')),
+    PARTITION p_future VALUES LESS THAN MAXVALUE
+);
+
+-- Totals of FACT_Transaction per hour, truck and payment method, recomputed by the
+-- pipeline for every hour it loads so the dashboard and report do not scan the fact table
+CREATE TABLE AGG_Truck_Hourly (
+    event_hour DATETIME NOT NULL,
+    truck_id SMALLINT NOT NULL,
+    payment_method_id SMALLINT NOT NULL,
+    total_transactions INT NOT NULL,
+    total_profits DECIMAL(14, 2) NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW() ON UPDATE NOW(),
+    PRIMARY KEY (event_hour, truck_id, payment_method_id),
+    INDEX index_updated_at (updated_at),
     FOREIGN KEY (truck_id) REFERENCES DIM_Truck(truck_id),
-    FOREIGN KEY (payment_method_id) REFERENCES DIM_Payment_Method(payment_method_id),
-    CONSTRAINT check_total_price_not_zero CHECK (total_price > 0.0)
+    FOREIGN KEY (payment_method_id) REFERENCES DIM_Payment_Method(payment_method_id)
 );
 
 INSERT INTO DIM_Truck (truck_name, truck_description, has_card_reader, fsa_rating) VALUES
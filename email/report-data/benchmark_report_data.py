@@ -0,0 +1,137 @@
+"""
+Module that checks and times the single groupby key metrics in report_data.py against
+the previous versions, which ran a groupby per column and stitched the results together
+"""
+import sys
+from time import perf_counter
+import numpy as np
+import pandas as pd
+from report_data import get_total_transaction_value_all_trucks, \
+    get_total_transaction_value_by_truck, get_transactions_by_time_of_day
+
+DAYS_TO_BENCHMARK = 30
+TRANSACTIONS_PER_DAY = 40_000
+TRUCK_NAMES = ['Burrito Madness', 'Kings of Kebabs', 'Cupcakes by Michelle',
+               'Hartmann\'s Jellied Eels', 'Yoghurt Heaven', 'SuperSmoothie']
+TRUCK_FSA_RATINGS = [4, 2, 5, 4, 4, 3]
+OPENING_HOURS = [12, 15, 18, 21]
+TIMES_TO_REPEAT = 5
+
+
+def create_month_of_transactions(days: int, transactions_per_day: int) -> pd.DataFrame:
+    """Returns random transactions shaped like the report data, one row per transaction"""
+    rng = np.random.default_rng(0)
+    number_of_rows = days * transactions_per_day
+    truck_index = rng.integers(0, len(TRUCK_NAMES), number_of_rows)
+    event_hour = pd.Timestamp('2025-03-01') + \
+        pd.to_timedelta(rng.integers(0, days, number_of_rows), unit='D') + \
+        pd.to_timedelta(rng.choice(OPENING_HOURS, number_of_rows), unit='h')
+    return pd.DataFrame({
+        'truck_name': np.array(TRUCK_NAMES)[truck_index],
+        'payment_method': rng.choice(['cash', 'card'], number_of_rows),
+        'total_transactions': np.ones(number_of_rows, dtype=int),
+        'total_profits': rng.integers(100, 5000, number_of_rows) / 100,
+        'event_hour': event_hour,
+        'has_card_reader': rng.integers(0, 2, number_of_rows),
+        'fsa_rating': np.array(TRUCK_FSA_RATINGS)[truck_index]}).sort_values(
+            'event_hour', ignore_index=True)
+
+
+def get_total_transaction_value_all_trucks_by_stitching(truck_data: pd.DataFrame) -> pd.DataFrame:
+    """Returns the total transactions and profits made in the day, as previously calculated"""
+    total_transaction_value = truck_data.copy()
+
+    total_transaction_value.drop(
+        columns=['has_card_reader', 'payment_method', 'event_hour', 'fsa_rating'])
+
+    return pd.DataFrame({'total_transactions':
+                         float(total_transaction_value['total_transactions'].sum()),
+                         'total_profits':
+                         float(total_transaction_value['total_profits'].sum())},
+                        index=['all_trucks'])
+
+
+def get_total_transaction_value_by_truck_by_stitching(truck_data: pd.DataFrame) -> pd.DataFrame:
+    """Returns the totals made by each truck, as previously calculated"""
+    total_transactions_by_truck = truck_data.copy()
+
+    total_transactions_by_truck.drop(
+        columns=['has_card_reader', 'payment_method', 'event_hour'])
+
+    total_transactions_by_truck = pd.DataFrame({
+        'truck_name': total_transactions_by_truck.groupby(
+            ['truck_name', 'fsa_rating'], as_index=False)['total_transactions'].sum()[
+                'truck_name'],
+        'total_transactions': total_transactions_by_truck.groupby(
+            ['truck_name', 'fsa_rating'], as_index=False)['total_transactions'].sum()[
+                'total_transactions'],
+        'total_profits': total_transactions_by_truck.groupby(
+            ['truck_name', 'fsa_rating'], as_index=False)['total_profits'].sum()[
+                'total_profits']})
+    return total_transactions_by_truck.sort_values(
+        by=['total_transactions', 'total_profits'], ascending=False)
+
+
+def get_transactions_by_time_of_day_by_stitching(truck_data: pd.DataFrame) -> pd.DataFrame:
+    """Returns the totals at each hour of the day, as previously calculated"""
+    transactions_by_time_of_day = truck_data.copy()
+
+    transactions_by_time_of_day['hour_of_event'] = \
+        transactions_by_time_of_day['event_hour'].dt.hour.astype('int8')
+
+    transactions_by_time_of_day.drop(
+        columns=['has_card_reader', 'payment_method', 'event_hour', 'fsa_rating', 'truck_name'])
+
+    transactions_by_time_of_day = pd.DataFrame({
+        'hour_of_purchase': transactions_by_time_of_day['hour_of_event'].unique(),
+        'total_transactions': transactions_by_time_of_day.groupby(
+            ['hour_of_event'], as_index=False)['total_transactions'].sum()[
+                'total_transactions'],
+        'total_profits': transactions_by_time_of_day.groupby(
+            ['hour_of_event'], as_index=False)['total_profits'].sum()['total_profits']})
+    return transactions_by_time_of_day.sort_values(by=['hour_of_purchase'])
+
+
+def time_key_metric(key_metric, truck_data: pd.DataFrame) -> tuple[pd.DataFrame, float]:
+    """Returns the result of a key metric and the fastest of several runs in seconds"""
+    fastest_seconds = float('inf')
+    for _ in range(TIMES_TO_REPEAT):
+        start_time = perf_counter()
+        result = key_metric(truck_data)
+        fastest_seconds = min(fastest_seconds, perf_counter() - start_time)
+    return result, fastest_seconds
+
+
+def is_key_metric_matching(stitched: pd.DataFrame, single_pass: pd.DataFrame) -> bool:
+    """Returns True if both versions of a key metric give the same rows in the same order"""
+    return stitched.reset_index(drop=True).equals(single_pass.reset_index(drop=True))
+
+
+def main():
+    """Checks the single groupby key metrics match the previous versions and times both"""
+    truck_data = create_month_of_transactions(DAYS_TO_BENCHMARK, TRANSACTIONS_PER_DAY)
+    print(f'Timing key metrics on {len(truck_data)} transactions over {DAYS_TO_BENCHMARK} days')
+
+    all_match = True
+    for name, stitched_metric, single_pass_metric in [
+            ('all trucks', get_total_transaction_value_all_trucks_by_stitching,
+             get_total_transaction_value_all_trucks),
+            ('by truck', get_total_transaction_value_by_truck_by_stitching,
+             get_total_transaction_value_by_truck),
+            ('by time of day', get_transactions_by_time_of_day_by_stitching,
+             get_transactions_by_time_of_day)]:
+        stitched, stitched_seconds = time_key_metric(stitched_metric, truck_data)
+        single_pass, single_pass_seconds = time_key_metric(single_pass_metric, truck_data)
+        matches = is_key_metric_matching(stitched, single_pass)
+        all_match = all_match and matches
+        print(f'{name}: previous {stitched_seconds * 1000:.1f}ms, single groupby '
+              f'{single_pass_seconds * 1000:.1f}ms '
+              f'({stitched_seconds / single_pass_seconds:.1f}x faster), '
+              f'{"matches" if matches else "DOES NOT MATCH"}')
+
+    if not all_match:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
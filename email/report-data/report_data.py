@@ -1,113 +1,71 @@
 
 """Module that test loads a couple of rows of the cleaned data to the MySQL database"""
-from os import environ
 from json import dump
 from datetime import datetime, timedelta
-import pymysql.cursors
 import pymysql
 import pandas as pd
 from dotenv import load_dotenv
+from dimension_cache import get_payment_method_names, get_truck_column
+from database_connection import pooled_connection
 
 DATE_NOW = (datetime.now().date() - timedelta(days=1)).strftime('%Y-%m-%d')
 DATA_TAG_VALUES = [('<th>', '</th>'), ('<td>', '</td>')]
-
-
-def get_connection() -> pymysql.connections.Connection:
-    """Returns a connection object that connects to remote MySQL database"""
-    return pymysql.connections.Connection(host=environ.get('DB_HOST'),
-                                          user=environ.get('DB_USER'),
-                                          password=environ.get('DB_PASSWORD'),
-                                          database=environ.get('DB_NAME'),
-                                          cursorclass=pymysql.cursors.DictCursor)
+TOTAL_COLUMNS = ['total_transactions', 'total_profits']
 
 
 def get_previous_day_data_from_database(conn: pymysql.connections.Connection) -> pd.DataFrame:
-    """Returns all the transaction data from the previous day from the database as a Dataframe"""
+    """
+    Returns the hourly transaction totals of each truck and payment method from the
+    previous day onwards, read from the AGG_Truck_Hourly rollup, as a Dataframe
+    """
     with conn.cursor() as cursor:
 
-        sql_query = """SELECT transaction_id, truck_name, payment_method, total_price, event_at,
-        has_card_reader, fsa_rating
-        FROM FACT_Transaction AS t
-        JOIN DIM_Payment_Method AS pm ON pm.payment_method_id = t.payment_method_id 
-        JOIN DIM_Truck AS d_t ON d_t.truck_id = t.truck_id
-        WHERE event_at > STR_TO_DATE(CURDATE()-1, '%Y%m%d')
-        ORDER BY event_at;"""
+        sql_query = """SELECT event_hour, truck_id, payment_method_id,
+        total_transactions, total_profits
+        FROM AGG_Truck_Hourly
+        WHERE event_hour >= CURDATE() - INTERVAL 1 DAY
+        ORDER BY event_hour;"""
 
         cursor.execute(sql_query)
-        previous_day_data = pd.DataFrame(cursor.fetchall())
-        previous_day_data.columns = ['transaction_id', 'truck_name', 'payment_method',
-                                     'total_price', 'event_at',
-                                     'has_card_reader', 'fsa_rating']
-        return previous_day_data
+        previous_day_data = pd.DataFrame(cursor.fetchall(), columns=[
+            'event_hour', 'truck_id', 'payment_method_id', 'total_transactions',
+            'total_profits'])
+    return add_dimension_columns_to_data(conn, previous_day_data)
+
+
+def add_dimension_columns_to_data(conn: pymysql.connections.Connection,
+                                  truck_data: pd.DataFrame) -> pd.DataFrame:
+    """Returns the hourly totals with the truck and payment method ids resolved from the cache"""
+    truck_ids = truck_data['truck_id']
+    return pd.DataFrame({
+        'truck_name': truck_ids.map(get_truck_column(conn, 'truck_name')),
+        'payment_method': truck_data['payment_method_id'].map(get_payment_method_names(conn)),
+        'total_transactions': truck_data['total_transactions'].astype(int),
+        'total_profits': truck_data['total_profits'].astype(float),
+        'event_hour': pd.to_datetime(truck_data['event_hour']),
+        'has_card_reader': truck_ids.map(get_truck_column(conn, 'has_card_reader')),
+        'fsa_rating': truck_ids.map(get_truck_column(conn, 'fsa_rating'))})
 
 
 def get_total_transaction_value_all_trucks(truck_data: pd.DataFrame) -> pd.DataFrame:
     """Returns the total transactions and profits made in the day"""
-    total_transaction_value = truck_data.copy()
-
-    total_transaction_value.drop(
-        columns=['has_card_reader', 'payment_method', 'event_at', 'fsa_rating', 'transaction_id'])
-
-    total_transaction_value = \
-        pd.DataFrame({'total_transactions':
-                      float(total_transaction_value['total_price'].count()),
-                      'total_profits':
-                      float(total_transaction_value['total_price'].sum())}, index=['all_trucks'])
-    return total_transaction_value
+    return truck_data[TOTAL_COLUMNS].sum().astype(float).to_frame('all_trucks').T
 
 
 def get_total_transaction_value_by_truck(truck_data: pd.DataFrame) -> pd.DataFrame:
     """Returns the total transactions and profits made in the day by each truck"""
-    total_transactions_by_truck = truck_data.copy()
-
-    total_transactions_by_truck.drop(
-        columns=['has_card_reader', 'payment_method', 'event_at'])
-
-    total_transactions_by_truck = \
-        pd.DataFrame({'truck_name': total_transactions_by_truck['truck_name'].unique(),
-                      'total_transactions':
-                      total_transactions_by_truck.groupby(
-            ['truck_name', 'fsa_rating'], as_index=False)['event_at'].count()['event_at'],
-            'total_profits': total_transactions_by_truck.groupby(
-                ['truck_name', 'fsa_rating'],
-            as_index=False)['total_price'].sum()['total_price']})
-    total_transactions_by_truck = total_transactions_by_truck.sort_values(
-        by=['total_transactions', 'total_profits'], ascending=False)
-    return total_transactions_by_truck
-
-
-def extract_hour_from_timestamp(timestamp: str) -> str:
-    """Returns a string containing the hour and date extracted from a timestamp"""
-    time_of_day = ['am', 'pm']
-    hour = f'{str(timestamp).split()[1][:2]} {time_of_day[0]}'
-
-    if int(hour[:2]) > 11:
-        hour = f'{str(timestamp).split()[1][:2]} {time_of_day[1]}'
-
-    return f'{hour}'
+    return truck_data.groupby(['truck_name', 'fsa_rating'], as_index=False).agg(
+        total_transactions=('total_transactions', 'sum'),
+        total_profits=('total_profits', 'sum')).drop(columns='fsa_rating').sort_values(
+            by=['total_transactions', 'total_profits'], ascending=False)
 
 
 def get_transactions_by_time_of_day(truck_data: pd.DataFrame) -> pd.DataFrame:
     """Returns the total transactions and profits at each hour of the day"""
-    transactions_by_time_of_day = truck_data.copy()
-
-    transactions_by_time_of_day['hour_of_event'] = transactions_by_time_of_day['event_at'].map(
-        lambda row: extract_hour_from_timestamp(row))
-
-    transactions_by_time_of_day.drop(
-        columns=['has_card_reader', 'payment_method', 'event_at', 'fsa_rating', 'truck_name',
-                 'transaction_id'])
-
-    transactions_by_time_of_day = \
-        pd.DataFrame({'hour_of_purchase': transactions_by_time_of_day['hour_of_event'].unique(),
-                      'total_transactions':
-                      transactions_by_time_of_day.groupby(
-                          ['hour_of_event'], as_index=False)['total_price'].count()['total_price'],
-                      'total_profits': transactions_by_time_of_day.groupby(
-                          ['hour_of_event'], as_index=False)['total_price'].sum()['total_price']})
-    transactions_by_time_of_day = transactions_by_time_of_day.sort_values(
-        by=['hour_of_purchase'])
-    return transactions_by_time_of_day
+    return truck_data.groupby(
+        truck_data['event_hour'].dt.hour.astype('int8').rename('hour_of_purchase')).agg(
+            total_transactions=('total_transactions', 'sum'),
+            total_profits=('total_profits', 'sum')).reset_index()
 
 
 def convert_key_metrics_to_dict(key_metrics: list[pd.DataFrame]) -> list[dict]:
@@ -188,9 +146,8 @@ def handler(event=None, context=None) -> dict:
     Returns:
         Dict containing html data as a string
     """
-    conn = get_connection()
-    transaction_data = get_previous_day_data_from_database(conn)
-    conn.close()
+    with pooled_connection() as conn:
+        transaction_data = get_previous_day_data_from_database(conn)
 
     total_transactions_and_profits = get_total_transaction_value_all_trucks(
         transaction_data)
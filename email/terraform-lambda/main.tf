@@ -88,6 +88,7 @@ resource "aws_lambda_function" "c16-ta-email-report-lambda" {
             DB_USER = var.DB_USER,
             DB_PASSWORD = var.DB_PASSWORD,
             DB_PORT = var.DB_PORT,
+            DIMENSION_SNAPSHOT_PATH = "/tmp/dimension_snapshot.json",
             aws_access_key_id = var.aws_access_key_id,
             aws_secret_access_key = var.aws_secret_access_key
         }
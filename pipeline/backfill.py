@@ -0,0 +1,70 @@
+"""Module for enumerating and checkpointing the date/hour partitions of a historical backfill"""
+from json import load, dump
+from pathlib import Path
+from datetime import date, datetime, timedelta, time
+from extract import VALID_TIMES
+
+BACKFILL_CHECKPOINT_PATH = './data-files/backfill_checkpoint.json'
+PARTITION_DATE_FORMAT = '%Y-%-m/%-d'
+MAX_BACKFILL_PARTITIONS = 4
+
+
+def parse_backfill_bound(text: str) -> date | datetime:
+    """
+    Returns a --from or --to bound as a date when given as a plain date e.g: 2025-03-25,
+    otherwise as a datetime, so a date can cover the whole day and midnight does not
+    """
+    bound = datetime.fromisoformat(text)
+    if len(text) <= len('YYYY-MM-DD'):
+        return bound.date()
+    return bound
+
+
+def get_partitions_between(start: date | datetime,
+                           end: date | datetime) -> list[tuple[str, int]]:
+    """
+    Returns every (date, hour) partition between start and end inclusive,
+    using the same date format as the S3 keys and ./data-files e.g: ('2025-3/25', 15).
+    An end given as a plain date includes every hour of that day
+    """
+    if not isinstance(start, datetime):
+        start = datetime.combine(start, time.min)
+    if not isinstance(end, datetime):
+        end = datetime.combine(end, time.max)
+
+    partitions = []
+    day = start.date()
+    while day <= end.date():
+        for hour in VALID_TIMES:
+            partition_time = datetime.combine(day, time(hour))
+            if start <= partition_time <= end:
+                partitions.append((day.strftime(PARTITION_DATE_FORMAT), hour))
+        day += timedelta(days=1)
+    return partitions
+
+
+def get_partition_name(partition: tuple[str, int]) -> str:
+    """Returns the partition as it appears in the checkpoint e.g: '2025-3/25/15'"""
+    return f'{partition[0]}/{partition[1]}'
+
+
+def load_backfill_checkpoint(checkpoint_path: str) -> set[str]:
+    """Returns the names of the partitions that a previous backfill completed"""
+    if not Path(checkpoint_path).is_file():
+        return set()
+    with open(checkpoint_path, 'r', encoding='utf-8') as f:
+        return set(load(f))
+
+
+def write_backfill_checkpoint(completed_partitions: set[str], checkpoint_path: str) -> None:
+    """Writes the names of the completed partitions to disk"""
+    Path(checkpoint_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(checkpoint_path, 'w', encoding='utf-8') as f:
+        dump(sorted(completed_partitions), f, indent=4)
+
+
+def filter_completed_partitions(partitions: list[tuple[str, int]],
+                                completed_partitions: set[str]) -> list[tuple[str, int]]:
+    """Returns the partitions that are not yet recorded in the checkpoint"""
+    return [partition for partition in partitions
+            if get_partition_name(partition) not in completed_partitions]
@@ -0,0 +1,69 @@
+"""Module that times cleaning many days of truck files with and without worker processes"""
+import sys
+import logging
+from glob import glob
+from os import cpu_count
+from time import perf_counter
+import pandas as pd
+from transform import get_list_of_data_files, filter_files_to_clean
+from pipeline import transform_files_from_bucket, VALID_FILE_PATTERN_TRANSFORM
+
+PATH_TO_DATA_FILES = './data-files'
+DAYS_TO_SIMULATE = 30
+WORKERS = max(cpu_count() or 1, 2)
+
+
+def get_hour_partitions(path_to_data_files: str) -> list[str]:
+    """Returns every date/hour directory in the data-files directory"""
+    return sorted(glob(f'{path_to_data_files}/*/*/*/'))
+
+
+def simulate_backfill_partitions(partitions: list[str], days_to_simulate: int) -> list[str]:
+    """Returns the hour partitions repeated until they cover the number of days to simulate"""
+    days_available = len({partition.rstrip('/').rsplit('/', 1)[0] for partition in partitions})
+    repeats = -(-days_to_simulate // days_available)
+    return partitions * repeats
+
+
+def get_truck_files_in_partition(partition: str) -> list[str]:
+    """Returns the sorted truck filenames within an hour partition"""
+    return sorted(filter_files_to_clean(get_list_of_data_files(partition),
+                                        VALID_FILE_PATTERN_TRANSFORM))
+
+
+def run_backfill(partitions: list[str], logger: logging.Logger,
+                 workers: int = 1) -> tuple[pd.DataFrame, float]:
+    """
+    Returns the cleaned truck data for every partition and the seconds it took,
+    cleaning one partition at a time as pipeline.py --from does, so the extreme values
+    of each partition are corrected against the prices in that partition only
+    """
+    start_time = perf_counter()
+    cleaned_truck_data = []
+    for partition in partitions:
+        cleaned_truck_data.append(transform_files_from_bucket(
+            get_truck_files_in_partition(partition), partition.rstrip('/'), logger, workers))
+    return pd.concat(cleaned_truck_data).reset_index(drop=True), perf_counter() - start_time
+
+
+def main():
+    """Checks the serial and parallel transforms agree and times both over a backfill"""
+    logger = logging.getLogger(__name__)
+    partitions = simulate_backfill_partitions(
+        get_hour_partitions(PATH_TO_DATA_FILES), DAYS_TO_SIMULATE)
+
+    serial_data, serial_seconds = run_backfill(partitions, logger)
+    parallel_data, parallel_seconds = run_backfill(partitions, logger, WORKERS)
+    if not serial_data.equals(parallel_data):
+        print('Cleaning in worker processes does not match cleaning serially!')
+        sys.exit(1)
+
+    print(f'Backfill of {len(partitions)} hour partitions ({len(serial_data)} rows) on '
+          f'{cpu_count()} CPUs: serial {serial_seconds:.2f}s, {WORKERS} workers '
+          f'{parallel_seconds:.2f}s ({serial_seconds / parallel_seconds:.1f}x the speed)')
+    print(f'Per partition: {serial_seconds / len(partitions) * 1000:.1f}ms cleaning serially, '
+          f'{(parallel_seconds - serial_seconds) / len(partitions) * 1000:.1f}ms more '
+          f'with a pool of workers')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Module that times loading a million cleaned rows with executemany and with LOAD DATA LOCAL INFILE.
+Only runs against a local MySQL/MariaDB database created from database/schema.sql, e.g:
+docker run -d -p 3306:3306 -e MYSQL_ROOT_PASSWORD=root -e MYSQL_DATABASE=tul_abuelhia \
+    mysql:8 --local-infile=1
+mysql -h 127.0.0.1 -u root -proot < ../database/schema.sql
+"""
+import sys
+import logging
+from os import environ
+from time import perf_counter
+from dotenv import load_dotenv
+import pymysql
+from database_connection import pooled_connection
+from benchmark_transform import load_all_truck_data, clean_all_truck_data, scale_truck_data, \
+    PATH_TO_DATA_FILES
+from pipeline import load_cleaned_truck_data, load_cleaned_truck_data_from_file, BATCH_SIZE
+
+ROWS_TO_LOAD = 1_000_000
+LOCAL_DATABASE_HOSTS = {'localhost', '127.0.0.1', '::1'}
+
+
+def get_max_transaction_id(conn: pymysql.connections.Connection) -> int:
+    """Returns the largest transaction id in FACT_Transaction, or zero when it is empty"""
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT COALESCE(MAX(transaction_id), 0) AS max_id FROM FACT_Transaction;')
+        return cursor.fetchone()['max_id']
+
+
+def delete_transactions_after(conn: pymysql.connections.Connection, transaction_id: int) -> None:
+    """Deletes the rows the benchmark inserted after the given transaction id"""
+    with conn.cursor() as cursor:
+        cursor.execute('DELETE FROM FACT_Transaction WHERE transaction_id > %s;',
+                       (transaction_id,))
+    conn.commit()
+
+
+def time_load(conn: pymysql.connections.Connection, load_engine: callable) -> float:
+    """Returns the seconds a load engine took, removing the rows it inserted afterwards"""
+    max_transaction_id = get_max_transaction_id(conn)
+    start_time = perf_counter()
+    try:
+        load_engine()
+        return perf_counter() - start_time
+    finally:
+        delete_transactions_after(conn, max_transaction_id)
+
+
+def main():
+    """Times both load engines on the same million rows against a local database"""
+    load_dotenv()
+    if environ.get('DB_HOST') not in LOCAL_DATABASE_HOSTS:
+        print(f'DB_HOST must be one of {sorted(LOCAL_DATABASE_HOSTS)} to run this benchmark.')
+        sys.exit(1)
+
+    logger = logging.getLogger(__name__)
+    truck_data = scale_truck_data(
+        clean_all_truck_data(load_all_truck_data(PATH_TO_DATA_FILES)), ROWS_TO_LOAD)
+    with pooled_connection(local_infile=True) as conn:
+        executemany_seconds = time_load(conn, lambda: load_cleaned_truck_data(
+            conn, truck_data, ROWS_TO_LOAD, BATCH_SIZE, logger))
+        load_data_seconds = time_load(conn, lambda: load_cleaned_truck_data_from_file(
+            conn, truck_data, ROWS_TO_LOAD, logger))
+
+    print(f'Loading {len(truck_data)} rows: executemany {executemany_seconds:.2f}s '
+          f'({len(truck_data) / executemany_seconds:.0f} rows/s), LOAD DATA '
+          f'{load_data_seconds:.2f}s ({len(truck_data) / load_data_seconds:.0f} rows/s)')
+
+
+if __name__ == "__main__":
+    main()
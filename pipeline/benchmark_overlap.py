@@ -0,0 +1,107 @@
+"""
+Module that times streaming, cleaning and loading a day of truck files one stage after
+another and as the overlapping stages of `pipeline.py -o`, with simulated S3 and load latency
+"""
+import sys
+import logging
+from functools import partial
+from glob import glob
+from io import BytesIO
+from time import perf_counter, sleep
+from types import SimpleNamespace
+import pandas as pd
+from extract import stream_truck_data_file, stream_truck_data_files_concurrently, \
+    MAX_DOWNLOAD_WORKERS
+from overlap import run_overlapped_stages
+from pipeline import transform_streamed_file, transform_streamed_files, \
+    create_overlapped_load_state, load_overlapped_batch, load_held_back_extreme_rows, \
+    BATCH_SIZE, OVERLAP_QUEUE_SIZE
+
+PATH_TO_DATA_FILES = './data-files'
+DAYS_TO_SIMULATE = 8
+S3_LATENCY_SECONDS = 0.1
+LOAD_SECONDS_PER_BATCH = 0.05
+LOAD_SECONDS_PER_ROW = 0.000_05
+
+
+def get_simulated_truck_files(path_to_data_files: str, days_to_simulate: int) -> list[str]:
+    """Returns every truck file in the data-files directory, repeated for the days to simulate"""
+    return sorted(glob(f'{path_to_data_files}/*/*/*/T3_T*.csv')) * days_to_simulate
+
+
+def get_local_object(Key: str, **_) -> dict:  # pylint: disable=invalid-name
+    """Returns a local truck file like a boto3 get_object response, after the S3 latency"""
+    sleep(S3_LATENCY_SECONDS)
+    with open(Key, 'rb') as truck_file:
+        return {'Body': BytesIO(truck_file.read())}
+
+
+def simulate_load(loaded_data: list[pd.DataFrame], cleaned_truck_data: pd.DataFrame) -> None:
+    """Keeps a batch of cleaned data after the time a database would take to load it"""
+    sleep(LOAD_SECONDS_PER_BATCH + LOAD_SECONDS_PER_ROW * len(cleaned_truck_data))
+    loaded_data.append(cleaned_truck_data)
+
+
+def run_sequential_stages(truck_files: list[str],
+                          logger: logging.Logger) -> tuple[pd.DataFrame, float]:
+    """
+    Returns the data loaded by streaming every file, then cleaning them all,
+    then loading them in batches, and how long it took
+    """
+    start_time = perf_counter()
+    stream_results = stream_truck_data_files_concurrently(
+        SimpleNamespace(get_object=get_local_object), truck_files, 'local', MAX_DOWNLOAD_WORKERS)
+    cleaned_truck_data = transform_streamed_files(stream_results, logger)
+    loaded_data = []
+    for batch_start in range(0, len(cleaned_truck_data), BATCH_SIZE):
+        simulate_load(loaded_data, cleaned_truck_data.iloc[batch_start:batch_start + BATCH_SIZE])
+    return pd.concat(loaded_data), perf_counter() - start_time
+
+
+def run_overlapping_stages(truck_files: list[str]) -> tuple[pd.DataFrame, float]:
+    """
+    Returns the data loaded by cleaning each file as soon as it is streamed
+    and loading whole files in batches while the rest are streaming, and how long it took
+    """
+    start_time = perf_counter()
+    loaded_data = []
+    load_rows = partial(simulate_load, loaded_data)
+    load_state = create_overlapped_load_state(len(truck_files) * BATCH_SIZE)
+    run_overlapped_stages(truck_files,
+                          partial(stream_truck_data_file,
+                                  SimpleNamespace(get_object=get_local_object),
+                                  bucket_name='local'),
+                          transform_streamed_file,
+                          partial(load_overlapped_batch, load_rows, load_state),
+                          {'extract_workers': MAX_DOWNLOAD_WORKERS, 'transform_workers': 1,
+                           'queue_size': OVERLAP_QUEUE_SIZE, 'batch_rows': BATCH_SIZE})
+    load_held_back_extreme_rows(load_rows, load_state)
+    return pd.concat(loaded_data), perf_counter() - start_time
+
+
+def is_loaded_data_matching(sequential_data: pd.DataFrame, overlapped_data: pd.DataFrame) -> bool:
+    """Returns True if both runs loaded the same rows, whatever order they arrived in"""
+    columns = list(sequential_data.columns)
+    return sequential_data.sort_values(columns, ignore_index=True).equals(
+        overlapped_data[columns].sort_values(columns, ignore_index=True))
+
+
+def main():
+    """Checks both runs load the same rows and compares how long each took"""
+    logger = logging.getLogger(__name__)
+    truck_files = get_simulated_truck_files(PATH_TO_DATA_FILES, DAYS_TO_SIMULATE)
+
+    sequential_data, sequential_seconds = run_sequential_stages(truck_files, logger)
+    overlapped_data, overlapped_seconds = run_overlapping_stages(truck_files)
+    if not is_loaded_data_matching(sequential_data, overlapped_data):
+        print('The overlapped stages did not load the same rows as the sequential stages!')
+        sys.exit(1)
+
+    print(f'{len(truck_files)} files ({len(sequential_data)} rows) with {S3_LATENCY_SECONDS}s '
+          f'S3 latency: sequential {sequential_seconds:.2f}s, '
+          f'overlapped {overlapped_seconds:.2f}s '
+          f'({sequential_seconds / overlapped_seconds:.1f}x faster)')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Module that times the time-window queries on FACT_Transaction laid out as before and after
+database/migrations/003_partition_transactions_by_month.sql, on a generated table of
+several million rows. Only runs against a local MySQL database created from database/schema.sql
+and started with --local-infile=1, as in the commands at the top of benchmark_load.py
+"""
+import sys
+from os import environ, remove
+from datetime import datetime, timedelta
+from tempfile import NamedTemporaryFile
+from time import perf_counter
+import numpy as np
+import pandas as pd
+import pymysql
+from dotenv import load_dotenv
+from database_connection import pooled_connection
+from benchmark_load import LOCAL_DATABASE_HOSTS
+
+ROWS_TO_GENERATE = 5_000_000
+DAYS_TO_GENERATE = 365
+LAST_GENERATED_DAY = datetime(2025, 12, 31)
+NUMBER_OF_TRUCKS = 6
+TIMES_TO_REPEAT = 3
+BEFORE_TABLE = 'FACT_Transaction_Before_Partitioning'
+AFTER_TABLE = 'FACT_Transaction_After_Partitioning'
+CREATE_TABLE_QUERIES = [
+    f'CREATE TABLE {AFTER_TABLE} LIKE FACT_Transaction;',
+    f'CREATE TABLE {BEFORE_TABLE} LIKE FACT_Transaction;',
+    f'ALTER TABLE {BEFORE_TABLE} REMOVE PARTITIONING;',
+    f"""ALTER TABLE {BEFORE_TABLE} DROP INDEX index_event_at_totals,
+        DROP PRIMARY KEY, ADD PRIMARY KEY (transaction_id);"""
+]
+BENCHMARK_QUERIES = {
+    'report: previous day by truck': ("""SELECT truck_id, payment_method_id,
+        COUNT(*) AS total_transactions, SUM(total_price) AS total_profits FROM {table}
+        WHERE event_at >= %s AND event_at < %s GROUP BY truck_id, payment_method_id;""",
+                                      timedelta(days=1)),
+    'dashboard: hourly totals for a week': ("""SELECT
+        DATE_FORMAT(event_at, '%%Y-%%m-%%d %%H:00:00') AS event_hour, truck_id,
+        payment_method_id, COUNT(*) AS total_transactions, SUM(total_price) AS total_profits
+        FROM {table} WHERE event_at >= %s AND event_at < %s
+        GROUP BY event_hour, truck_id, payment_method_id;""", timedelta(days=7)),
+    'pipeline: one truck for an hour': ("""SELECT COUNT(*) AS total_transactions,
+        SUM(total_price) AS total_profits FROM {table}
+        WHERE truck_id = 1 AND event_at >= %s AND event_at < %s;""", timedelta(hours=1)),
+    'dashboard: daily totals for everything': ("""SELECT DATE(event_at) AS event_day,
+        COUNT(*) AS total_transactions, SUM(total_price) AS total_profits FROM {table}
+        WHERE event_at >= %s AND event_at < %s GROUP BY event_day;""",
+                                               timedelta(days=DAYS_TO_GENERATE + 1))
+}
+
+
+def generate_transaction_data(number_of_rows: int) -> pd.DataFrame:
+    """Returns random transactions spread over the generated days in the order of the TSV"""
+    rng = np.random.default_rng(0)
+    first_day = LAST_GENERATED_DAY - timedelta(days=DAYS_TO_GENERATE - 1)
+    return pd.DataFrame({
+        'event_at': pd.Timestamp(first_day) + pd.to_timedelta(
+            rng.integers(0, DAYS_TO_GENERATE * 24 * 3600, number_of_rows), unit='s'),
+        'payment_method_id': rng.integers(1, 3, number_of_rows),
+        'total_price': rng.integers(100, 5000, number_of_rows) / 100,
+        'truck_id': rng.integers(1, NUMBER_OF_TRUCKS + 1, number_of_rows),
+        'transaction_sequence': np.zeros(number_of_rows, dtype=np.int16)})
+
+
+def create_benchmark_tables(conn: pymysql.connections.Connection,
+                            transaction_data: pd.DataFrame) -> None:
+    """Creates a table laid out as before and after the migration, both holding the data"""
+    with NamedTemporaryFile(suffix='.tsv', delete=False) as temporary_file:
+        path_to_load = temporary_file.name
+    try:
+        transaction_data.to_csv(path_to_load, sep='\t', header=False, index=False)
+        with conn.cursor() as cursor:
+            for sql_query in CREATE_TABLE_QUERIES:
+                cursor.execute(sql_query)
+            cursor.execute(f"""LOAD DATA LOCAL INFILE %s IGNORE INTO TABLE {BEFORE_TABLE}
+                FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n'
+                (event_at, payment_method_id, total_price, truck_id, transaction_sequence);""",
+                           (path_to_load,))
+            cursor.execute(f'INSERT INTO {AFTER_TABLE} SELECT * FROM {BEFORE_TABLE};')
+            cursor.execute(f'ANALYZE TABLE {BEFORE_TABLE}, {AFTER_TABLE};')
+            cursor.fetchall()
+        conn.commit()
+    finally:
+        remove(path_to_load)
+
+
+def drop_benchmark_tables(conn: pymysql.connections.Connection) -> None:
+    """Drops the tables created for the benchmark"""
+    with conn.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {BEFORE_TABLE}, {AFTER_TABLE};')
+    conn.commit()
+
+
+def time_query(conn: pymysql.connections.Connection, sql_query: str,
+               parameters: tuple) -> float:
+    """Returns the fastest of several runs of a query in seconds"""
+    fastest_seconds = float('inf')
+    with conn.cursor() as cursor:
+        for _ in range(TIMES_TO_REPEAT):
+            start_time = perf_counter()
+            cursor.execute(sql_query, parameters)
+            cursor.fetchall()
+            fastest_seconds = min(fastest_seconds, perf_counter() - start_time)
+    return fastest_seconds
+
+
+def explain_query(conn: pymysql.connections.Connection, sql_query: str,
+                  parameters: tuple) -> str:
+    """Returns the partitions, index and estimated rows MySQL plans to read for a query"""
+    with conn.cursor() as cursor:
+        cursor.execute(f'EXPLAIN {sql_query}', parameters)
+        plan = cursor.fetchone()
+    partitions = plan.get('partitions')
+    partitions_read = f'{len(partitions.split(","))} partitions' if partitions \
+        else 'unpartitioned'
+    return f'{partitions_read}, index {plan["key"]}, ~{plan["rows"]} rows'
+
+
+def main():
+    """Times each query on the tables laid out before and after the migration"""
+    load_dotenv()
+    if environ.get('DB_HOST') not in LOCAL_DATABASE_HOSTS:
+        print(f'DB_HOST must be one of {sorted(LOCAL_DATABASE_HOSTS)} to run this benchmark.')
+        sys.exit(1)
+
+    window_end = LAST_GENERATED_DAY + timedelta(days=1)
+    with pooled_connection(local_infile=True) as conn:
+        try:
+            create_benchmark_tables(conn, generate_transaction_data(ROWS_TO_GENERATE))
+            print(f'Timing queries on {ROWS_TO_GENERATE} rows over {DAYS_TO_GENERATE} days')
+            for name, (sql_query, window) in BENCHMARK_QUERIES.items():
+                parameters = (window_end - window, window_end)
+                before_query = sql_query.format(table=BEFORE_TABLE)
+                after_query = sql_query.format(table=AFTER_TABLE)
+                before_seconds = time_query(conn, before_query, parameters)
+                after_seconds = time_query(conn, after_query, parameters)
+                print(f'{name}: before {before_seconds * 1000:.1f}ms '
+                      f'({explain_query(conn, before_query, parameters)}), '
+                      f'after {after_seconds * 1000:.1f}ms '
+                      f'({explain_query(conn, after_query, parameters)})')
+        finally:
+            drop_benchmark_tables(conn)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Module that compares the size and read time of the Parquet staging dataset
+with the CSV file transform.py used to write, on a million cleaned rows
+"""
+import sys
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+import pandas as pd
+from benchmark_transform import load_all_truck_data, clean_all_truck_data, scale_truck_data, \
+    PATH_TO_DATA_FILES, ROWS_TO_BENCHMARK
+from transform import write_to_csv_file, write_to_parquet_dataset, CSV_FILENAME, \
+    TRUCK_DATA_TYPES
+from load import load_transaction_data_from_file, load_transaction_data_from_staging, \
+    STAGING_COLUMNS
+
+TIMES_TO_REPEAT = 3
+
+
+def get_megabytes_on_disk(path: Path) -> float:
+    """Returns the size of a file, or of every file under a directory, in megabytes"""
+    paths = [path] if path.is_file() else [p for p in path.rglob('*') if p.is_file()]
+    return sum(p.stat().st_size for p in paths) / 1024 ** 2
+
+
+def time_read(read_transaction_data) -> tuple[pd.DataFrame, float]:
+    """Returns the data from a read and the fastest of several runs in seconds"""
+    fastest_seconds = float('inf')
+    for _ in range(TIMES_TO_REPEAT):
+        start_time = perf_counter()
+        truck_data = read_transaction_data()
+        fastest_seconds = min(fastest_seconds, perf_counter() - start_time)
+    return truck_data, fastest_seconds
+
+
+def is_staging_matching(truck_data: pd.DataFrame, staged_data: pd.DataFrame) -> bool:
+    """Returns True if the staged data holds the same typed rows as the cleaned data"""
+    return truck_data[STAGING_COLUMNS].sort_values(STAGING_COLUMNS, ignore_index=True).equals(
+        staged_data.sort_values(STAGING_COLUMNS, ignore_index=True))
+
+
+def main():
+    """Writes a million cleaned rows to both staging formats and compares their size and reads"""
+    truck_data = scale_truck_data(
+        clean_all_truck_data(load_all_truck_data(PATH_TO_DATA_FILES)), ROWS_TO_BENCHMARK)
+
+    with TemporaryDirectory() as staging_directory:
+        csv_path = Path(staging_directory) / CSV_FILENAME
+        parquet_path = Path(staging_directory) / 'staging'
+        write_to_csv_file(truck_data, csv_path)
+        write_to_parquet_dataset(truck_data, parquet_path)
+        first_day = truck_data['timestamp'].min()
+
+        reads = {
+            'CSV as strings': lambda: load_transaction_data_from_file(
+                CSV_FILENAME, f'{staging_directory}/'),
+            'CSV typed': lambda: pd.read_csv(csv_path, dtype=TRUCK_DATA_TYPES | {
+                'total': float, 'truck_id': 'int16'}, parse_dates=['timestamp'],
+                date_format='%Y-%m-%d %H:%M:%S'),
+            'Parquet': lambda: load_transaction_data_from_staging(parquet_path),
+            'Parquet, truck_id and total only': lambda: load_transaction_data_from_staging(
+                parquet_path, columns=['truck_id', 'total']),
+            'Parquet, one hour only': lambda: load_transaction_data_from_staging(
+                parquet_path, filters=[('event_date', '=', first_day.strftime('%Y-%m-%d')),
+                                       ('event_hour', '=', first_day.hour)])
+        }
+        timings = {name: time_read(read) for name, read in reads.items()}
+
+        print(f'Staging {len(truck_data)} rows: CSV {get_megabytes_on_disk(csv_path):.1f} MB, '
+              f'Parquet {get_megabytes_on_disk(parquet_path):.1f} MB')
+        for name, (staged_data, seconds) in timings.items():
+            print(f'{name}: {len(staged_data)} rows in {seconds * 1000:.1f}ms')
+
+    if not is_staging_matching(truck_data, timings['Parquet'][0]):
+        print('The Parquet staging dataset does not match the cleaned data!')
+        sys.exit(1)
+    print('The Parquet staging dataset matches the cleaned data')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Module that times the vectorised cleaning steps against the row by row versions,
+kept in reference_transform.py, whose parity is checked by test_transform.py
+"""
+import sys
+from glob import glob
+from time import perf_counter
+import pandas as pd
+from transform import load_truck_data_from_file, add_ids_to_column, \
+    combine_transaction_data_files, remove_invalid_rows_from_total_column, \
+    fix_extreme_values_that_have_a_normal_version, remove_timezone_from_timestamp, \
+    convert_column_data_types
+from reference_transform import remove_invalid_rows_from_total_column_by_row, \
+    fix_extreme_values_that_have_a_normal_version_by_row
+
+PATH_TO_DATA_FILES = './data-files'
+VALID_FILE_GLOB = 'T3_T*.csv'
+ROWS_TO_BENCHMARK = 1_000_000
+
+
+def load_all_truck_data(path_to_data_files: str, typed: bool = True) -> pd.DataFrame:
+    """Returns every raw truck file in the data-files directory combined into one dataframe"""
+    truck_data = []
+    for path in sorted(glob(f'{path_to_data_files}/**/{VALID_FILE_GLOB}', recursive=True)):
+        directory, filename = path.rsplit('/', 1)
+        truck_data.extend(add_ids_to_column(
+            load_truck_data_from_file([filename], directory, typed), [filename]))
+    return combine_transaction_data_files(truck_data)
+
+
+def clean_all_truck_data(truck_data: pd.DataFrame) -> pd.DataFrame:
+    """Returns the truck data after every cleaning step used by the pipeline"""
+    cleaned_data = remove_invalid_rows_from_total_column(truck_data.copy())
+    cleaned_data = remove_timezone_from_timestamp(cleaned_data)
+    cleaned_data = fix_extreme_values_that_have_a_normal_version(cleaned_data).dropna()
+    return convert_column_data_types(cleaned_data)
+
+
+def get_megabytes_per_million_rows(truck_data: pd.DataFrame) -> float:
+    """Returns the memory used by the dataframe scaled to a million rows"""
+    return truck_data.memory_usage(deep=True).sum() * 1_000_000 / len(truck_data) / 1024 ** 2
+
+
+def scale_truck_data(truck_data: pd.DataFrame, number_of_rows: int) -> pd.DataFrame:
+    """Returns the truck data repeated until it has the given number of rows"""
+    repeats = -(-number_of_rows // len(truck_data))
+    return pd.concat([truck_data] * repeats).head(number_of_rows).reset_index(drop=True)
+
+
+def time_cleaning_step(cleaning_step, truck_data: pd.DataFrame) -> tuple[pd.DataFrame, float]:
+    """Returns the result of a cleaning step on a copy of the data and the seconds it took"""
+    start_time = perf_counter()
+    cleaned_data = cleaning_step(truck_data.copy())
+    return cleaned_data, perf_counter() - start_time
+
+
+def summarise_extreme_value_fixes(truck_data: pd.DataFrame,
+                                  fixed_data: pd.DataFrame) -> str:
+    """Returns how many extreme values were corrected and how many were removed"""
+    is_extreme = pd.to_numeric(truck_data['total']) >= 50
+    fixed_totals = fixed_data.loc[is_extreme, 'total']
+    return f'{fixed_totals.notna().sum()} corrected, {fixed_totals.isna().sum()} removed'
+
+
+def main():
+    """Times the vectorised cleaning against the row by row versions"""
+    truck_data = load_all_truck_data(PATH_TO_DATA_FILES)
+    scaled_data = scale_truck_data(truck_data, ROWS_TO_BENCHMARK)
+    _, by_row_seconds = time_cleaning_step(
+        remove_invalid_rows_from_total_column_by_row, scaled_data)
+    _, vectorised_seconds = time_cleaning_step(
+        remove_invalid_rows_from_total_column, scaled_data)
+    print(f'Invalid row removal on {ROWS_TO_BENCHMARK} rows: by row {by_row_seconds:.2f}s, '
+          f'vectorised {vectorised_seconds:.2f}s '
+          f'({by_row_seconds / vectorised_seconds:.1f}x faster)')
+
+    valid_data = remove_invalid_rows_from_total_column(truck_data)
+    by_row_fixes = summarise_extreme_value_fixes(
+        valid_data, fix_extreme_values_that_have_a_normal_version_by_row(valid_data.copy()))
+    vectorised_fixes = summarise_extreme_value_fixes(
+        valid_data, fix_extreme_values_that_have_a_normal_version(valid_data.copy()))
+    print(f'Extreme values: by row {by_row_fixes}, vectorised {vectorised_fixes}')
+
+    scaled_valid_data = scale_truck_data(valid_data, ROWS_TO_BENCHMARK)
+    _, by_row_seconds = time_cleaning_step(
+        fix_extreme_values_that_have_a_normal_version_by_row, scaled_valid_data)
+    _, vectorised_seconds = time_cleaning_step(
+        fix_extreme_values_that_have_a_normal_version, scaled_valid_data)
+    print(f'Extreme value correction on {ROWS_TO_BENCHMARK} rows: by row {by_row_seconds:.2f}s, '
+          f'vectorised {vectorised_seconds:.2f}s '
+          f'({by_row_seconds / vectorised_seconds:.1f}x faster)')
+
+    untyped_data = load_all_truck_data(PATH_TO_DATA_FILES, typed=False)
+    if not clean_all_truck_data(untyped_data).equals(clean_all_truck_data(truck_data)):
+        print('Typed reader does not produce the same cleaned data as the untyped reader!')
+        sys.exit(1)
+    _, untyped_seconds = time_cleaning_step(
+        remove_timezone_from_timestamp, scale_truck_data(untyped_data, ROWS_TO_BENCHMARK))
+    _, typed_seconds = time_cleaning_step(remove_timezone_from_timestamp, scaled_data)
+    print(f'Timezone removal on {ROWS_TO_BENCHMARK} rows: untyped {untyped_seconds:.2f}s, '
+          f'typed {typed_seconds:.2f}s')
+    print(f'Memory per million raw rows: untyped '
+          f'{get_megabytes_per_million_rows(untyped_data):.1f}MB, typed '
+          f'{get_megabytes_per_million_rows(truck_data):.1f}MB')
+    print(f'Memory per million cleaned rows: '
+          f'{get_megabytes_per_million_rows(clean_all_truck_data(truck_data)):.1f}MB')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+"""Lets the tests import the modules in /shared, as PYTHONPATH=../shared does for the pipeline"""
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent / 'shared'))
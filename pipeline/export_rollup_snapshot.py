@@ -0,0 +1,48 @@
+"""
+Module that exports AGG_Truck_Hourly between two dates as a Parquet snapshot,
+to fill a new dashboard analytics store with the totals loaded before it existed
+"""
+from argparse import ArgumentParser
+from datetime import datetime, timedelta
+from os import environ
+from dotenv import load_dotenv
+from database_connection import pooled_connection
+from analytics_snapshot import write_hourly_totals_snapshot
+from load import get_hourly_rollup
+
+EARLIEST_HOUR = datetime(1970, 1, 1)
+
+
+def get_argument_parser() -> ArgumentParser:
+    """Returns a parser for arguments given in command line"""
+    parser = ArgumentParser(prog='Rollup Snapshot Export Script',
+                            description='Exports AGG_Truck_Hourly as a Parquet snapshot.')
+    parser.add_argument('--from', dest='from_date',
+                        help='the first date or datetime to export, defaults to everything',
+                        type=datetime.fromisoformat, default=EARLIEST_HOUR)
+    parser.add_argument('--to', dest='to_date',
+                        help='the date or datetime to export up to, defaults to now',
+                        type=datetime.fromisoformat,
+                        default=datetime.now() + timedelta(hours=1))
+    parser.add_argument('-p', '--path',
+                        help='the directory or s3:// prefix to export to, '
+                        'defaults to ANALYTICS_SNAPSHOT_PATH')
+    return parser
+
+
+def main():
+    """Exports the hourly totals in the range to the analytics snapshot directory"""
+    args = get_argument_parser().parse_args()
+    snapshot_path = args.path or environ.get('ANALYTICS_SNAPSHOT_PATH')
+    if not snapshot_path:
+        raise ValueError('Give a snapshot path with -p or set ANALYTICS_SNAPSHOT_PATH.')
+
+    with pooled_connection() as conn:
+        hourly_totals = get_hourly_rollup(conn, args.from_date, args.to_date)
+    snapshot_name = write_hourly_totals_snapshot(hourly_totals, snapshot_path)
+    print(f'Exported {len(hourly_totals)} hourly totals to {snapshot_path}/{snapshot_name}.')
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    main()
@@ -1,8 +1,16 @@
 """Module for downloading the relevant truck data from the S3 bucket"""
 from os import environ
+from os.path import getsize
+from json import load, dump
 import sys
+from time import perf_counter
 from pathlib import Path
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from io import BytesIO
+from threading import Lock
+from typing import Callable, Iterator
 from boto3 import client
 
 BUCKET_NAME = 'sigma-resources-truck'
@@ -11,6 +19,14 @@ VALID_DATE = datetime.now().date().strftime('%Y-%-m/%-d')
 VALID_TIME = datetime.now().hour
 VALID_TIMES = [12, 15, 18, 21]
 PATH_TO_DOWNLOAD = f'./data-files/{VALID_DATE}/{VALID_TIME}'
+MAX_DOWNLOAD_WORKERS = 8
+MANIFEST_PATH = './data-files/download_manifest.json'
+MANIFEST_LOCK = Lock()
+
+
+def get_partition_path(valid_date: str, valid_time: int) -> str:
+    """Returns the local directory that the truck files for a date and hour are downloaded to"""
+    return f'./data-files/{valid_date}/{valid_time}'
 
 
 def create_boto_client():
@@ -38,28 +54,114 @@ def identify_different_files_in_bucket(boto_client: client) -> list[str]:
     return bucket_names
 
 
-def get_objects_in_bucket(boto_client: client, bucket_name: str) -> list[str]:
-    """Returns a list of all the files present in a specific bucket"""
-    response = boto_client.list_objects_v2(
-        Bucket=bucket_name
-    )
-    filenames = []
-    for file in response['Contents']:
-        filenames.append(file['Key'])
-    return filenames
+def get_prefix_for_date(file_pattern: list[str], valid_date: str, valid_time: str) -> str:
+    """Returns the S3 key prefix that all truck files for a date and hour start with"""
+    return f'{file_pattern[0]}{valid_date}/{valid_time}/T3'
+
+
+def list_valid_objects_by_prefix(boto_client: client, bucket_name: str,
+                                 prefix: str, file_extension: str,
+                                 listing_stats: dict = None) -> Iterator[dict]:
+    """
+    Yields the key, ETag and size of the files under a key prefix one page
+    of results at a time, letting S3 do the filtering. If given, listing_stats
+    is updated with the number of pages and keys scanned
+    """
+    if listing_stats is None:
+        listing_stats = {}
+    listing_stats.update({'pages': 0, 'keys_scanned': 0, 'keys_matched': 0})
+
+    paginator = boto_client.get_paginator('list_objects_v2')
+    pages = paginator.paginate(Bucket=bucket_name, Prefix=prefix)
+    for page in pages:
+        listing_stats['pages'] += 1
+        for file in page.get('Contents', []):
+            listing_stats['keys_scanned'] += 1
+            if file['Key'].endswith(file_extension):
+                listing_stats['keys_matched'] += 1
+                yield {'key': file['Key'],
+                       'etag': file.get('ETag'),
+                       'size': file.get('Size')}
+
+
+def list_valid_filenames_by_prefix(boto_client: client, bucket_name: str,
+                                   prefix: str, file_extension: str,
+                                   listing_stats: dict = None) -> Iterator[str]:
+    """Yields the keys of the files under a key prefix one page of results at a time"""
+    for file in list_valid_objects_by_prefix(boto_client, bucket_name, prefix,
+                                             file_extension, listing_stats):
+        yield file['key']
+
+
+def summarise_listing_stats(listing_stats: dict) -> str:
+    """Returns a summary of the cost of listing the bucket"""
+    return f'Listed {listing_stats["keys_scanned"]} keys over {listing_stats["pages"]} pages, ' \
+        f'{listing_stats["keys_matched"]} matched.'
+
+
+def load_download_manifest(manifest_path: str) -> dict:
+    """Returns the manifest of previously downloaded files, keyed by S3 key"""
+    if not Path(manifest_path).is_file():
+        return {}
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return load(f)
+
+
+def write_download_manifest(manifest: dict, manifest_path: str) -> None:
+    """Writes the manifest of downloaded files to disk, replacing the old one in a single step"""
+    Path(manifest_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(f'{manifest_path}.tmp', 'w', encoding='utf-8') as f:
+        dump(manifest, f, indent=4, sort_keys=True)
+    Path(f'{manifest_path}.tmp').replace(manifest_path)
+
+
+def is_file_in_manifest(file: dict, manifest: dict, path: str) -> bool:
+    """
+    Returns True if the S3 object has already been downloaded to the path
+    with the same ETag and size, and the local copy is still intact
+    """
+    entry = manifest.get(file['key'])
+    if entry is None or entry['etag'] != file['etag'] or entry['size'] != file['size']:
+        return False
+
+    local_file = Path(f'{path}/{file["key"].split("/")[-1]}')
+    return local_file.is_file() and local_file.stat().st_size == file['size']
+
 
+def filter_files_not_in_manifest(files: list[dict], manifest: dict,
+                                 path: str) -> tuple[list[dict], list[dict]]:
+    """Splits the S3 objects into those that need downloading and those already on disk"""
+    files_to_download = []
+    cached_files = []
+    for file in files:
+        if is_file_in_manifest(file, manifest, path):
+            cached_files.append(file)
+        else:
+            files_to_download.append(file)
+    return files_to_download, cached_files
 
-def filter_valid_filenames_by_date(filenames: list[str],
-                                   file_pattern: list[str],
-                                   valid_date: str,
-                                   valid_time: str) -> list[str]:
-    """Filters out the relevant files based on naming convention used"""
-    valid_filenames = []
-    for file in filenames:
-        if file.startswith(f'{file_pattern[0]}{valid_date}/{valid_time}/T3') \
-                and file.endswith(file_pattern[1]):
-            valid_filenames.append(file)
-    return valid_filenames
+
+def update_download_manifest(manifest: dict, downloaded_files: list[dict]) -> dict:
+    """Returns the manifest with the ETag and size of newly downloaded files recorded"""
+    for file in downloaded_files:
+        manifest[file['key']] = {'etag': file['etag'], 'size': file['size']}
+    return manifest
+
+
+def record_downloads_in_manifest(downloaded_files: list[dict], manifest_path: str) -> None:
+    """
+    Adds newly downloaded files to the manifest on disk. The manifest is re-read under a
+    lock so that partitions extracted at the same time don't overwrite each other's entries
+    """
+    with MANIFEST_LOCK:
+        manifest = load_download_manifest(manifest_path)
+        write_download_manifest(update_download_manifest(manifest, downloaded_files),
+                                manifest_path)
+
+
+def summarise_cache_results(files_to_download: list[dict], cached_files: list[dict]) -> str:
+    """Returns a summary of how many files were skipped because they were already on disk"""
+    return f'Manifest cache: {len(cached_files)} hits, {len(files_to_download)} misses.'
 
 
 def create_directory_for_files(path: str):
@@ -67,14 +169,85 @@ def create_directory_for_files(path: str):
     Path(path).mkdir(parents=True, exist_ok=True)
 
 
-def download_truck_data_files(boto_client: client, files_to_download: list[str],
-                              bucket_name: str, path: str) -> str:
-    """Downloads relevant files from S3 to a data/ folder."""
-    for file in files_to_download:
-        filename = file.split('/')[-1]
-        boto_client.download_file(
-            bucket_name, file, f'{path}/{filename}')
-    return 'Successfully downloaded files.'
+def download_truck_data_file(boto_client: client, file: str,
+                             bucket_name: str, path: str) -> dict:
+    """Downloads a single file from S3 and returns its timing and size"""
+    filename = file.split('/')[-1]
+    start_time = perf_counter()
+    boto_client.download_file(bucket_name, file, f'{path}/{filename}')
+    return {'key': file,
+            'bytes': getsize(f'{path}/{filename}'),
+            'seconds': round(perf_counter() - start_time, 3)}
+
+
+def stream_truck_data_file(boto_client: client, file: str, bucket_name: str) -> dict:
+    """Reads a single file from S3 into an in-memory buffer and returns it with its timing"""
+    start_time = perf_counter()
+    body = boto_client.get_object(Bucket=bucket_name, Key=file)['Body'].read()
+    return {'key': file,
+            'bytes': len(body),
+            'seconds': round(perf_counter() - start_time, 3),
+            'buffer': BytesIO(body)}
+
+
+def run_file_tasks_concurrently(file_task: Callable[[str], dict], files: list[str],
+                                max_workers: int = MAX_DOWNLOAD_WORKERS) -> list[dict]:
+    """
+    Runs a task for each file using a bounded pool of threads and returns
+    the results ordered by key.
+    Every task is allowed to finish before the first failure is raised
+    """
+    if max_workers < 1:
+        raise ValueError('Invalid number of workers: value must be at least one.')
+
+    task_results = []
+    first_error = None
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(file_task, file) for file in files]
+        for future in as_completed(futures):
+            try:
+                task_results.append(future.result())
+            except Exception as err:  # pylint: disable=broad-exception-caught
+                if first_error is None:
+                    first_error = err
+
+    if first_error is not None:
+        raise first_error
+    return sorted(task_results, key=lambda result: result['key'])
+
+
+def download_truck_data_files_concurrently(boto_client: client, files_to_download: list[str],
+                                           bucket_name: str, path: str,
+                                           max_workers: int = MAX_DOWNLOAD_WORKERS) -> list[dict]:
+    """
+    Downloads relevant files from S3 using a bounded pool of threads
+    and returns a timing and size summary for each file
+    """
+    return run_file_tasks_concurrently(
+        partial(download_truck_data_file, boto_client, bucket_name=bucket_name, path=path),
+        files_to_download, max_workers)
+
+
+def stream_truck_data_files_concurrently(boto_client: client, files_to_stream: list[str],
+                                         bucket_name: str,
+                                         max_workers: int = MAX_DOWNLOAD_WORKERS) -> list[dict]:
+    """
+    Reads relevant files from S3 into memory using a bounded pool of threads,
+    without writing anything to disk
+    """
+    return run_file_tasks_concurrently(
+        partial(stream_truck_data_file, boto_client, bucket_name=bucket_name),
+        files_to_stream, max_workers)
+
+
+def summarise_download_results(download_results: list[dict]) -> str:
+    """Returns a summary of the number of files, bytes and time taken to download"""
+    total_bytes = sum(result['bytes'] for result in download_results)
+    slowest = max(download_results, key=lambda result: result['seconds'], default=None)
+    summary = f'Successfully downloaded {len(download_results)} files ({total_bytes} bytes).'
+    if slowest is not None:
+        summary += f' Slowest file: {slowest["key"]} in {slowest["seconds"]}s.'
+    return summary
 
 
 def main():
@@ -83,14 +256,20 @@ def main():
     s3_client = create_boto_client()
     buckets_for_user = identify_different_files_in_bucket(s3_client)
     print(buckets_for_user)
-    filenames_present = get_objects_in_bucket(s3_client, BUCKET_NAME)
-    filtered_filenames = filter_valid_filenames_by_date(
-        filenames_present, VALID_FILE_PATTERN, VALID_DATE, VALID_TIME)
-    print(filtered_filenames)
+    listing_stats = {}
+    prefix = get_prefix_for_date(VALID_FILE_PATTERN, VALID_DATE, VALID_TIME)
+    filtered_files = list(list_valid_objects_by_prefix(
+        s3_client, BUCKET_NAME, prefix, VALID_FILE_PATTERN[1], listing_stats))
+    print(summarise_listing_stats(listing_stats))
+    manifest = load_download_manifest(MANIFEST_PATH)
+    files_to_download, cached_files = filter_files_not_in_manifest(
+        filtered_files, manifest, PATH_TO_DOWNLOAD)
+    print(summarise_cache_results(files_to_download, cached_files))
     create_directory_for_files(PATH_TO_DOWNLOAD)
-    download_status = download_truck_data_files(
-        s3_client, filtered_filenames, BUCKET_NAME, PATH_TO_DOWNLOAD)
-    print(download_status)
+    download_results = download_truck_data_files_concurrently(
+        s3_client, [file['key'] for file in files_to_download], BUCKET_NAME, PATH_TO_DOWNLOAD)
+    record_downloads_in_manifest(files_to_download, MANIFEST_PATH)
+    print(summarise_download_results(download_results))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,221 @@
+"""
+Module that records the wall time, rows, bytes and memory of each pipeline stage,
+through a context manager or a decorator, and writes them as a JSON run summary
+"""
+import json
+import os
+import pstats
+import sys
+import tracemalloc
+from cProfile import Profile
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+from io import StringIO
+from resource import getrusage, RUSAGE_SELF
+from threading import Lock
+from time import perf_counter
+from typing import Callable, Iterator
+import pandas as pd
+
+RUN_SUMMARY_PATH = './logs/run_summaries.jsonl'
+PROFILE_PATH = './logs/pipeline.prof'
+PROFILE_TOP_FUNCTIONS = 20
+STAGE_TOTALS = {}
+OPEN_STAGES = []
+STAGE_LOCK = Lock()
+
+
+def get_max_rss_bytes() -> int:
+    """Returns the most memory the process has held so far, which Linux reports in kilobytes"""
+    max_rss = getrusage(RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def record_traced_peak() -> None:
+    """
+    Adds the peak traced memory since the last stage started or ended to every open stage,
+    including those in other threads, then resets it. Called while holding STAGE_LOCK
+    """
+    if not tracemalloc.is_tracing():
+        return
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    for stage in OPEN_STAGES:
+        stage['peak_traced_bytes'] = max(stage['peak_traced_bytes'], peak_bytes)
+    tracemalloc.reset_peak()
+
+
+def add_to_stage_totals(stage: dict) -> None:
+    """
+    Adds a finished call of a stage to the totals of every call with the same name,
+    leaving counts no call has reported as None
+    """
+    totals = STAGE_TOTALS.setdefault(stage['stage'], {
+        'calls': 0, 'errors': 0, 'seconds': 0.0, 'rows_in': None, 'rows_out': None, 'bytes': None,
+        'peak_traced_bytes': None, 'max_rss_bytes': 0})
+    totals['calls'] += 1
+    totals['errors'] += stage['error'] is not None
+    totals['seconds'] += stage['seconds']
+    for count in ['rows_in', 'rows_out', 'bytes']:
+        if stage[count] is not None:
+            totals[count] = (totals[count] or 0) + stage[count]
+    if tracemalloc.is_tracing():
+        totals['peak_traced_bytes'] = max(totals['peak_traced_bytes'] or 0,
+                                          stage['peak_traced_bytes'])
+    totals['max_rss_bytes'] = max(totals['max_rss_bytes'], get_max_rss_bytes())
+
+
+@contextmanager
+def measure_stage(stage_name: str, rows_in: int = None) -> Iterator[dict]:
+    """
+    Measures the code run inside it as a call of the named stage. Set rows_out and bytes
+    on the dictionary it yields to count what the stage produced
+    """
+    stage = {'stage': stage_name, 'rows_in': rows_in, 'rows_out': None, 'bytes': None,
+             'peak_traced_bytes': 0, 'error': None}
+    with STAGE_LOCK:
+        record_traced_peak()
+        OPEN_STAGES.append(stage)
+    start_time = perf_counter()
+    try:
+        yield stage
+    except Exception as err:
+        stage['error'] = type(err).__name__
+        raise
+    finally:
+        stage['seconds'] = perf_counter() - start_time
+        with STAGE_LOCK:
+            record_traced_peak()
+            OPEN_STAGES[:] = [open_stage for open_stage in OPEN_STAGES if open_stage is not stage]
+            add_to_stage_totals(stage)
+
+
+def reset_stages_after_fork() -> None:
+    """
+    Gives a forked worker process its own stage totals and lock, since the lock may have
+    been held by another thread of the parent when it was forked
+    """
+    global STAGE_LOCK  # pylint: disable=global-statement
+    STAGE_LOCK = Lock()
+    STAGE_TOTALS.clear()
+    OPEN_STAGES.clear()
+
+
+os.register_at_fork(after_in_child=reset_stages_after_fork)
+
+
+def count_input_rows(arguments: list) -> int | None:
+    """Returns the rows of the first dataframe, or list of dataframes, in a function's arguments"""
+    for argument in arguments:
+        if isinstance(argument, pd.DataFrame):
+            return len(argument)
+        if isinstance(argument, list) and argument and \
+                all(isinstance(item, pd.DataFrame) for item in argument):
+            return sum(len(item) for item in argument)
+    return None
+
+
+def count_rows_and_bytes(result) -> dict:
+    """Returns the rows and in-memory bytes of a dataframe result, and nothing otherwise"""
+    if isinstance(result, pd.DataFrame):
+        return {'rows_out': len(result), 'bytes': int(result.memory_usage(index=False).sum())}
+    return {}
+
+
+def instrument_stage(stage_name: str,
+                     count_output: Callable[[object], dict] = count_rows_and_bytes) -> Callable:
+    """
+    Decorator that measures every call of a function as a call of the named stage,
+    taking rows_in from its first dataframe arguments and rows_out and bytes
+    from what count_output returns for its result
+    """
+    def decorator(stage_function: Callable) -> Callable:
+        @wraps(stage_function)
+        def measured_function(*args, **kwargs):
+            with measure_stage(stage_name,
+                               count_input_rows([*args, *kwargs.values()])) as stage:
+                result = stage_function(*args, **kwargs)
+                stage.update(count_output(result))
+            return result
+        return measured_function
+    return decorator
+
+
+def get_stage_totals() -> dict:
+    """Returns a copy of the totals of every stage measured so far"""
+    with STAGE_LOCK:
+        return {stage_name: dict(totals) for stage_name, totals in STAGE_TOTALS.items()}
+
+
+def merge_stage_totals(stage_totals: dict) -> None:
+    """
+    Adds stage totals measured in another process, such as a worker cleaning a file,
+    to the totals of this one. Seconds add up every worker's time, so with several
+    workers a stage can take longer than the run itself
+    """
+    with STAGE_LOCK:
+        for stage_name, totals in stage_totals.items():
+            if stage_name not in STAGE_TOTALS:
+                STAGE_TOTALS[stage_name] = dict(totals)
+                continue
+            merged_totals = STAGE_TOTALS[stage_name]
+            for count in ['calls', 'errors', 'seconds']:
+                merged_totals[count] += totals[count]
+            for count in ['rows_in', 'rows_out', 'bytes']:
+                if totals[count] is not None:
+                    merged_totals[count] = (merged_totals[count] or 0) + totals[count]
+            for peak in ['peak_traced_bytes', 'max_rss_bytes']:
+                if totals[peak] is not None:
+                    merged_totals[peak] = max(merged_totals[peak] or 0, totals[peak])
+
+
+def clear_stage_totals() -> None:
+    """Forgets every stage measured so far"""
+    with STAGE_LOCK:
+        STAGE_TOTALS.clear()
+
+
+def summarise_stage_totals(stage_totals: dict) -> list[str]:
+    """Returns a line per stage with its calls, time and any rows counted, slowest stage first"""
+    stage_summaries = []
+    for stage_name, totals in sorted(stage_totals.items(), key=lambda item: -item[1]['seconds']):
+        counts = [f'{totals[count]} {count.replace("_", " ")}' for count in ['rows_in', 'rows_out']
+                  if totals[count] is not None]
+        stage_summaries.append(', '.join(
+            [f'{stage_name}: {totals["calls"]} calls in {totals["seconds"]:.2f}s', *counts]))
+    return stage_summaries
+
+
+def create_run_summary(started_at: datetime, seconds: float, run_details: dict) -> dict:
+    """Returns the run summary of the stage totals and any other details of the run"""
+    return {'started_at': started_at.isoformat(timespec='seconds'),
+            'seconds': round(seconds, 3),
+            'max_rss_bytes': get_max_rss_bytes(),
+            'stages': get_stage_totals()} | run_details
+
+
+def write_run_summary(run_summary: dict, summary_path: str = RUN_SUMMARY_PATH) -> None:
+    """Appends a run summary as a line of JSON, so each run can be compared with the last"""
+    with open(summary_path, 'a', encoding='utf-8') as summary_file:
+        summary_file.write(json.dumps(run_summary, default=str) + '\n')
+
+
+def start_profiler() -> Profile:
+    """Returns a cProfile profiler that has started profiling the calling thread"""
+    profiler = Profile()
+    profiler.enable()
+    return profiler
+
+
+def write_profile(profiler: Profile, profile_path: str = PROFILE_PATH,
+                  top_functions: int = PROFILE_TOP_FUNCTIONS) -> str:
+    """
+    Stops the profiler and dumps its stats for pstats or snakeviz,
+    returning the functions that took the most cumulative time
+    """
+    profiler.disable()
+    profiler.dump_stats(profile_path)
+    profile_stats = StringIO()
+    pstats.Stats(profiler, stream=profile_stats).sort_stats(
+        pstats.SortKey.CUMULATIVE).print_stats(top_functions)
+    return profile_stats.getvalue()
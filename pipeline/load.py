@@ -1,66 +1,228 @@
 """Module that test loads a couple of rows of the cleaned data to the MySQL database"""
-from os import environ
-import csv
-import pymysql.cursors
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
 import pymysql
 from dotenv import load_dotenv
+from database_connection import pooled_connection
+from analytics_snapshot import write_hourly_totals_snapshot, get_last_exported_update
+from dimension_cache import get_payment_method_table, get_truck_column
+from transform import add_transaction_sequence
 
 PATH_TO_LOAD = './data-files/'
 TRANSACTION_FILE = 'TRUCK_HIST_DATA.csv'
+STAGING_PATH = './data-files/staging'
+STAGING_COLUMNS = ['timestamp', 'type', 'total', 'truck_id']
+ANALYTICS_SNAPSHOT_COLUMNS = ['event_hour', 'truck_id', 'payment_method_id',
+                              'total_transactions', 'total_profits', 'updated_at']
 
 
-def get_connection() -> pymysql.connections.Connection:
-    """Returns a connection object that connects to remote MySQL database"""
-    return pymysql.connections.Connection(host=environ.get('DB_HOST'),
-                                          user=environ.get('DB_USER'),
-                                          password=environ.get('DB_PASSWORD'),
-                                          database=environ.get('DB_NAME'),
-                                          cursorclass=pymysql.cursors.DictCursor)
+def load_transaction_data_from_file(filename: str,
+                                    path_to_load: str = PATH_TO_LOAD) -> pd.DataFrame:
+    """Returns the transaction data from the csv file in /data-files"""
+    return pd.read_csv(f'{path_to_load}{filename}')
 
 
-def load_transaction_data_from_file(filename: str) -> list[list[str]]:
-    """Returns a list of the transaction data from the csv file in /data-files"""
-    data = []
-    with open(f'{PATH_TO_LOAD}{filename}', 'r', encoding='utf-8') as f:
-        transaction_data = csv.reader(f)
-        for line in transaction_data:
-            data.append(line)
-    return data
+def load_transaction_data_from_staging(path_to_load: str = STAGING_PATH,
+                                       columns: list[str] = None,
+                                       filters: list[tuple] = None) -> pd.DataFrame:
+    """
+    Returns the typed transaction data from the Parquet staging dataset, reading only the
+    given columns and the date/hour partitions matching the filters, e.g.
+    [('event_date', '=', '2025-03-24'), ('event_hour', '=', 12)]. The Arrow buffers are
+    handed to pandas column by column and released as they go, avoiding a second copy
+    """
+    return pq.read_table(path_to_load, columns=columns or STAGING_COLUMNS,
+                         filters=filters).to_pandas(split_blocks=True, self_destruct=True)
 
 
 def replace_payment_method_with_id_in_column(
-        transaction_data: list[list[str]]) -> list[list[str]]:
-    """Returns the modified dataframe with the payment method replaced with the id"""
-    payment_method_table = {'cash': 1, 'card': 2}
-    for row in transaction_data:
-        payment_method = row[1]
-        if payment_method_table.get(payment_method) is not None:
-            row[1] = payment_method_table.get(payment_method)
-    return transaction_data
+        truck_data: pd.DataFrame, payment_method_table: dict) -> pd.DataFrame:
+    """
+    Returns the truck data with each payment method replaced by its id from
+    DIM_Payment_Method, mapping each distinct method once.
+    Raises a ValueError counting the rows with unknown methods
+    """
+    payment_method_ids = truck_data['type'].astype('category').map(payment_method_table)
+    unknown_payment_methods = payment_method_ids.isna()
+    if unknown_payment_methods.any():
+        raise ValueError(
+            f'{unknown_payment_methods.sum()} rows have unknown payment methods: '
+            f'{sorted(truck_data.loc[unknown_payment_methods, "type"].astype(str).unique())}')
+    return truck_data.assign(type=payment_method_ids.astype(np.int16))
+
+
+def check_truck_ids_are_known(conn: pymysql.connections.Connection,
+                              truck_data: pd.DataFrame) -> None:
+    """
+    Raises a ValueError counting the rows whose truck id is not in DIM_Truck,
+    since the partitioned FACT_Transaction has no foreign key to catch them.
+    The cached trucks are checked first, and DIM_Truck is read again before raising
+    in case a truck was added since it was cached
+    """
+    unknown_truck_ids = ~truck_data['truck_id'].isin(get_truck_column(conn, 'truck_name').keys())
+    if unknown_truck_ids.any():
+        unknown_truck_ids = ~truck_data['truck_id'].isin(
+            get_truck_column(conn, 'truck_name', ttl_seconds=0).keys())
+    if unknown_truck_ids.any():
+        raise ValueError(
+            f'{unknown_truck_ids.sum()} rows have unknown truck ids: '
+            f'{sorted(truck_data.loc[unknown_truck_ids, "truck_id"].unique().tolist())}')
 
 
 def upload_transaction_data(conn: pymysql.connections.Connection,
                             transaction_data: list[list[str]]) -> None:
-    """Uploads transaction data to the database."""
+    """
+    Uploads transaction data, with its transaction_sequence, to the database,
+    skipping rows already loaded by the natural key
+    """
 
     with conn.cursor() as cursor:
         sql_query = \
             """INSERT INTO FACT_Transaction \
-                (event_at, payment_method_id, total_price, truck_id)
-          VALUES (%s, %s, %s, %s);"""
+                (event_at, payment_method_id, total_price, truck_id, transaction_sequence)
+          VALUES (%s, %s, %s, %s, %s)
+          ON DUPLICATE KEY UPDATE transaction_id = transaction_id;"""
         cursor.executemany(sql_query, tuple(transaction_data))
 
     conn.commit()
     return 'Successfully uploaded transaction data to the database.'
 
 
+def write_transaction_data_to_tsv(truck_data: pd.DataFrame, payment_method_table: dict,
+                                  path_to_write_to: str) -> int:
+    """
+    Writes the cleaned truck data to a tab separated file in FACT_Transaction column order,
+    replacing each payment method with its id. Returns the number of rows written
+    """
+    truck_data = replace_payment_method_with_id_in_column(truck_data, payment_method_table)
+    transaction_data = pd.DataFrame({'event_at': truck_data['timestamp'],
+                                     'payment_method_id': truck_data['type'],
+                                     'total_price': truck_data['total'],
+                                     'truck_id': truck_data['truck_id'],
+                                     'transaction_sequence': truck_data['transaction_sequence']})
+    transaction_data.to_csv(path_to_write_to, sep='\t', header=False, index=False,
+                            lineterminator='\n', date_format='%Y-%m-%d %H:%M:%S')
+    return len(transaction_data)
+
+
+def upload_transaction_data_from_tsv(conn: pymysql.connections.Connection,
+                                     path_to_load: str) -> int:
+    """
+    Bulk loads a tab separated file of transactions with LOAD DATA LOCAL INFILE,
+    returning the number of rows inserted. Rows already loaded are skipped by the
+    natural key on FACT_Transaction. The connection must allow local_infile,
+    and the caller commits so the hourly rollup can be updated in the same transaction
+    """
+    with conn.cursor() as cursor:
+        sql_query = """LOAD DATA LOCAL INFILE %s IGNORE INTO TABLE FACT_Transaction
+            FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n'
+            (event_at, payment_method_id, total_price, truck_id, transaction_sequence);"""
+        rows_inserted = cursor.execute(sql_query, (path_to_load,))
+    return rows_inserted
+
+
+def update_hourly_rollup(conn: pymysql.connections.Connection, start: datetime, end: datetime,
+                         truck_ids: list[int] = None) -> int:
+    """
+    Recomputes the AGG_Truck_Hourly totals of every hour from start up to end from
+    FACT_Transaction, optionally for only some trucks. Recomputing instead of adding to
+    the totals keeps them correct when a re-run skips rows already loaded. Does not commit
+    """
+    truck_filter = ''
+    query_parameters = [start, end]
+    if truck_ids:
+        truck_filter = f'AND truck_id IN ({", ".join(["%s"] * len(truck_ids))})'
+        query_parameters.extend(truck_ids)
+
+    with conn.cursor() as cursor:
+        sql_query = f"""INSERT INTO AGG_Truck_Hourly
+            (event_hour, truck_id, payment_method_id, total_transactions, total_profits)
+        SELECT DATE_FORMAT(event_at, '%%Y-%%m-%%d %%H:00:00') AS event_hour, truck_id,
+            payment_method_id, COUNT(*), SUM(total_price)
+        FROM FACT_Transaction
+        WHERE event_at >= %s AND event_at < %s {truck_filter}
+        GROUP BY event_hour, truck_id, payment_method_id
+        ON DUPLICATE KEY UPDATE total_transactions = VALUES(total_transactions),
+            total_profits = VALUES(total_profits);"""
+        return cursor.execute(sql_query, query_parameters)
+
+
+def get_hourly_rollup_bounds(truck_data: pd.DataFrame) -> tuple[datetime, datetime, list[int]]:
+    """Returns the first hour, the hour after the last and the trucks in the truck data"""
+    start = truck_data['timestamp'].min().floor('h')
+    end = truck_data['timestamp'].max().floor('h') + pd.Timedelta(hours=1)
+    truck_ids = sorted(int(truck_id) for truck_id in truck_data['truck_id'].unique())
+    return start.to_pydatetime(), end.to_pydatetime(), truck_ids
+
+
+def update_hourly_rollup_for_data(conn: pymysql.connections.Connection,
+                                  truck_data: pd.DataFrame) -> int:
+    """Recomputes the AGG_Truck_Hourly totals of the trucks and hours in the truck data"""
+    if truck_data.empty:
+        return 0
+    return update_hourly_rollup(conn, *get_hourly_rollup_bounds(truck_data))
+
+
+def query_hourly_rollup(conn: pymysql.connections.Connection, row_filter: str,
+                        query_parameters: list) -> pd.DataFrame:
+    """Returns the AGG_Truck_Hourly totals matching a WHERE clause, typed as in the snapshots"""
+    with conn.cursor() as cursor:
+        cursor.execute(f"""SELECT event_hour, truck_id, payment_method_id, total_transactions,
+            total_profits, updated_at FROM AGG_Truck_Hourly WHERE {row_filter};""",
+                       query_parameters)
+        return pd.DataFrame(cursor.fetchall(), columns=ANALYTICS_SNAPSHOT_COLUMNS).astype({
+            'event_hour': 'datetime64[us]', 'truck_id': 'int16', 'payment_method_id': 'int16',
+            'total_transactions': 'int64', 'total_profits': float,
+            'updated_at': 'datetime64[us]'})
+
+
+def get_hourly_rollup(conn: pymysql.connections.Connection, start: datetime, end: datetime,
+                      truck_ids: list[int] = None) -> pd.DataFrame:
+    """Returns the AGG_Truck_Hourly totals of every hour from start up to end"""
+    truck_filter = ''
+    query_parameters = [start, end]
+    if truck_ids:
+        truck_filter = f'AND truck_id IN ({", ".join(["%s"] * len(truck_ids))})'
+        query_parameters.extend(truck_ids)
+    return query_hourly_rollup(conn, f'event_hour >= %s AND event_hour < %s {truck_filter}',
+                               query_parameters)
+
+
+def get_hourly_rollup_updated_since(conn: pymysql.connections.Connection,
+                                    updated_since: datetime) -> pd.DataFrame:
+    """Returns the AGG_Truck_Hourly totals updated at or after the given time"""
+    return query_hourly_rollup(conn, 'updated_at >= %s', [updated_since])
+
+
+def export_hourly_rollup_snapshot(conn: pymysql.connections.Connection,
+                                  truck_data: pd.DataFrame, snapshot_path: str) -> str | None:
+    """
+    Exports the committed AGG_Truck_Hourly totals of the trucks and hours in the truck data,
+    and any updated since the last snapshot, as a Parquet snapshot for the dashboard's
+    analytics store, returning its name. Including the updated totals re-exports the hours
+    of an earlier run whose export failed
+    """
+    hourly_totals = []
+    if not truck_data.empty:
+        hourly_totals.append(get_hourly_rollup(conn, *get_hourly_rollup_bounds(truck_data)))
+    last_exported_update = get_last_exported_update(snapshot_path)
+    if last_exported_update is not None:
+        hourly_totals.append(get_hourly_rollup_updated_since(conn, last_exported_update))
+    if not hourly_totals:
+        return None
+    return write_hourly_totals_snapshot(pd.concat(hourly_totals).drop_duplicates(
+        ['event_hour', 'truck_id', 'payment_method_id']), snapshot_path)
+
+
 def main():
     """Loads the truck data into the remote MySQL database"""
-    truck_data = load_transaction_data_from_file(TRANSACTION_FILE)[1:11]
-    truck_data = replace_payment_method_with_id_in_column(
-        truck_data)
-    connection = get_connection()
-    print(upload_transaction_data(connection, truck_data))
+    truck_data = add_transaction_sequence(load_transaction_data_from_staging()).head(10)
+    with pooled_connection() as connection:
+        truck_data = replace_payment_method_with_id_in_column(
+            truck_data, get_payment_method_table(connection))
+        print(upload_transaction_data(connection, truck_data.values.tolist()))
 
 
 if __name__ == "__main__":
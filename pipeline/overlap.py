@@ -0,0 +1,170 @@
+"""
+Module that runs extract, transform and load as overlapping stages joined by bounded queues,
+so each truck file is cleaned as soon as it arrives and its rows are loaded in batches
+while the remaining files are still being extracted
+"""
+from queue import Queue, Empty, Full
+from threading import Event, Lock, Thread
+from time import perf_counter
+from typing import Callable
+import pandas as pd
+
+QUEUE_POLL_SECONDS = 0.1
+END_OF_STAGE = None
+
+
+def create_stage_state() -> dict:
+    """Returns the state shared by every stage: a stop event, the first error and stats"""
+    return {'stop': Event(), 'lock': Lock(), 'error': None,
+            'stats': {'files_extracted': 0, 'files_transformed': 0, 'rows_transformed': 0,
+                      'batches_loaded': 0, 'load_wait_seconds': 0.0}}
+
+
+def record_stage_error(stage_state: dict, err: Exception) -> None:
+    """Keeps the first error raised by any stage and tells every stage to stop"""
+    with stage_state['lock']:
+        if stage_state['error'] is None:
+            stage_state['error'] = err
+    stage_state['stop'].set()
+
+
+def add_to_stage_stats(stage_state: dict, **increments) -> None:
+    """Adds to the counts and timings of the stages"""
+    with stage_state['lock']:
+        for stat, increment in increments.items():
+            stage_state['stats'][stat] += increment
+
+
+def put_unless_stopped(stage_queue: Queue, item, stage_state: dict) -> bool:
+    """
+    Puts an item on a bounded queue, waiting while it is full so a slow stage holds back
+    the one before it. Returns False without putting it if the stages are stopping
+    """
+    while not stage_state['stop'].is_set():
+        try:
+            stage_queue.put(item, timeout=QUEUE_POLL_SECONDS)
+            return True
+        except Full:
+            continue
+    return False
+
+
+def get_unless_stopped(stage_queue: Queue, stage_state: dict):
+    """Returns the next item on a queue, or END_OF_STAGE if the stages are stopping"""
+    while not stage_state['stop'].is_set():
+        try:
+            return stage_queue.get(timeout=QUEUE_POLL_SECONDS)
+        except Empty:
+            continue
+    return END_OF_STAGE
+
+
+def run_stage_worker(stage_task: Callable, input_queue: Queue, output_queue: Queue,
+                     stage_state: dict, stat_name: str) -> None:
+    """Runs a stage's task on each item from its input queue until the end of the stage"""
+    try:
+        while (item := get_unless_stopped(input_queue, stage_state)) is not END_OF_STAGE:
+            result = stage_task(item)
+            add_to_stage_stats(stage_state, **{stat_name: 1})
+            if not put_unless_stopped(output_queue, result, stage_state):
+                return
+    except Exception as err:  # pylint: disable=broad-exception-caught
+        record_stage_error(stage_state, err)
+
+
+def close_stage(workers: list[Thread], output_queue: Queue, next_stage_workers: int,
+                stage_state: dict) -> None:
+    """Waits for a stage's workers to finish, then ends each worker of the next stage"""
+    for worker in workers:
+        worker.join()
+    for _ in range(next_stage_workers):
+        put_unless_stopped(output_queue, END_OF_STAGE, stage_state)
+
+
+def start_stage(stage_task: Callable, stage_workers: tuple[int, int], queues: tuple[Queue, Queue],
+                stage_state: dict, stat_name: str) -> list[Thread]:
+    """
+    Starts the worker threads of a stage reading from and writing to the given queues,
+    and a thread that ends each worker of the next stage once they have all finished
+    """
+    number_of_workers, next_stage_workers = stage_workers
+    input_queue, output_queue = queues
+    workers = [Thread(target=run_stage_worker, daemon=True,
+                      args=(stage_task, input_queue, output_queue, stage_state, stat_name))
+               for _ in range(number_of_workers)]
+    for worker in workers:
+        worker.start()
+    closer = Thread(target=close_stage, daemon=True,
+                    args=(workers, output_queue, next_stage_workers, stage_state))
+    closer.start()
+    return workers + [closer]
+
+
+def load_transformed_data(load_batch: Callable[[pd.DataFrame], None], transformed_queue: Queue,
+                          batch_rows: int, stage_state: dict) -> None:
+    """
+    Loads the transformed files as they arrive, combining whole files until a batch
+    has at least batch_rows rows so a file is never split across two batches
+    """
+    pending_data, pending_rows = [], 0
+    while True:
+        wait_start = perf_counter()
+        truck_data = get_unless_stopped(transformed_queue, stage_state)
+        add_to_stage_stats(stage_state, load_wait_seconds=perf_counter() - wait_start)
+        if truck_data is END_OF_STAGE:
+            break
+        add_to_stage_stats(stage_state, rows_transformed=len(truck_data))
+        pending_data.append(truck_data)
+        pending_rows += len(truck_data)
+        if pending_rows >= batch_rows:
+            load_batch(pd.concat(pending_data, ignore_index=True))
+            add_to_stage_stats(stage_state, batches_loaded=1)
+            pending_data, pending_rows = [], 0
+
+    if pending_data and not stage_state['stop'].is_set():
+        load_batch(pd.concat(pending_data, ignore_index=True))
+        add_to_stage_stats(stage_state, batches_loaded=1)
+
+
+def run_overlapped_stages(files: list[str], extract_file: Callable, transform_file: Callable,
+                          load_batch: Callable[[pd.DataFrame], None],
+                          stage_options: dict) -> dict:
+    """
+    Extracts, transforms and loads the files as overlapping stages, with the number of
+    extract and transform workers, queue size and batch rows given in the stage options.
+    Loading runs on the calling thread, so load_batch can use its database connection.
+    On the first error every stage stops, the threads are joined and the error is raised.
+    Returns the counts and the seconds the load stage spent waiting for data
+    """
+    if min(stage_options['extract_workers'], stage_options['transform_workers'],
+           stage_options['queue_size']) < 1:
+        raise ValueError('Invalid stage options: workers and queue size must be at least one.')
+
+    stage_state = create_stage_state()
+    files_queue = Queue()
+    for file in files:
+        files_queue.put(file)
+    for _ in range(stage_options['extract_workers']):
+        files_queue.put(END_OF_STAGE)
+    extracted_queue = Queue(maxsize=stage_options['queue_size'])
+    transformed_queue = Queue(maxsize=stage_options['queue_size'])
+
+    threads = start_stage(extract_file,
+                          (stage_options['extract_workers'], stage_options['transform_workers']),
+                          (files_queue, extracted_queue), stage_state, 'files_extracted')
+    threads += start_stage(transform_file, (stage_options['transform_workers'], 1),
+                           (extracted_queue, transformed_queue), stage_state, 'files_transformed')
+    try:
+        load_transformed_data(load_batch, transformed_queue, stage_options['batch_rows'],
+                              stage_state)
+    except Exception as err:  # pylint: disable=broad-exception-caught
+        record_stage_error(stage_state, err)
+    finally:
+        stage_state['stop'].set()
+        for thread in threads:
+            thread.join()
+
+    first_error = stage_state['error']
+    if first_error is not None:
+        raise first_error
+    return stage_state['stats']
@@ -1,21 +1,58 @@
 """Module for ETL pipeline script"""
 import logging
-from argparse import ArgumentParser
+import tracemalloc
+from argparse import ArgumentParser, Namespace
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from datetime import datetime
+from io import BytesIO
+from os import environ, remove
+from os.path import getsize
+from tempfile import NamedTemporaryFile
+from time import perf_counter
+from typing import Callable, Iterator
 import pymysql.cursors
 import pymysql
 from boto3 import client
 import pandas as pd
 from dotenv import load_dotenv
-from extract import create_boto_client, get_objects_in_bucket, filter_valid_filenames_by_date, \
-    create_directory_for_files, download_truck_data_files, BUCKET_NAME, \
-    PATH_TO_DOWNLOAD, VALID_FILE_PATTERN, VALID_DATE, VALID_TIME, check_valid_time
-from transform import get_list_of_data_files, load_truck_data_from_file, add_ids_to_column, \
-    combine_transaction_data_files, remove_invalid_rows_from_total_column, \
-    convert_column_data_types, filter_files_to_clean, remove_timezone_from_timestamp, \
-    fix_extreme_values_that_have_a_normal_version
-from load import get_connection
+from extract import create_boto_client, list_valid_objects_by_prefix, \
+    list_valid_filenames_by_prefix, stream_truck_data_files_concurrently, get_prefix_for_date, \
+    stream_truck_data_file, \
+    summarise_listing_stats, create_directory_for_files, \
+    download_truck_data_files_concurrently, summarise_download_results, \
+    load_download_manifest, record_downloads_in_manifest, filter_files_not_in_manifest, \
+    summarise_cache_results, BUCKET_NAME, PATH_TO_DOWNLOAD, \
+    VALID_FILE_PATTERN, VALID_DATE, VALID_TIME, MAX_DOWNLOAD_WORKERS, MANIFEST_PATH, \
+    check_valid_time, get_partition_path
+from transform import get_list_of_data_files, load_truck_data_from_file, \
+    load_truck_data_from_buffers, add_ids_to_column, combine_transaction_data_files, \
+    filter_files_to_clean, clean_combined_truck_data, load_and_prepare_truck_data_file, \
+    finish_cleaning_truck_data, get_normal_totals, \
+    get_extreme_total_mask, add_transaction_sequence, TRANSACTION_KEY_COLUMNS, \
+    TRUCK_DATA_COLUMNS
+from load import write_transaction_data_to_tsv, \
+    upload_transaction_data_from_tsv, replace_payment_method_with_id_in_column, \
+    update_hourly_rollup_for_data, check_truck_ids_are_known, export_hourly_rollup_snapshot
+from dimension_cache import get_payment_method_table, \
+    get_dimension_cache_stats
+from database_connection import pooled_connection, get_connection_stats, \
+    close_all_connections
+from backfill import parse_backfill_bound, get_partitions_between, get_partition_name, \
+    load_backfill_checkpoint, write_backfill_checkpoint, filter_completed_partitions, \
+    BACKFILL_CHECKPOINT_PATH, MAX_BACKFILL_PARTITIONS
+from overlap import run_overlapped_stages
+from instrumentation import instrument_stage, measure_stage, count_rows_and_bytes, \
+    merge_stage_totals, clear_stage_totals, get_stage_totals, summarise_stage_totals, \
+    create_run_summary, write_run_summary, start_profiler, write_profile, \
+    RUN_SUMMARY_PATH, PROFILE_PATH
 
 VALID_FILE_PATTERN_TRANSFORM = ['T3_T', '.csv']
+BATCH_SIZE = 10_000
+LOAD_ENGINES = ['executemany', 'load-data']
+OVERLAP_QUEUE_SIZE = 4
 
 
 def get_logger(log_level: str) -> logging:
@@ -73,43 +110,267 @@ def get_argument_parser() -> ArgumentParser:
                         action='store_true')
     parser.add_argument('-n', '--number', help='The number of rows to upload to database',
                         type=int, default=1_000_000)
+    parser.add_argument('--batch-size',
+                        help='The number of rows to upload and commit at a time',
+                        type=int, default=BATCH_SIZE)
     parser.add_argument('-p', '--path', help='specifies the path to the data files',
                         type=str, default=PATH_TO_DOWNLOAD)
+    parser.add_argument('-c', '--concurrency',
+                        help='The number of files to download from S3 at the same time',
+                        type=int, default=MAX_DOWNLOAD_WORKERS)
+    parser.add_argument('-f', '--force-refresh',
+                        help='when flagged, downloads every file even if it is already on disk',
+                        action='store_true')
+    parser.add_argument('-s', '--stream',
+                        help='when flagged, reads the truck files into memory instead of to disk',
+                        action='store_true')
+    parser.add_argument('-w', '--workers',
+                        help='The number of processes used to clean the truck files in parallel',
+                        type=int, default=1)
+    parser.add_argument('--from', dest='from_date',
+                        help='backfills every partition from this date or datetime e.g: 2025-03-24',
+                        type=parse_backfill_bound, default=None)
+    parser.add_argument('--to', dest='to_date',
+                        help='the last date or datetime to backfill, defaults to now',
+                        type=parse_backfill_bound, default=None)
+    parser.add_argument('-b', '--backfill-concurrency',
+                        help='The number of partitions to extract and transform at the same time',
+                        type=int, default=MAX_BACKFILL_PARTITIONS)
+    parser.add_argument('--checkpoint',
+                        help='specifies the path to the file of completed backfill partitions',
+                        type=str, default=BACKFILL_CHECKPOINT_PATH)
+    parser.add_argument('-e', '--engine',
+                        help='executemany inserts in batches, load-data bulk loads a temporary '
+                        'file with LOAD DATA LOCAL INFILE',
+                        choices=LOAD_ENGINES, default='executemany')
+    parser.add_argument('-o', '--overlap',
+                        help='when flagged, streams the truck files and cleans and loads each '
+                        'one as soon as it arrives instead of waiting for every download, '
+                        'cleaning -w files at a time in worker processes',
+                        action='store_true')
+    parser.add_argument('--queue-size',
+                        help='The number of files each overlapped stage can hold for the next',
+                        type=int, default=OVERLAP_QUEUE_SIZE)
+    parser.add_argument('--profile',
+                        help=f'when flagged, profiles the run with cProfile, writing the stats to '
+                        f'{PROFILE_PATH} and logging the slowest functions',
+                        action='store_true')
+    parser.add_argument('--trace-memory',
+                        help='when flagged, records the peak memory allocated during each stage '
+                        'with tracemalloc, which slows the pipeline down',
+                        action='store_true')
 
     return parser
 
 
+def get_extract_options(extract_options: dict = None) -> dict:
+    """
+    Returns the extract options with defaults filled in, by default
+    extracting the files for the current date and hour
+    """
+    return {'max_workers': MAX_DOWNLOAD_WORKERS, 'force_refresh': False,
+            'manifest_path': MANIFEST_PATH, 'valid_date': VALID_DATE,
+            'valid_time': VALID_TIME, **(extract_options or {})}
+
+
+def count_extracted_bytes(extract_results: dict) -> dict:
+    """Returns the bytes of every file downloaded or streamed by an extract"""
+    return {'bytes': sum(result['bytes'] for result in extract_results['download_results'])}
+
+
+@instrument_stage('extract', count_extracted_bytes)
 def extract_files_from_bucket(boto_client: client,
                               bucket_name: str,
                               path_to_download: str,
-                              valid_files: list[str]) -> str:
-    """Extracts the valid files from the S3 bucket and downloads them in ./data-files"""
-    check_valid_time(VALID_TIME)
-    filenames_in_bucket = get_objects_in_bucket(boto_client, bucket_name)
-    files_to_download = filter_valid_filenames_by_date(
-        filenames_in_bucket, valid_files, VALID_DATE, VALID_TIME)
+                              valid_files: list[str],
+                              extract_options: dict = None) -> dict:
+    """
+    Extracts the valid files from the S3 bucket and downloads them in ./data-files,
+    skipping any unchanged files recorded in the download manifest.
+    Returns the listing cost, cache hits and misses and the result of each download
+    """
+    extract_options = get_extract_options(extract_options)
+    check_valid_time(extract_options['valid_time'])
+    listing_stats = {}
+    prefix = get_prefix_for_date(valid_files, extract_options['valid_date'],
+                                 extract_options['valid_time'])
+    files_in_bucket = list(list_valid_objects_by_prefix(
+        boto_client, bucket_name, prefix, valid_files[1], listing_stats))
+
+    manifest = load_download_manifest(extract_options['manifest_path'])
+    files_to_download, cached_files = filter_files_not_in_manifest(
+        files_in_bucket, {} if extract_options['force_refresh'] else manifest,
+        path_to_download)
+
     create_directory_for_files(path_to_download)
-    download_status = download_truck_data_files(
-        boto_client, files_to_download, bucket_name, path_to_download)
-    return download_status
+    download_results = download_truck_data_files_concurrently(
+        boto_client, [file['key'] for file in files_to_download], bucket_name,
+        path_to_download, extract_options['max_workers'])
+    record_downloads_in_manifest(files_to_download, extract_options['manifest_path'])
+    return {'listing_stats': listing_stats,
+            'files_to_download': files_to_download,
+            'cached_files': cached_files,
+            'download_results': download_results}
+
+
+def list_files_to_stream(boto_client: client, bucket_name: str, valid_files: list[str],
+                         extract_options: dict) -> tuple[list[str], dict]:
+    """Returns the S3 keys of the truck files to stream for a partition and the listing cost"""
+    check_valid_time(extract_options['valid_time'])
+    listing_stats = {}
+    prefix = get_prefix_for_date(valid_files, extract_options['valid_date'],
+                                 extract_options['valid_time'])
+    keys_by_filename = {key.split('/')[-1]: key for key in list_valid_filenames_by_prefix(
+        boto_client, bucket_name, prefix, valid_files[1], listing_stats)}
+    return [keys_by_filename[filename] for filename in filter_files_to_clean(
+        list(keys_by_filename), VALID_FILE_PATTERN_TRANSFORM)], listing_stats
+
+
+@instrument_stage('extract', count_extracted_bytes)
+def stream_files_from_bucket(boto_client: client,
+                             bucket_name: str,
+                             valid_files: list[str],
+                             extract_options: dict = None) -> dict:
+    """
+    Extracts the valid files from the S3 bucket straight into memory,
+    returning the listing cost and the buffer, timing and size of each file
+    """
+    extract_options = get_extract_options(extract_options)
+    files_to_stream, listing_stats = list_files_to_stream(
+        boto_client, bucket_name, valid_files, extract_options)
+    stream_results = stream_truck_data_files_concurrently(
+        boto_client, files_to_stream, bucket_name, extract_options['max_workers'])
+    return {'listing_stats': listing_stats,
+            'download_results': stream_results}
+
+
+@instrument_stage('transform.clean')
+def clean_truck_data(truck_data: list[pd.DataFrame], filenames: list[str],
+                     logger: logging.Logger) -> pd.DataFrame:
+    """Cleans the loaded truck data, taking each truck's id from its filename or S3 key"""
+    logger.info('Transforming and cleaning truck data...')
+    transformed_data = add_ids_to_column(truck_data, filenames)
+    combined_data = combine_transaction_data_files(transformed_data)
+    return clean_combined_truck_data(combined_data)
+
+
+def prepare_truck_data_file_in_worker(truck_file: str | BytesIO,
+                                      filename: str) -> tuple[pd.DataFrame, dict]:
+    """
+    Prepares a truck file in a worker process, returning its data and the stages
+    measured while preparing it, for the main process to add to its own totals
+    """
+    clear_stage_totals()
+    prepared_truck_data = load_and_prepare_truck_data_file(truck_file, filename)
+    return prepared_truck_data, get_stage_totals()
+
+
+def clean_truck_data_in_parallel(truck_files: list[str | BytesIO], filenames: list[str],
+                                 workers: int, logger: logging.Logger) -> pd.DataFrame:
+    """
+    Loads each truck file and removes its invalid rows in its own worker process,
+    then corrects the extreme values of the combined results against every truck's prices
+    """
+    logger.info('Loading and cleaning truck data with %s worker processes...', workers)
+    chunksize = max(1, len(truck_files) // (workers * 4))
+    prepared_truck_data = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for truck_data, stage_totals in executor.map(prepare_truck_data_file_in_worker,
+                                                     truck_files, filenames,
+                                                     chunksize=chunksize):
+            prepared_truck_data.append(truck_data)
+            merge_stage_totals(stage_totals)
+    combined_data = combine_transaction_data_files(prepared_truck_data)
+    with measure_stage('transform.clean', len(combined_data)) as stage:
+        cleaned_truck_data = finish_cleaning_truck_data(combined_data)
+        stage.update(count_rows_and_bytes(cleaned_truck_data))
+    return cleaned_truck_data
+
 
+def read_truck_data_files(
+        read_truck_data: Callable[[], list[pd.DataFrame]]) -> list[pd.DataFrame]:
+    """Returns the truck data read by the given function, measured as the read_csv stage"""
+    with measure_stage('transform.read_csv') as stage:
+        truck_data = read_truck_data()
+        stage['rows_out'] = sum(len(truck_file_data) for truck_file_data in truck_data)
+        stage['bytes'] = sum(int(truck_file_data.memory_usage(index=False).sum())
+                             for truck_file_data in truck_data)
+    return truck_data
 
+
+@instrument_stage('transform')
 def transform_files_from_bucket(filenames: list[list[str]],
-                                path_to_load: str, logger: logging.Logger) -> pd.DataFrame:
+                                path_to_load: str, logger: logging.Logger,
+                                workers: int = 1) -> pd.DataFrame:
     """Transforms the data by loading into a Pandas Dataframe and then cleans it"""
+    if workers > 1:
+        return clean_truck_data_in_parallel(
+            [f'{path_to_load}/{filename}' for filename in filenames], filenames, workers, logger)
+
     logger.info('Loading truck data...')
-    truck_data = load_truck_data_from_file(
-        filenames, path_to_load)
-    logger.info('Transforming and cleaning truck data...')
-    transformed_data = add_ids_to_column(truck_data, filenames)
-    combined_data = combine_transaction_data_files(transformed_data)
-    removed_invalid_rows = remove_invalid_rows_from_total_column(combined_data)
-    remove_timezone = remove_timezone_from_timestamp(removed_invalid_rows)
-    removed_extreme_values = fix_extreme_values_that_have_a_normal_version(
-        remove_timezone)
-    removed_extreme_values = removed_extreme_values.dropna()
-    cleaned_truck_data = convert_column_data_types(removed_extreme_values)
-    return cleaned_truck_data
+    truck_data = read_truck_data_files(partial(load_truck_data_from_file,
+                                               filenames, path_to_load))
+    return clean_truck_data(truck_data, filenames, logger)
+
+
+@instrument_stage('transform')
+def transform_streamed_files(stream_results: list[dict],
+                             logger: logging.Logger, workers: int = 1) -> pd.DataFrame:
+    """Transforms the in-memory truck files by parsing each buffer and then cleans it"""
+    buffers = [result['buffer'] for result in stream_results]
+    keys = [result['key'] for result in stream_results]
+    if workers > 1:
+        return clean_truck_data_in_parallel(buffers, keys, workers, logger)
+
+    logger.info('Loading truck data from memory...')
+    truck_data = read_truck_data_files(partial(load_truck_data_from_buffers, buffers))
+    return clean_truck_data(truck_data, keys, logger)
+
+
+def log_extract_results(extract_results: dict, logger: logging.Logger) -> None:
+    """Logs the listing cost, cache usage and timing of each file extracted"""
+    logger.info(summarise_listing_stats(extract_results['listing_stats']))
+    if 'cached_files' in extract_results:
+        logger.info(summarise_cache_results(extract_results['files_to_download'],
+                                            extract_results['cached_files']))
+    for result in extract_results['download_results']:
+        logger.info('Downloaded %s (%s bytes) in %ss',
+                    result['key'], result['bytes'], result['seconds'])
+    logger.info(summarise_download_results(extract_results['download_results']))
+
+
+def extract_and_transform(boto_client: client, args: Namespace, logger: logging.Logger,
+                          partition: tuple[str, int] = None) -> pd.DataFrame:
+    """
+    Extracts the truck files for a date and hour partition, by default the current one,
+    either to disk or straight into memory depending on the --stream flag,
+    and returns the cleaned truck data
+    """
+    path_to_download = args.path
+    extract_options = {'max_workers': args.concurrency, 'force_refresh': args.force_refresh}
+    if partition is not None:
+        path_to_download = get_partition_path(*partition)
+        extract_options.update({'valid_date': partition[0], 'valid_time': partition[1]})
+        logger.info('Extracting partition %s...', get_partition_name(partition))
+
+    if args.stream:
+        extract_results = stream_files_from_bucket(
+            boto_client, BUCKET_NAME, VALID_FILE_PATTERN, extract_options)
+        log_extract_results(extract_results, logger)
+        if not extract_results['download_results']:
+            return pd.DataFrame(columns=TRUCK_DATA_COLUMNS + ['truck_id'])
+        return transform_streamed_files(extract_results['download_results'], logger,
+                                        args.workers)
+
+    extract_results = extract_files_from_bucket(
+        boto_client, BUCKET_NAME, path_to_download, VALID_FILE_PATTERN, extract_options)
+    log_extract_results(extract_results, logger)
+    filenames = get_list_of_data_files(path_to_download)
+    filenames = filter_files_to_clean(
+        filenames, VALID_FILE_PATTERN_TRANSFORM)
+    if not filenames:
+        return pd.DataFrame(columns=TRUCK_DATA_COLUMNS + ['truck_id'])
+    return transform_files_from_bucket(filenames, path_to_download, logger, args.workers)
 
 
 def convert_dataframe_to_list(df_truck_data: pd.DataFrame) -> list[list[str]]:
@@ -117,55 +378,380 @@ def convert_dataframe_to_list(df_truck_data: pd.DataFrame) -> list[list[str]]:
     return df_truck_data.values.tolist()
 
 
-def get_payment_method_table(conn: pymysql.connections.Connection):
+def generate_transaction_batches(truck_data: pd.DataFrame,
+                                 batch_size: int) -> Iterator[pd.DataFrame]:
+    """Yields the truck data one batch of rows at a time"""
+    for start in range(0, len(truck_data), batch_size):
+        yield truck_data.iloc[start:start + batch_size]
+
+
+@instrument_stage('load.executemany', lambda result: {'rows_out': result[0]})
+def upload_transaction_batch(conn: pymysql.connections.Connection,
+                             transaction_batch: pd.DataFrame) -> tuple[int, float]:
     """
-    Returns the payment method table as a dictionary with key: payment_method
-    and value: payment_method_id
+    Uploads and commits a single batch of transactions along with the hourly rollup
+    totals it changes, skipping rows already loaded by the natural key.
+    Returns the number of rows inserted and the seconds it took
     """
+    start_time = perf_counter()
     with conn.cursor() as cursor:
-        cursor.execute("""SELECT payment_method_id, payment_method \
-                       FROM DIM_Payment_Method;""")
-        payment_method = cursor.fetchall()
-
-    payment_method_table = {}
-    for method in payment_method:
-        payment_method_table[method['payment_method']
-                             ] = method['payment_method_id']
-    return payment_method_table
-
-
-def replace_payment_method_with_id_in_column(
-        transaction_data: list[list[str]], payment_table_name: dict) -> list[list[str]]:
-    """Replaces the payment method with the corresponding id in data"""
-    for row in transaction_data:
-        payment_method = row[1]
-        if payment_table_name.get(payment_method) is not None:
-            row[1] = payment_table_name.get(payment_method)
-    return transaction_data
-
-
-def upload_transaction_data(conn: pymysql.connections.Connection,
-                            transaction_data: list[list[str]],
-                            number_of_rows_to_insert: int) -> None:
-    """Uploads transaction data to the database."""
+        sql_query = """INSERT INTO FACT_Transaction \
+            (event_at, payment_method_id, total_price, truck_id, transaction_sequence)
+        VALUES (%s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE transaction_id = transaction_id;"""
+        rows_inserted = cursor.executemany(sql_query,
+                                           convert_dataframe_to_list(transaction_batch))
+    update_hourly_rollup_for_data(conn, transaction_batch)
+    conn.commit()
+    return rows_inserted, perf_counter() - start_time
+
+
+def load_cleaned_truck_data(conn: pymysql.connections.Connection,
+                            cleaned_truck_data: pd.DataFrame,
+                            number_of_rows_to_insert: int,
+                            batch_size: int = BATCH_SIZE,
+                            logger: logging.Logger = None) -> str:
+    """
+    Uploads the cleaned data in batches, replacing each payment method with its id
+    and committing after every batch so a failure only loses the current batch.
+    Re-running a load only inserts the rows that were not committed before
+    """
+    if number_of_rows_to_insert == 0:
+        raise ValueError(
+            'Invalid number of rows to insert: value cannot be zero.')
+    if batch_size < 1:
+        raise ValueError('Invalid batch size: value must be at least one.')
+
+    cleaned_truck_data = add_transaction_sequence(cleaned_truck_data).head(
+        number_of_rows_to_insert)
+    check_truck_ids_are_known(conn, cleaned_truck_data)
+    cleaned_truck_data = replace_payment_method_with_id_in_column(
+        cleaned_truck_data, get_payment_method_table(conn))
+    rows_inserted = 0
+    for batch_number, transaction_batch in enumerate(
+            generate_transaction_batches(cleaned_truck_data, batch_size), start=1):
+        batch_rows_inserted, seconds = upload_transaction_batch(conn, transaction_batch)
+        rows_inserted += batch_rows_inserted
+        if logger is not None:
+            logger.info('Uploaded batch %s: %s rows in %.2fs (%.0f rows/s)', batch_number,
+                        len(transaction_batch), seconds,
+                        len(transaction_batch) / max(seconds, 1e-9))
+    return get_upload_status(rows_inserted, len(cleaned_truck_data))
+
+
+def get_upload_status(rows_inserted: int, rows_to_insert: int) -> str:
+    """Returns a message with the number of rows uploaded and skipped as already loaded"""
+    return f'Successfully uploaded {rows_inserted} of transaction rows into the database, ' \
+        f'skipping {rows_to_insert - rows_inserted} already loaded.'
+
+
+def load_cleaned_truck_data_from_file(conn: pymysql.connections.Connection,
+                                      cleaned_truck_data: pd.DataFrame,
+                                      number_of_rows_to_insert: int,
+                                      logger: logging.Logger = None) -> str:
+    """
+    Uploads the cleaned data in a single LOAD DATA LOCAL INFILE statement
+    via a temporary tab separated file, which is removed afterwards, and updates
+    the hourly rollup in the same transaction. Rows already loaded are skipped by the natural key
+    """
     if number_of_rows_to_insert == 0:
         raise ValueError(
             'Invalid number of rows to insert: value cannot be zero.')
 
-    if number_of_rows_to_insert <= len(transaction_data):
-        transaction_data = transaction_data[:number_of_rows_to_insert]
+    cleaned_truck_data = add_transaction_sequence(cleaned_truck_data).head(
+        number_of_rows_to_insert)
+    check_truck_ids_are_known(conn, cleaned_truck_data)
+    payment_method_table = get_payment_method_table(conn)
+    with NamedTemporaryFile(suffix='.tsv', delete=False) as temporary_file:
+        path_to_load = temporary_file.name
+    try:
+        with measure_stage('load.write_tsv', len(cleaned_truck_data)) as stage:
+            write_transaction_data_to_tsv(cleaned_truck_data, payment_method_table, path_to_load)
+            stage['bytes'] = getsize(path_to_load)
+        start_time = perf_counter()
+        with measure_stage('load.load_data', len(cleaned_truck_data)) as stage:
+            rows_inserted = upload_transaction_data_from_tsv(conn, path_to_load)
+            update_hourly_rollup_for_data(conn, cleaned_truck_data)
+            conn.commit()
+            stage['rows_out'] = rows_inserted
+        seconds = perf_counter() - start_time
+    finally:
+        remove(path_to_load)
+
+    if logger is not None:
+        logger.info('Loaded %s rows in %.2fs (%.0f rows/s)', rows_inserted, seconds,
+                    rows_inserted / max(seconds, 1e-9))
+    return get_upload_status(rows_inserted, len(cleaned_truck_data))
+
+
+@instrument_stage('load')
+def load_rows_with_engine(conn: pymysql.connections.Connection,
+                          cleaned_truck_data: pd.DataFrame, number_of_rows_to_insert: int,
+                          args: Namespace, logger: logging.Logger = None) -> str:
+    """Uploads up to the given number of cleaned rows with the load engine in the arguments"""
+    if args.engine == 'load-data':
+        return load_cleaned_truck_data_from_file(
+            conn, cleaned_truck_data, number_of_rows_to_insert, logger)
+    return load_cleaned_truck_data(conn, cleaned_truck_data, number_of_rows_to_insert,
+                                   args.batch_size, logger)
+
+
+def export_analytics_snapshot(conn: pymysql.connections.Connection,
+                              loaded_truck_data: pd.DataFrame,
+                              logger: logging.Logger = None) -> None:
+    """
+    Exports the hourly totals changed by the loaded data for the dashboard
+    when ANALYTICS_SNAPSHOT_PATH is set. The load has already been committed, so a failed
+    export is logged rather than raised, and its hours are exported by the next run
+    """
+    snapshot_path = environ.get('ANALYTICS_SNAPSHOT_PATH')
+    if not snapshot_path:
+        return
+    try:
+        snapshot_name = export_hourly_rollup_snapshot(conn, loaded_truck_data, snapshot_path)
+    except (OSError, pymysql.Error) as err:
+        if logger is not None:
+            logger.error('Could not export hourly totals to %s, '
+                         'they will be exported by the next run: %s', snapshot_path, err)
+        return
+    if logger is not None:
+        logger.info('Exported hourly totals to %s/%s', snapshot_path, snapshot_name)
+
+
+def load_truck_data_with_engine(conn: pymysql.connections.Connection,
+                                cleaned_truck_data: pd.DataFrame, args: Namespace,
+                                logger: logging.Logger = None) -> str:
+    """
+    Uploads the cleaned data with the load engine chosen in the arguments, then exports
+    the hourly totals it changed for the dashboard
+    """
+    upload_status = load_rows_with_engine(conn, cleaned_truck_data, args.number, args, logger)
+    export_analytics_snapshot(conn, cleaned_truck_data, logger)
+    return upload_status
+
+
+@instrument_stage('transform')
+def transform_streamed_file(stream_result: dict) -> pd.DataFrame:
+    """
+    Returns the data of a single truck file read into memory without invalid totals
+    or timezones, ready for its extreme values to be corrected
+    """
+    return load_and_prepare_truck_data_file(stream_result['buffer'], stream_result['key'])
+
+
+@instrument_stage('transform')
+def transform_streamed_file_in_pool(executor: ProcessPoolExecutor,
+                                    stream_result: dict) -> pd.DataFrame:
+    """
+    Returns the data of a single truck file read into memory, prepared in a worker process,
+    and adds the stages measured there to this process's totals
+    """
+    prepared_truck_data, stage_totals = executor.submit(
+        prepare_truck_data_file_in_worker, stream_result['buffer'], stream_result['key']).result()
+    merge_stage_totals(stage_totals)
+    return prepared_truck_data
+
+
+@contextmanager
+def create_streamed_file_transformer(workers: int) -> Iterator[Callable[[dict], pd.DataFrame]]:
+    """
+    Yields the function the overlapped transform stage prepares each file with,
+    which hands the file to a pool of worker processes when there is more than one worker
+    """
+    if workers <= 1:
+        yield transform_streamed_file
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield partial(transform_streamed_file_in_pool, executor)
+
+
+def create_overlapped_load_state(rows_to_load: int) -> dict:
+    """
+    Returns the state of the overlapped load stage: the rows left to load, the rows
+    loaded so far, the rows with extreme totals held back and every normal total seen
+    """
+    return {'rows_left': rows_to_load, 'loaded_data': [], 'held_back_data': [],
+            'normal_totals': set()}
+
+
+def load_overlapped_rows(load_rows: Callable[[pd.DataFrame], None], load_state: dict,
+                         cleaned_truck_data: pd.DataFrame) -> None:
+    """
+    Loads cleaned rows until --number rows have been loaded, and keeps the
+    transactions loaded for the analytics snapshot and the transaction sequence
+    """
+    rows_to_insert = min(len(cleaned_truck_data), load_state['rows_left'])
+    if rows_to_insert <= 0:
+        return
+    load_rows(cleaned_truck_data.head(rows_to_insert))
+    load_state['rows_left'] -= rows_to_insert
+    load_state['loaded_data'].append(
+        cleaned_truck_data.head(rows_to_insert)[TRANSACTION_KEY_COLUMNS])
+
+
+def load_overlapped_batch(load_rows: Callable[[pd.DataFrame], None], load_state: dict,
+                          prepared_truck_data: pd.DataFrame) -> None:
+    """
+    Cleans and loads a batch of whole prepared truck files, holding back the rows with
+    extreme totals, since they are corrected against the prices of every truck file
+    """
+    load_state['normal_totals'] |= get_normal_totals(prepared_truck_data['total'])
+    is_extreme = get_extreme_total_mask(prepared_truck_data['total'])
+    load_state['held_back_data'].append(prepared_truck_data[is_extreme])
+    load_overlapped_rows(load_rows, load_state,
+                         finish_cleaning_truck_data(prepared_truck_data[~is_extreme].copy(), set()))
+
+
+def load_held_back_extreme_rows(load_rows: Callable[[pd.DataFrame], None],
+                                load_state: dict) -> None:
+    """
+    Corrects the held back extreme totals against the normal totals of every file and
+    loads them, numbering each after the identical transactions already loaded
+    """
+    held_back_data = [truck_data for truck_data in load_state['held_back_data']
+                      if not truck_data.empty]
+    if not held_back_data:
+        return
+    fixed_truck_data = finish_cleaning_truck_data(
+        combine_transaction_data_files(held_back_data), load_state['normal_totals'])
+    loaded_truck_data = pd.concat(load_state['loaded_data']) if load_state['loaded_data'] \
+        else None
+    load_overlapped_rows(load_rows, load_state,
+                         add_transaction_sequence(fixed_truck_data, loaded_truck_data))
+
+
+def load_rows_and_log(conn: pymysql.connections.Connection, args: Namespace,
+                      logger: logging.Logger, cleaned_truck_data: pd.DataFrame) -> None:
+    """Uploads every cleaned row with the load engine in the arguments and logs the status"""
+    logger.info(load_rows_with_engine(conn, cleaned_truck_data, len(cleaned_truck_data),
+                                      args, logger))
+
+
+def run_overlapped_pipeline(boto_client: client, args: Namespace,
+                            logger: logging.Logger) -> dict:
+    """
+    Streams the current partition's truck files from S3 and cleans and loads them as
+    overlapping stages: each file is cleaned as soon as it arrives and whole files are
+    loaded once they add up to --batch-size rows, while the rest are still downloading.
+    Rows with extreme totals are loaded last, once every file's prices are known.
+    Returns the counts and load wait of the overlapped stages
+    """
+    files_to_stream, listing_stats = list_files_to_stream(
+        boto_client, BUCKET_NAME, VALID_FILE_PATTERN, get_extract_options())
+    logger.info(summarise_listing_stats(listing_stats))
+    logger.info('Extracting, cleaning and loading %s files as overlapping stages...',
+                len(files_to_stream))
+
+    load_state = create_overlapped_load_state(args.number)
+    stage_stats = {}
+    with pooled_connection(local_infile=args.engine == 'load-data') as conn, \
+            create_streamed_file_transformer(args.workers) as transform_file:
+        load_rows = partial(load_rows_and_log, conn, args, logger)
+        try:
+            stage_stats = run_overlapped_stages(
+                files_to_stream,
+                instrument_stage('extract', lambda result: {'bytes': result['bytes']})(
+                    partial(stream_truck_data_file, boto_client, bucket_name=BUCKET_NAME)),
+                transform_file,
+                partial(load_overlapped_batch, load_rows, load_state),
+                {'extract_workers': args.concurrency, 'transform_workers': args.workers,
+                 'queue_size': args.queue_size, 'batch_rows': args.batch_size})
+            load_held_back_extreme_rows(load_rows, load_state)
+            logger.info('Overlapped stages: %s', stage_stats)
+            if load_state['loaded_data']:
+                export_analytics_snapshot(conn, pd.concat(load_state['loaded_data']), logger)
+        except ValueError as err:
+            logger.error(err)
+    log_database_stats(logger)
+    return stage_stats
+
+
+def log_database_stats(logger: logging.Logger) -> None:
+    """Logs how often the dimension cache and connection pool were reused"""
+    logger.info('Dimension cache: %s', get_dimension_cache_stats())
+    logger.info('Database connections: %s', get_connection_stats())
+
+
+def load_backfill_partition(conn: pymysql.connections.Connection, partition: tuple[str, int],
+                            cleaned_truck_data: pd.DataFrame, args: Namespace,
+                            logger: logging.Logger) -> None:
+    """Uploads the cleaned data of a backfilled partition and records it in the checkpoint"""
+    if cleaned_truck_data.empty:
+        logger.info('No truck data found for %s', get_partition_name(partition))
     else:
-        number_of_rows_to_insert = len(transaction_data)
+        logger.info(load_truck_data_with_engine(conn, cleaned_truck_data, args, logger))
 
-    with conn.cursor() as cursor:
-        sql_query = """INSERT INTO FACT_Transaction \
-            (event_at, payment_method_id, total_price, truck_id)
-        VALUES (%s, %s, %s, %s);"""
-        cursor.executemany(sql_query, tuple(transaction_data))
+    completed_partitions = load_backfill_checkpoint(args.checkpoint)
+    completed_partitions.add(get_partition_name(partition))
+    write_backfill_checkpoint(completed_partitions, args.checkpoint)
 
-    conn.commit()
-    return \
-        f'Successfully uploaded {number_of_rows_to_insert} of transaction rows into the database.'
+
+def run_backfill(boto_client: client, args: Namespace, logger: logging.Logger) -> None:
+    """
+    Processes every date/hour partition between --from and --to, skipping those in
+    the checkpoint. Partitions are extracted and transformed a bounded number at a time,
+    then loaded and checkpointed one by one in order so a failed backfill can be resumed
+    """
+    partitions = get_partitions_between(args.from_date, args.to_date or datetime.now())
+    partitions_to_run = filter_completed_partitions(
+        partitions, load_backfill_checkpoint(args.checkpoint))
+    logger.info('Backfilling %s of %s partitions...', len(partitions_to_run), len(partitions))
+
+    with pooled_connection(local_infile=args.engine == 'load-data') as conn, \
+            ThreadPoolExecutor(max_workers=args.backfill_concurrency) as executor:
+        pending_partitions = deque()
+        for partition in partitions_to_run:
+            pending_partitions.append((partition, executor.submit(
+                extract_and_transform, boto_client, args, logger, partition)))
+            if len(pending_partitions) >= args.backfill_concurrency:
+                completed_partition, future = pending_partitions.popleft()
+                load_backfill_partition(conn, completed_partition, future.result(),
+                                        args, logger)
+        while pending_partitions:
+            completed_partition, future = pending_partitions.popleft()
+            load_backfill_partition(conn, completed_partition, future.result(),
+                                    args, logger)
+    logger.info('Successfully backfilled %s partitions.', len(partitions_to_run))
+    log_database_stats(logger)
+
+
+def run_pipeline(boto_client: client, args: Namespace, logger: logging.Logger) -> dict:
+    """
+    Runs a backfill, the overlapped stages or a single extract, transform and load
+    depending on the arguments, returning any details of the run for its summary
+    """
+    # BACKFILL
+    if args.from_date is not None:
+        run_backfill(boto_client, args, logger)
+        return {}
+
+    if args.overlap:
+        return {'overlapped_stages': run_overlapped_pipeline(boto_client, args, logger)}
+
+    # EXTRACT AND TRANSFORM
+    cleaned_truck_data = extract_and_transform(boto_client, args, logger)
+
+    # LOAD
+    with pooled_connection(local_infile=args.engine == 'load-data') as conn:
+        try:
+            upload_status = load_truck_data_with_engine(conn, cleaned_truck_data, args, logger)
+            logger.info(upload_status)
+        except ValueError as err:
+            logger.error(err)
+    log_database_stats(logger)
+    return {}
+
+
+def log_run_summary(run_summary: dict, is_logging: bool, logger: logging.Logger) -> None:
+    """
+    Logs the time and rows of each stage, slowest first, and when logging to a file
+    appends the whole run summary to the JSON lines file next to it
+    """
+    for stage_summary in summarise_stage_totals(run_summary['stages']):
+        logger.info('Stage %s', stage_summary)
+    if is_logging:
+        write_run_summary(run_summary)
+        logger.info('Wrote the run summary to %s', RUN_SUMMARY_PATH)
 
 
 def main():
@@ -182,33 +768,27 @@ def main():
     logger = setup_log_handler(
         args.log, logger, formatter)
 
-    # EXTRACT
     s3_client = create_boto_client()
-    download_status = extract_files_from_bucket(s3_client, BUCKET_NAME,
-                                                args.path, VALID_FILE_PATTERN)
-    logger.info(download_status)
-    filenames = get_list_of_data_files(args.path)
-    filenames = filter_files_to_clean(
-        filenames, VALID_FILE_PATTERN_TRANSFORM)
-
-    # TRANSFORM
-    cleaned_truck_data = transform_files_from_bucket(
-        filenames, args.path, logger)
-    cleaned_truck_data = convert_dataframe_to_list(cleaned_truck_data)
-
-    # LOAD
-    conn = get_connection()
+    if args.trace_memory:
+        tracemalloc.start()
+    profiler = start_profiler() if args.profile else None
+    if profiler is not None and (args.overlap or args.workers > 1):
+        logger.warning('Only the main thread is profiled, so the cleaning done by -o threads '
+                       'and -w worker processes is not in the profile')
+    started_at, start_time = datetime.now(), perf_counter()
+    run_details = {}
     try:
-        payment_method_table = get_payment_method_table(conn)
-        transaction_data = replace_payment_method_with_id_in_column(
-            cleaned_truck_data, payment_method_table)
-        upload_status = upload_transaction_data(
-            conn, transaction_data, args.number)
-        logger.info(upload_status)
-    except ValueError as err:
-        logger.error(err)
+        run_details = run_pipeline(s3_client, args, logger)
     finally:
-        conn.close()
+        if profiler is not None:
+            logger.info('Wrote a profile of the run to %s, slowest functions:\n%s',
+                        PROFILE_PATH, write_profile(profiler))
+        log_run_summary(create_run_summary(
+            started_at, perf_counter() - start_time,
+            {'arguments': vars(args), 'dimension_cache': get_dimension_cache_stats(),
+             'database_connections': get_connection_stats()} | run_details),
+            args.log, logger)
+        close_all_connections()
 
 
 if __name__ == '__main__':
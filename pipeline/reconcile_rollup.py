@@ -0,0 +1,110 @@
+"""Module that checks the AGG_Truck_Hourly rollup still matches FACT_Transaction"""
+import sys
+from argparse import ArgumentParser
+from datetime import datetime, timedelta
+import pandas as pd
+import pymysql
+from dotenv import load_dotenv
+from database_connection import pooled_connection
+from load import update_hourly_rollup
+
+DAYS_TO_RECONCILE = 7
+HOURLY_TOTAL_KEYS = ['event_hour', 'truck_id', 'payment_method_id']
+PROFIT_TOLERANCE = 0.01
+
+
+def get_argument_parser() -> ArgumentParser:
+    """Returns a parser for arguments given in command line"""
+    parser = ArgumentParser(prog='Rollup Reconciliation Script',
+                            description='Compares AGG_Truck_Hourly with FACT_Transaction.')
+    parser.add_argument('--from', dest='from_date',
+                        help='the first date or datetime to check, defaults to a week ago',
+                        type=datetime.fromisoformat,
+                        default=datetime.now() - timedelta(days=DAYS_TO_RECONCILE))
+    parser.add_argument('--to', dest='to_date',
+                        help='the date or datetime to check up to, defaults to now',
+                        type=datetime.fromisoformat, default=datetime.now())
+    parser.add_argument('-r', '--rebuild',
+                        help='when flagged, recomputes the rollup for the range if it has drifted',
+                        action='store_true')
+    return parser
+
+
+def get_hourly_totals(conn: pymysql.connections.Connection, sql_query: str,
+                      start: datetime, end: datetime) -> pd.DataFrame:
+    """Returns the hourly totals from a query between start and end"""
+    with conn.cursor() as cursor:
+        cursor.execute(sql_query, (start, end))
+        hourly_totals = pd.DataFrame(cursor.fetchall(), columns=HOURLY_TOTAL_KEYS + [
+            'total_transactions', 'total_profits'])
+    return hourly_totals.astype({'event_hour': 'datetime64[ns]', 'total_transactions': int,
+                                 'total_profits': float})
+
+
+def get_fact_hourly_totals(conn: pymysql.connections.Connection,
+                           start: datetime, end: datetime) -> pd.DataFrame:
+    """Returns the hourly totals computed from FACT_Transaction between start and end"""
+    return get_hourly_totals(conn, """SELECT
+        DATE_FORMAT(event_at, '%%Y-%%m-%%d %%H:00:00') AS event_hour, truck_id,
+        payment_method_id, COUNT(*) AS total_transactions, SUM(total_price) AS total_profits
+        FROM FACT_Transaction WHERE event_at >= %s AND event_at < %s
+        GROUP BY event_hour, truck_id, payment_method_id;""", start, end)
+
+
+def get_rollup_hourly_totals(conn: pymysql.connections.Connection,
+                             start: datetime, end: datetime) -> pd.DataFrame:
+    """Returns the hourly totals stored in AGG_Truck_Hourly between start and end"""
+    return get_hourly_totals(conn, """SELECT event_hour, truck_id, payment_method_id,
+        total_transactions, total_profits
+        FROM AGG_Truck_Hourly WHERE event_hour >= %s AND event_hour < %s;""", start, end)
+
+
+def find_rollup_drift(fact_totals: pd.DataFrame, rollup_totals: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns the hours, trucks and payment methods where the rollup differs from the fact table,
+    including totals that are missing from either side
+    """
+    compared_totals = fact_totals.merge(rollup_totals, on=HOURLY_TOTAL_KEYS, how='outer',
+                                        suffixes=('_fact', '_rollup')).fillna(0)
+    has_drifted = (compared_totals['total_transactions_fact'] !=
+                   compared_totals['total_transactions_rollup']) | \
+        ((compared_totals['total_profits_fact'] -
+          compared_totals['total_profits_rollup']).abs() > PROFIT_TOLERANCE)
+    return compared_totals[has_drifted].sort_values(HOURLY_TOTAL_KEYS)
+
+
+def rebuild_hourly_rollup(conn: pymysql.connections.Connection,
+                          start: datetime, end: datetime) -> None:
+    """Replaces the rollup between start and end with totals recomputed from the fact table"""
+    with conn.cursor() as cursor:
+        cursor.execute('DELETE FROM AGG_Truck_Hourly WHERE event_hour >= %s AND event_hour < %s;',
+                       (start, end))
+    update_hourly_rollup(conn, start, end)
+    conn.commit()
+
+
+def main():
+    """Prints any drift between the rollup and the fact table, exiting non-zero if found"""
+    args = get_argument_parser().parse_args()
+    start = pd.Timestamp(args.from_date).floor('h').to_pydatetime()
+    end = pd.Timestamp(args.to_date).ceil('h').to_pydatetime()
+
+    with pooled_connection() as conn:
+        drifted_totals = find_rollup_drift(get_fact_hourly_totals(conn, start, end),
+                                           get_rollup_hourly_totals(conn, start, end))
+        if drifted_totals.empty:
+            print(f'AGG_Truck_Hourly matches FACT_Transaction from {start} to {end}.')
+            return
+
+        print(f'{len(drifted_totals)} hourly totals have drifted from FACT_Transaction:')
+        print(drifted_totals.to_string(index=False))
+        if args.rebuild:
+            rebuild_hourly_rollup(conn, start, end)
+            print(f'Rebuilt AGG_Truck_Hourly from {start} to {end}.')
+            return
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    main()
@@ -0,0 +1,85 @@
+"""
+The original row by row versions of the cleaning steps in transform.py, kept as written
+as the reference that test_transform.py and benchmark_transform.py check the vectorised
+versions against
+"""
+import pandas as pd
+
+
+def validate_if_invalid_row(row_value: str) -> str:  # pylint: disable=too-many-return-statements
+    """
+    Returns the value 'None' for any invalid rows otherwise it's original value.
+    Kept as written in the original transform, so it is the reference for the vectorised one
+    """
+    # pylint: disable=superfluous-parens, duplicate-value
+    if '-' in str(row_value):
+        return 'None'
+
+    if row_value in {'0', '0.00', '0.0', '0. '}:
+        return 'None'
+
+    if (isinstance(row_value, (float, int))) and row_value in {0, 0.0, 0.00, 0.}:
+        return 'None'
+
+    if (isinstance(row_value, (float, int))):
+        return row_value
+
+    if row_value == '' or row_value.lower() == 'void' or \
+            row_value == 'NULL' or row_value == 'None':
+        return 'None'
+
+    if row_value.lower() == 'blank' \
+            or row_value == 'ERR' or '-' in row_value or row_value == 'extreme':
+        return 'None'
+
+    return row_value
+
+
+def remove_invalid_rows_from_total_column_by_row(truck_data: pd.DataFrame) -> pd.DataFrame:
+    """Removing any rows where the total column is zero, blank, NULL or VOID
+    Discarding invalid rows one row at a time"""
+    truck_data['total'] = truck_data['total'].map(validate_if_invalid_row)
+    indexes_of_invalid_columns = truck_data[truck_data['total']
+                                            == 'None'].index
+    truck_data = truck_data.drop(indexes_of_invalid_columns)
+    truck_data = truck_data.dropna()
+    return truck_data
+
+
+def is_extreme_value_and_have_normal_version(row_value: float,
+                                             valid_normal_values: list[float]) -> float:
+    """
+    Returns legitimate extreme values that could be mistyped 
+    based on other values in the truck, corrected
+    e.g: 499.0 to 4.99
+    """
+    if row_value < 50:
+        return row_value
+
+    normal_row = list(filter(lambda number: number != '.',
+                             str(row_value)))
+
+    if len(normal_row) == 3:
+        normal_row.insert(0, '0')
+
+    normal_row.insert(1, '.')
+    normal_row.pop(-1)
+    normal_row = ''.join(normal_row)
+    if normal_row in valid_normal_values:
+        return normal_row
+    return None
+
+
+def fix_extreme_values_that_have_a_normal_version_by_row(
+        truck_data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns a dataframe with corrected or removed extreme values, one row at a time.
+    Kept as written in the original transform, so it is the reference for the vectorised one
+    """
+    normal_values = list(truck_data['total'].unique())
+    valid_normal_values = list(
+        filter(lambda val: 0 < float(val) < 50, normal_values))
+
+    truck_data['total'] = truck_data['total'].map(
+        lambda row: is_extreme_value_and_have_normal_version(float(row), valid_normal_values))
+    return truck_data
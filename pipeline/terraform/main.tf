@@ -62,6 +62,10 @@ resource "aws_ecs_task_definition" "task" {
             {
                 name = "aws_access_key_id"
                 value = var.aws_access_key_id
+            },
+            {
+                name = "ANALYTICS_SNAPSHOT_PATH"
+                value = var.ANALYTICS_SNAPSHOT_PATH
             }]
         portMappings = [
             {
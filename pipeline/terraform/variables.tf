@@ -24,4 +24,9 @@ variable "aws_access_key_id" {
 
 variable "aws_secret_access_key" {
   type=string
-}
\ No newline at end of file
+}
+
+variable "ANALYTICS_SNAPSHOT_PATH" {
+  type=string
+  default=""
+}
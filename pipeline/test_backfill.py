@@ -0,0 +1,101 @@
+"""Tests for the backfill partitions and checkpoint in backfill.py, and resuming a backfill"""
+import logging
+from argparse import Namespace
+from contextlib import contextmanager
+from datetime import date, datetime
+import pandas as pd
+import pytest
+from backfill import parse_backfill_bound, get_partitions_between, load_backfill_checkpoint, \
+    write_backfill_checkpoint, filter_completed_partitions
+import pipeline
+
+
+def test_a_plain_date_end_covers_the_whole_day():
+    """Every partition of the last day is included when --to is a date"""
+    assert get_partitions_between(parse_backfill_bound('2025-03-24'),
+                                  parse_backfill_bound('2025-03-25')) == [
+        ('2025-3/24', 12), ('2025-3/24', 15), ('2025-3/24', 18), ('2025-3/24', 21),
+        ('2025-3/25', 12), ('2025-3/25', 15), ('2025-3/25', 18), ('2025-3/25', 21)]
+
+
+@pytest.mark.parametrize('end, last_partition', [
+    ('2025-03-25T15:00', ('2025-3/25', 15)), ('2025-03-25T14:59', ('2025-3/25', 12)),
+    ('2025-03-25T00:00', ('2025-3/24', 21)), ('2025-03-25', ('2025-3/25', 21))])
+def test_a_datetime_end_stops_at_that_time(end, last_partition):
+    """A datetime ends the backfill at that time, even at midnight, while a date does not"""
+    assert get_partitions_between(datetime(2025, 3, 24, 13),
+                                  parse_backfill_bound(end))[-1] == last_partition
+
+
+def test_a_datetime_start_skips_the_earlier_hours():
+    """Partitions before a --from datetime are left out"""
+    assert get_partitions_between(parse_backfill_bound('2025-03-24T16:00'),
+                                  date(2025, 3, 24)) == [('2025-3/24', 18), ('2025-3/24', 21)]
+
+
+def test_the_partitions_cross_months_without_padding():
+    """The dates are formatted like the S3 keys, e.g. 2025-4/1 rather than 2025-04-01"""
+    assert get_partitions_between(datetime(2025, 3, 31, 21), datetime(2025, 4, 1, 12)) == [
+        ('2025-3/31', 21), ('2025-4/1', 12)]
+
+
+def test_an_end_before_the_start_has_no_partitions():
+    """An empty range backfills nothing"""
+    assert not get_partitions_between(date(2025, 3, 25), date(2025, 3, 24))
+
+
+def test_completed_partitions_in_the_checkpoint_are_skipped(tmp_path):
+    """Partitions recorded in the checkpoint are filtered out, keeping the rest in order"""
+    checkpoint_path = str(tmp_path / 'backfill_checkpoint.json')
+    assert load_backfill_checkpoint(checkpoint_path) == set()
+    write_backfill_checkpoint({'2025-3/24/12', '2025-3/24/18'}, checkpoint_path)
+
+    assert filter_completed_partitions(
+        get_partitions_between(date(2025, 3, 24), date(2025, 3, 24)),
+        load_backfill_checkpoint(checkpoint_path)) == [('2025-3/24', 15), ('2025-3/24', 21)]
+
+
+def test_a_failed_backfill_resumes_after_the_partitions_it_completed(tmp_path, monkeypatch):
+    """
+    Partitions are checkpointed in order as they load, so running the same backfill
+    again after a failure only extracts and loads the partitions that did not finish
+    """
+    extracted_partitions, loaded_partitions = [], []
+    failing_partition = {'name': '2025-3/24/18'}
+
+    def extract_and_transform(_boto_client, _args, _logger, partition):
+        extracted_partitions.append(partition)
+        return pd.DataFrame({'partition': [f'{partition[0]}/{partition[1]}']})
+
+    def load_truck_data_with_engine(_conn, cleaned_truck_data, _args, _logger):
+        partition_name = cleaned_truck_data['partition'].iloc[0]
+        if partition_name == failing_partition['name']:
+            raise OSError(f'Lost connection while loading {partition_name}')
+        loaded_partitions.append(partition_name)
+        return f'Loaded {partition_name}'
+
+    @contextmanager
+    def pooled_connection(local_infile):  # pylint: disable=unused-argument
+        yield None
+
+    monkeypatch.setattr(pipeline, 'extract_and_transform', extract_and_transform)
+    monkeypatch.setattr(pipeline, 'load_truck_data_with_engine', load_truck_data_with_engine)
+    monkeypatch.setattr(pipeline, 'pooled_connection', pooled_connection)
+    args = Namespace(from_date=date(2025, 3, 24), to_date=date(2025, 3, 25),
+                     checkpoint=str(tmp_path / 'backfill_checkpoint.json'),
+                     engine='batch', backfill_concurrency=2)
+    logger = logging.getLogger(__name__)
+
+    with pytest.raises(OSError):
+        pipeline.run_backfill(None, args, logger)
+    assert loaded_partitions == ['2025-3/24/12', '2025-3/24/15']
+    assert load_backfill_checkpoint(args.checkpoint) == {'2025-3/24/12', '2025-3/24/15'}
+
+    extracted_partitions.clear()
+    failing_partition['name'] = None
+    pipeline.run_backfill(None, args, logger)
+    assert extracted_partitions == [('2025-3/24', 18), ('2025-3/24', 21), ('2025-3/25', 12),
+                                    ('2025-3/25', 15), ('2025-3/25', 18), ('2025-3/25', 21)]
+    assert loaded_partitions == [f'2025-3/{day}/{hour}' for day in [24, 25]
+                                 for hour in [12, 15, 18, 21]]
+    assert len(load_backfill_checkpoint(args.checkpoint)) == 8
@@ -0,0 +1,230 @@
+"""
+Tests for the bucket listing, download manifest and concurrent S3 downloads in extract.py,
+using a fake boto client
+"""
+from io import BytesIO
+from threading import Lock
+from time import sleep
+from typing import Iterator
+import pytest
+import extract
+from extract import download_truck_data_files_concurrently, \
+    stream_truck_data_files_concurrently, summarise_download_results, \
+    list_valid_objects_by_prefix, get_prefix_for_date, load_download_manifest, \
+    write_download_manifest, filter_files_not_in_manifest, record_downloads_in_manifest, \
+    VALID_FILE_PATTERN
+
+BUCKET_NAME = 'test-bucket'
+TRUCK_FILES = {f'trucks/2025-3/24/12/T3_T{truck_id}_L1.csv': b'x' * (100 * truck_id)
+               for truck_id in range(1, 7)}
+OTHER_FILES = {'trucks/2025-3/24/12/T3_T1_L1.json': b'{}',
+               'trucks/2025-3/24/15/T3_T1_L1.csv': b'x',
+               'trucks/2025-3/24/1/T3_T1_L1.csv': b'x'}
+
+
+class FakePaginator:  # pylint: disable=too-few-public-methods
+    """Lists the keys under a prefix in sorted pages, like boto3's list_objects_v2 paginator"""
+
+    def __init__(self, fake_client: 'FakeS3Client'):
+        self.fake_client = fake_client
+
+    def paginate(self, Bucket: str, Prefix: str = '') -> Iterator[dict]:  # pylint: disable=invalid-name
+        """Yields each page of keys, with no Contents when nothing matches the prefix"""
+        assert Bucket == BUCKET_NAME
+        keys = sorted(key for key in TRUCK_FILES | OTHER_FILES if key.startswith(Prefix))
+        page_size = self.fake_client.keys_per_page
+        for start in range(0, max(len(keys), 1), page_size):
+            page_keys = keys[start:start + page_size]
+            if not page_keys:
+                yield {'KeyCount': 0}
+                continue
+            yield {'KeyCount': len(page_keys), 'Contents': [
+                {'Key': key, 'ETag': f'"etag-{key}"', 'Size': len((TRUCK_FILES | OTHER_FILES)[key])}
+                for key in page_keys]}
+
+
+class FakeS3Client:
+    """Serves TRUCK_FILES like boto3, recording how many requests run at the same time"""
+
+    def __init__(self, failing_keys: set[str] = None, seconds_per_request: float = 0.02,
+                 keys_per_page: int = 1000):
+        self.failing_keys = failing_keys or set()
+        self.keys_per_page = keys_per_page
+        self.seconds_per_request = seconds_per_request
+        self.lock = Lock()
+        self.active_requests = 0
+        self.max_active_requests = 0
+        self.finished_keys = []
+
+    def request_file(self, key: str) -> bytes:
+        """Returns a file's contents after a delay, or raises if it is set to fail"""
+        with self.lock:
+            self.active_requests += 1
+            self.max_active_requests = max(self.max_active_requests, self.active_requests)
+        try:
+            sleep(self.seconds_per_request)
+            if key in self.failing_keys:
+                raise OSError(f'Could not download {key}')
+            return TRUCK_FILES[key]
+        finally:
+            with self.lock:
+                self.active_requests -= 1
+                self.finished_keys.append(key)
+
+    def download_file(self, bucket_name: str, key: str, filename: str) -> None:
+        """Writes a file to disk like boto3's download_file"""
+        assert bucket_name == BUCKET_NAME
+        contents = self.request_file(key)
+        with open(filename, 'wb') as downloaded_file:
+            downloaded_file.write(contents)
+
+    def get_paginator(self, operation_name: str) -> FakePaginator:
+        """Returns a paginator for listing the bucket"""
+        assert operation_name == 'list_objects_v2'
+        return FakePaginator(self)
+
+    def get_object(self, Bucket: str, Key: str) -> dict:  # pylint: disable=invalid-name
+        """Returns a file's body like boto3's get_object"""
+        assert Bucket == BUCKET_NAME
+        return {'Body': BytesIO(self.request_file(Key))}
+
+
+def test_download_writes_every_file_and_sizes_it(tmp_path):
+    """Each file is written to the path with its key, size and timing, ordered by key"""
+    download_results = download_truck_data_files_concurrently(
+        FakeS3Client(), list(TRUCK_FILES), BUCKET_NAME, str(tmp_path), max_workers=3)
+
+    assert [result['key'] for result in download_results] == sorted(TRUCK_FILES)
+    for result in download_results:
+        filename = result['key'].split('/')[-1]
+        assert (tmp_path / filename).read_bytes() == TRUCK_FILES[result['key']]
+        assert result['bytes'] == len(TRUCK_FILES[result['key']])
+        assert result['seconds'] >= 0
+
+
+@pytest.mark.parametrize('max_workers', [1, 2, 4])
+def test_download_never_exceeds_max_workers(tmp_path, max_workers):
+    """No more than max_workers requests run at once, and the pool is actually used"""
+    fake_client = FakeS3Client()
+    download_truck_data_files_concurrently(
+        fake_client, list(TRUCK_FILES), BUCKET_NAME, str(tmp_path), max_workers)
+    assert fake_client.max_active_requests == max_workers
+
+
+def test_download_rejects_fewer_than_one_worker(tmp_path):
+    """A pool needs at least one worker"""
+    with pytest.raises(ValueError):
+        download_truck_data_files_concurrently(
+            FakeS3Client(), list(TRUCK_FILES), BUCKET_NAME, str(tmp_path), max_workers=0)
+
+
+def test_download_finishes_every_file_before_raising_the_first_error(tmp_path):
+    """A failed download does not cancel the others, and its error is raised afterwards"""
+    failing_key = sorted(TRUCK_FILES)[0]
+    fake_client = FakeS3Client(failing_keys={failing_key})
+    with pytest.raises(OSError, match=failing_key):
+        download_truck_data_files_concurrently(
+            fake_client, list(TRUCK_FILES), BUCKET_NAME, str(tmp_path), max_workers=2)
+
+    assert sorted(fake_client.finished_keys) == sorted(TRUCK_FILES)
+    for key in TRUCK_FILES:
+        assert (tmp_path / key.split('/')[-1]).exists() == (key != failing_key)
+
+
+def test_stream_reads_every_file_into_memory():
+    """Streamed files are returned as buffers with the same sizes as their contents"""
+    stream_results = stream_truck_data_files_concurrently(
+        FakeS3Client(), list(TRUCK_FILES), BUCKET_NAME, max_workers=3)
+
+    assert [result['key'] for result in stream_results] == sorted(TRUCK_FILES)
+    for result in stream_results:
+        assert result['buffer'].read() == TRUCK_FILES[result['key']]
+        assert result['bytes'] == len(TRUCK_FILES[result['key']])
+
+
+def test_summarise_download_results_totals_bytes_and_names_slowest_file():
+    """The summary counts the files and bytes and names the slowest file"""
+    download_results = [{'key': 'a.csv', 'bytes': 100, 'seconds': 0.2},
+                        {'key': 'b.csv', 'bytes': 250, 'seconds': 0.5},
+                        {'key': 'c.csv', 'bytes': 50, 'seconds': 0.1}]
+    assert summarise_download_results(download_results) == \
+        'Successfully downloaded 3 files (400 bytes). Slowest file: b.csv in 0.5s.'
+
+
+def test_summarise_download_results_with_no_files():
+    """An empty download has no slowest file"""
+    assert summarise_download_results([]) == 'Successfully downloaded 0 files (0 bytes).'
+
+
+@pytest.mark.parametrize('keys_per_page, pages', [(1000, 1), (4, 2), (1, 7)])
+def test_listing_follows_every_page_and_keeps_only_csv_files(keys_per_page, pages):
+    """Every page under the hour's prefix is listed, and only its .csv files are kept"""
+    listing_stats = {}
+    prefix = get_prefix_for_date(VALID_FILE_PATTERN, '2025-3/24', 12)
+    listed_files = list(list_valid_objects_by_prefix(
+        FakeS3Client(keys_per_page=keys_per_page), BUCKET_NAME, prefix, VALID_FILE_PATTERN[1],
+        listing_stats))
+
+    assert [file['key'] for file in listed_files] == sorted(TRUCK_FILES)
+    assert all(file['size'] == len(TRUCK_FILES[file['key']]) for file in listed_files)
+    assert listing_stats == {'pages': pages, 'keys_scanned': 7, 'keys_matched': 6}
+
+
+def test_listing_an_hour_with_no_files():
+    """An hour with nothing uploaded yet lists one empty page"""
+    listing_stats = {}
+    prefix = get_prefix_for_date(VALID_FILE_PATTERN, '2025-3/24', 18)
+    assert not list(list_valid_objects_by_prefix(
+        FakeS3Client(), BUCKET_NAME, prefix, VALID_FILE_PATTERN[1], listing_stats))
+    assert listing_stats == {'pages': 1, 'keys_scanned': 0, 'keys_matched': 0}
+
+
+def test_manifest_is_written_whole_or_not_at_all(tmp_path, monkeypatch):
+    """A manifest that fails to write leaves the previous one in place"""
+    manifest_path = str(tmp_path / 'data-files' / 'download_manifest.json')
+    write_download_manifest({'trucks/a.csv': {'etag': '"a"', 'size': 1}}, manifest_path)
+    assert load_download_manifest(manifest_path) == {'trucks/a.csv': {'etag': '"a"', 'size': 1}}
+
+    def fail_part_way(manifest, f, **_):
+        f.write(str(manifest)[:5])
+        raise OSError('No space left on device')
+
+    monkeypatch.setattr(extract, 'dump', fail_part_way)
+    with pytest.raises(OSError):
+        write_download_manifest({'trucks/b.csv': {'etag': '"b"', 'size': 2}}, manifest_path)
+    assert load_download_manifest(manifest_path) == {'trucks/a.csv': {'etag': '"a"', 'size': 1}}
+
+
+def test_missing_manifest_is_empty(tmp_path):
+    """The first run has no manifest, so nothing is cached"""
+    assert load_download_manifest(str(tmp_path / 'download_manifest.json')) == {}
+
+
+def test_only_unchanged_files_still_on_disk_are_skipped(tmp_path):
+    """A file is downloaded again if S3 changed it, or the local copy is missing or truncated"""
+    files = [{'key': key, 'etag': '"etag"', 'size': len(contents)}
+             for key, contents in sorted(TRUCK_FILES.items())]
+    for file in files[:5]:
+        (tmp_path / file['key'].split('/')[-1]).write_bytes(TRUCK_FILES[file['key']])
+    (tmp_path / files[4]['key'].split('/')[-1]).write_bytes(b'x')
+    manifest = {file['key']: {'etag': file['etag'], 'size': file['size']} for file in files}
+    manifest[files[1]['key']]['etag'] = '"changed"'
+    manifest[files[2]['key']]['size'] += 1
+    del manifest[files[3]['key']]
+
+    files_to_download, cached_files = filter_files_not_in_manifest(files, manifest,
+                                                                   str(tmp_path))
+    assert cached_files == files[:1]
+    assert files_to_download == files[1:]
+
+
+def test_recorded_downloads_keep_the_files_already_in_the_manifest(tmp_path):
+    """Each partition's downloads are added to the manifest instead of replacing it"""
+    manifest_path = str(tmp_path / 'download_manifest.json')
+    record_downloads_in_manifest([{'key': 'trucks/a.csv', 'etag': '"a"', 'size': 1}],
+                                 manifest_path)
+    record_downloads_in_manifest([{'key': 'trucks/b.csv', 'etag': '"b"', 'size': 2},
+                                  {'key': 'trucks/a.csv', 'etag': '"a2"', 'size': 3}],
+                                 manifest_path)
+    assert load_download_manifest(manifest_path) == {
+        'trucks/a.csv': {'etag': '"a2"', 'size': 3}, 'trucks/b.csv': {'etag': '"b"', 'size': 2}}
@@ -0,0 +1,128 @@
+"""Tests for the stage measurements and run summaries in instrumentation.py"""
+import json
+from datetime import datetime
+import pandas as pd
+import pytest
+import instrumentation
+from instrumentation import measure_stage, instrument_stage, get_stage_totals, \
+    clear_stage_totals, merge_stage_totals, reset_stages_after_fork, create_run_summary, \
+    write_run_summary
+
+
+@pytest.fixture(autouse=True)
+def fixture_clear_stage_totals():
+    """Every test starts and ends with no stages measured"""
+    clear_stage_totals()
+    yield
+    clear_stage_totals()
+
+
+def test_repeated_stages_add_up_their_calls_and_rows():
+    """Every call of a stage is added to the same totals"""
+    for rows in [10, 20, 30]:
+        with measure_stage('transform', rows_in=rows) as stage:
+            stage['rows_out'] = rows - 1
+
+    totals = get_stage_totals()['transform']
+    assert (totals['calls'], totals['errors']) == (3, 0)
+    assert (totals['rows_in'], totals['rows_out']) == (60, 57)
+    assert totals['bytes'] is None
+    assert totals['seconds'] > 0
+
+
+def test_nested_stages_are_measured_separately():
+    """A stage inside another counts towards its own totals, and its time towards both"""
+    with measure_stage('transform'):
+        for _ in range(2):
+            with measure_stage('transform.clean', rows_in=5):
+                pass
+
+    stage_totals = get_stage_totals()
+    assert stage_totals['transform']['calls'] == 1
+    assert stage_totals['transform']['rows_in'] is None
+    assert stage_totals['transform.clean']['calls'] == 2
+    assert stage_totals['transform.clean']['rows_in'] == 10
+    assert stage_totals['transform']['seconds'] >= stage_totals['transform.clean']['seconds']
+
+
+def test_failed_stage_counts_an_error_and_raises():
+    """A stage that raises is still measured, as an error"""
+    with pytest.raises(ValueError):
+        with measure_stage('load'):
+            raise ValueError('Invalid number of rows to insert')
+    assert get_stage_totals()['load']['errors'] == 1
+
+
+def test_instrument_stage_counts_dataframe_rows_and_bytes():
+    """The decorator takes rows in from the arguments and rows out and bytes from the result"""
+    @instrument_stage('transform.clean')
+    def drop_first_row(truck_data: pd.DataFrame) -> pd.DataFrame:
+        return truck_data.iloc[1:]
+
+    truck_data = pd.DataFrame({'total': [4.99, 7.0, 12.5]})
+    drop_first_row(truck_data)
+    drop_first_row(truck_data=truck_data)
+
+    totals = get_stage_totals()['transform.clean']
+    assert (totals['calls'], totals['rows_in'], totals['rows_out']) == (2, 6, 4)
+    assert totals['bytes'] == 2 * truck_data.iloc[1:].memory_usage(index=False).sum()
+
+
+def test_merge_stage_totals_adds_totals_from_worker_processes():
+    """Totals sent back by workers are added to the ones measured here"""
+    with measure_stage('transform.read_csv') as stage:
+        stage['rows_out'] = 5
+    worker_totals = {
+        'transform.read_csv': {'calls': 2, 'errors': 0, 'seconds': 1.5, 'rows_in': None,
+                               'rows_out': 7, 'bytes': 100, 'peak_traced_bytes': None,
+                               'max_rss_bytes': 10 ** 12},
+        'transform.clean': {'calls': 2, 'errors': 1, 'seconds': 0.5, 'rows_in': 7,
+                            'rows_out': 6, 'bytes': None, 'peak_traced_bytes': None,
+                            'max_rss_bytes': 1}}
+    merge_stage_totals(worker_totals)
+    merge_stage_totals({'transform.clean': worker_totals['transform.clean']})
+
+    stage_totals = get_stage_totals()
+    assert stage_totals['transform.read_csv']['calls'] == 3
+    assert stage_totals['transform.read_csv']['seconds'] > 1.5
+    assert stage_totals['transform.read_csv']['rows_out'] == 12
+    assert stage_totals['transform.read_csv']['bytes'] == 100
+    assert stage_totals['transform.read_csv']['max_rss_bytes'] == 10 ** 12
+    assert stage_totals['transform.clean'] == {
+        'calls': 4, 'errors': 2, 'seconds': 1.0, 'rows_in': 14, 'rows_out': 12,
+        'bytes': None, 'peak_traced_bytes': None, 'max_rss_bytes': 1}
+    assert worker_totals['transform.clean']['calls'] == 2
+
+
+def test_reset_after_fork_replaces_a_held_lock_and_forgets_the_stages():
+    """A forked worker can measure stages even if the parent's lock was held when it forked"""
+    with measure_stage('extract'):
+        pass
+    held_lock = instrumentation.STAGE_LOCK
+    held_lock.acquire()  # pylint: disable=consider-using-with
+    try:
+        reset_stages_after_fork()
+        with measure_stage('transform'):
+            pass
+        assert list(get_stage_totals()) == ['transform']
+        assert instrumentation.STAGE_LOCK is not held_lock
+    finally:
+        held_lock.release()
+
+
+def test_write_run_summary_appends_one_json_line(tmp_path):
+    """Each run summary is a single line of JSON appended to the file"""
+    summary_path = tmp_path / 'run_summaries.jsonl'
+    with measure_stage('load', rows_in=3):
+        pass
+    for _ in range(2):
+        write_run_summary(create_run_summary(datetime(2025, 3, 24, 12), 1.23456,
+                                             {'arguments': {'workers': 2}}), str(summary_path))
+
+    summary_lines = summary_path.read_text(encoding='utf-8').splitlines()
+    assert len(summary_lines) == 2
+    run_summary = json.loads(summary_lines[0])
+    assert run_summary['started_at'] == '2025-03-24T12:00:00'
+    assert run_summary['seconds'] == 1.235
+    assert run_summary['arguments'] == {'workers': 2}
+    assert run_summary['stages']['load']['rows_in'] == 3
@@ -0,0 +1,123 @@
+"""
+Tests for loading cleaned truck data in batches with pipeline.py and for the payment
+method ids in load.py, using a fake connection that records each statement
+"""
+import pandas as pd
+import pytest
+from load import replace_payment_method_with_id_in_column
+import pipeline
+
+PAYMENT_METHOD_TABLE = {'cash': 1, 'card': 2}
+
+
+class FakeCursor:
+    """Records the statements run on a fake connection, as inserting every row"""
+
+    def __init__(self, connection: 'FakeConnection'):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def executemany(self, sql_query: str, rows: list[list]) -> int:
+        """Records a batch of inserted transactions"""
+        assert sql_query.startswith('INSERT INTO FACT_Transaction')
+        self.connection.statements.append(('insert', len(rows)))
+        self.connection.inserted_rows.extend(rows)
+        return len(rows)
+
+    def execute(self, sql_query: str, _query_parameters: list) -> int:
+        """Records a recomputed hourly rollup"""
+        assert sql_query.startswith('INSERT INTO AGG_Truck_Hourly')
+        self.connection.statements.append(('rollup', None))
+        return 1
+
+
+class FakeConnection:
+    """Stands in for a pymysql connection, keeping the inserted rows and each commit"""
+
+    def __init__(self):
+        self.statements = []
+        self.inserted_rows = []
+
+    def cursor(self) -> FakeCursor:
+        """Returns a cursor recording its statements"""
+        return FakeCursor(self)
+
+    def commit(self) -> None:
+        """Records a commit"""
+        self.statements.append(('commit', None))
+
+
+@pytest.fixture(name='conn')
+def fixture_conn(monkeypatch) -> FakeConnection:
+    """A fake connection, with every truck known and the payment methods of PAYMENT_METHOD_TABLE"""
+    monkeypatch.setattr(pipeline, 'check_truck_ids_are_known', lambda conn, truck_data: None)
+    monkeypatch.setattr(pipeline, 'get_payment_method_table', lambda conn: PAYMENT_METHOD_TABLE)
+    return FakeConnection()
+
+
+def create_cleaned_truck_data(number_of_rows: int) -> pd.DataFrame:
+    """Returns cleaned transactions with a different total on every row"""
+    return pd.DataFrame({
+        'timestamp': pd.date_range('2025-03-24 12:00', periods=number_of_rows, freq='min'),
+        'type': pd.Categorical(['cash', 'card'] * (number_of_rows // 2) +
+                               ['cash'] * (number_of_rows % 2)),
+        'total': [1.5 + row for row in range(number_of_rows)],
+        'truck_id': [1] * number_of_rows})
+
+
+@pytest.mark.parametrize('number_of_rows, batch_size, batch_rows', [
+    (7, 3, [3, 3, 1]), (6, 3, [3, 3]), (7, 7, [7]), (2, 5, [2]), (5, 1, [1] * 5)])
+def test_every_row_is_loaded_once_in_batches_of_batch_size(conn, number_of_rows, batch_size,
+                                                          batch_rows):
+    """Each batch is inserted, rolled up and committed, with the remainder in the last batch"""
+    status = pipeline.load_cleaned_truck_data(conn, create_cleaned_truck_data(number_of_rows),
+                                              number_of_rows, batch_size)
+
+    assert conn.statements == [statement for rows in batch_rows for statement in
+                               [('insert', rows), ('rollup', None), ('commit', None)]]
+    assert [row[2] for row in conn.inserted_rows] == [1.5 + row for row in range(number_of_rows)]
+    assert status == f'Successfully uploaded {number_of_rows} of transaction rows into the ' \
+        'database, skipping 0 already loaded.'
+
+
+def test_only_the_number_of_rows_asked_for_are_loaded(conn):
+    """--number cuts the rows before they are split into batches"""
+    pipeline.load_cleaned_truck_data(conn, create_cleaned_truck_data(10), 5, batch_size=2)
+    assert [rows for statement, rows in conn.statements if statement == 'insert'] == [2, 2, 1]
+
+
+def test_loaded_rows_have_payment_method_ids_and_sequences(conn):
+    """Each row is inserted with its payment method id and transaction_sequence"""
+    pipeline.load_cleaned_truck_data(conn, create_cleaned_truck_data(2), 2, batch_size=2)
+    assert [row[1] for row in conn.inserted_rows] == [1, 2]
+    assert [row[4] for row in conn.inserted_rows] == [0, 0]
+
+
+@pytest.mark.parametrize('number_of_rows, batch_size', [(0, 10), (5, 0)])
+def test_no_rows_or_batch_size_are_rejected_before_loading(conn, number_of_rows, batch_size):
+    """Nothing is inserted when there are no rows to insert or batches would be empty"""
+    with pytest.raises(ValueError):
+        pipeline.load_cleaned_truck_data(conn, create_cleaned_truck_data(5), number_of_rows,
+                                         batch_size)
+    assert not conn.statements
+
+
+def test_payment_methods_are_replaced_by_their_ids():
+    """Every known payment method becomes its DIM_Payment_Method id"""
+    truck_data = create_cleaned_truck_data(3)
+    assert replace_payment_method_with_id_in_column(
+        truck_data, PAYMENT_METHOD_TABLE)['type'].tolist() == [1, 2, 1]
+
+
+def test_unknown_payment_methods_are_counted_in_the_error():
+    """The error counts every row with an unknown method and names each method once"""
+    truck_data = create_cleaned_truck_data(6).assign(
+        type=['cash', 'bitcoin', 'card', 'voucher', 'bitcoin', 'cash'])
+    with pytest.raises(ValueError) as error:
+        replace_payment_method_with_id_in_column(truck_data, PAYMENT_METHOD_TABLE)
+    assert str(error.value) == "3 rows have unknown payment methods: ['bitcoin', 'voucher']"
@@ -0,0 +1,197 @@
+"""
+Tests for the overlapping extract, transform and load stages in overlap.py, using fast
+in-memory stages, and for the extreme rows the overlapped pipeline holds back until the end
+"""
+from functools import partial
+from io import BytesIO
+from threading import Lock, Thread, enumerate as enumerate_threads
+from time import sleep
+import pandas as pd
+import pytest
+from overlap import run_overlapped_stages
+from transform import load_and_prepare_truck_data_file, combine_transaction_data_files, \
+    finish_cleaning_truck_data, add_transaction_sequence, TRANSACTION_KEY_COLUMNS
+from pipeline import create_overlapped_load_state, load_overlapped_batch, \
+    load_held_back_extreme_rows
+
+FILES = [f'T3_T{file_number}_L1.csv' for file_number in range(1, 21)]
+SECONDS_BEFORE_HANG = 10
+
+
+def create_stage_options(**stage_options) -> dict:
+    """Returns the options of a single worker per stage, loading every file on its own"""
+    return {'extract_workers': 1, 'transform_workers': 1, 'queue_size': 2,
+            'batch_rows': 1} | stage_options
+
+
+def transform_file(file: str) -> pd.DataFrame:
+    """Returns a file as a dataframe with one row naming it"""
+    return pd.DataFrame({'file': [file]})
+
+
+def run_without_hanging(run_stages) -> Exception | None:
+    """Runs the stages on another thread, failing if they have not finished in time"""
+    outcome = {'error': None}
+
+    def run():
+        try:
+            run_stages()
+        except Exception as err:  # pylint: disable=broad-exception-caught
+            outcome['error'] = err
+
+    runner = Thread(target=run, daemon=True)
+    runner.start()
+    runner.join(SECONDS_BEFORE_HANG)
+    assert not runner.is_alive(), 'The overlapped stages hung'
+    return outcome['error']
+
+
+def test_every_file_is_loaded_in_order_with_one_worker_per_stage():
+    """Files pass through single workers in the order they were given"""
+    loaded_batches = []
+    stage_stats = run_overlapped_stages(FILES, str.upper, transform_file, loaded_batches.append,
+                                        create_stage_options())
+
+    assert [batch['file'].tolist() for batch in loaded_batches] == \
+        [[file.upper()] for file in FILES]
+    assert stage_stats['files_extracted'] == stage_stats['files_transformed'] == len(FILES)
+    assert stage_stats['rows_transformed'] == len(FILES)
+    assert stage_stats['batches_loaded'] == len(FILES)
+
+
+def test_every_file_is_loaded_once_with_several_workers_in_whole_file_batches():
+    """Several workers may reorder the files, but each is loaded once and never split"""
+    loaded_batches = []
+    run_overlapped_stages(FILES, str.upper,
+                          lambda file: pd.DataFrame({'file': [file] * 2}),
+                          loaded_batches.append,
+                          create_stage_options(extract_workers=3, transform_workers=2,
+                                               batch_rows=5))
+
+    loaded_files = pd.concat(loaded_batches)['file']
+    assert sorted(loaded_files.unique()) == sorted(file.upper() for file in FILES)
+    assert (loaded_files.value_counts() == 2).all()
+    assert all(len(batch) >= 5 for batch in loaded_batches[:-1])
+
+
+@pytest.mark.parametrize('stage_option', ['extract_workers', 'transform_workers', 'queue_size'])
+def test_stages_need_at_least_one_worker_and_queue_slot(stage_option):
+    """Stages with no workers or queue space are rejected"""
+    with pytest.raises(ValueError):
+        run_overlapped_stages(FILES, str.upper, transform_file, print,
+                              create_stage_options(**{stage_option: 0}))
+
+
+@pytest.mark.parametrize('failing_stage', ['extract', 'transform', 'load'])
+def test_an_error_mid_stream_stops_every_stage_and_is_raised(failing_stage):
+    """The first error is raised once every thread of every stage has finished"""
+    threads_before = set(enumerate_threads())
+    failing_file = FILES[len(FILES) // 2]
+
+    def fail_on(stage: str, file: str) -> None:
+        if stage == failing_stage and failing_file.upper() in file.upper():
+            raise OSError(f'Could not {stage} {file}')
+
+    def extract_file(file: str) -> str:
+        fail_on('extract', file)
+        return file
+
+    def transform_failing_file(file: str) -> pd.DataFrame:
+        fail_on('transform', file)
+        return transform_file(file)
+
+    def load_batch(truck_data: pd.DataFrame) -> None:
+        fail_on('load', truck_data['file'].iloc[0])
+
+    error = run_without_hanging(lambda: run_overlapped_stages(
+        FILES, extract_file, transform_failing_file, load_batch,
+        create_stage_options(extract_workers=2, transform_workers=2, queue_size=1)))
+
+    assert isinstance(error, OSError)
+    assert str(error) == f'Could not {failing_stage} {failing_file}'
+    assert set(enumerate_threads()) == threads_before
+
+
+def test_a_slow_load_holds_back_extraction_with_a_queue_size_of_one():
+    """Full queues make the extract stage wait, so it can only be a few files ahead"""
+    counts = {'extracted': 0, 'loaded': 0, 'most_ahead': 0}
+    lock = Lock()
+
+    def extract_file(file: str) -> str:
+        with lock:
+            counts['extracted'] += 1
+        return file
+
+    def load_slowly(truck_data: pd.DataFrame) -> None:
+        sleep(0.01)
+        with lock:
+            counts['loaded'] += len(truck_data)
+            counts['most_ahead'] = max(counts['most_ahead'],
+                                       counts['extracted'] - counts['loaded'])
+
+    run_overlapped_stages(FILES, extract_file, transform_file, load_slowly,
+                          create_stage_options(queue_size=1))
+
+    # At most one file waits in each queue and one is held by each stage's worker
+    assert counts['loaded'] == len(FILES)
+    assert counts['most_ahead'] <= 4
+
+
+def read_prepared_truck_file(filename: str, csv_rows: list[str]) -> pd.DataFrame:
+    """Returns a truck file made of the given rows, prepared as the transform stage does"""
+    return load_and_prepare_truck_data_file(
+        BytesIO('\n'.join(['timestamp,type,total', *csv_rows]).encode()), filename)
+
+
+def number_and_keep_batch(loaded_batches: list[pd.DataFrame], truck_data: pd.DataFrame) -> None:
+    """Keeps a loaded batch numbered as the loaders do, which keep any sequence it has"""
+    loaded_batches.append(add_transaction_sequence(truck_data))
+
+
+def test_held_back_extreme_rows_load_like_a_serial_run():
+    """
+    Extreme totals are corrected by prices from files loaded after them, and numbered
+    after the identical transactions already loaded, as cleaning every file at once does
+    """
+    truck_files = {
+        'T3_T1_L1.csv': ['2025-03-24 12:00:00+00:00,card,4.99',
+                         '2025-03-24 12:00:00+00:00,card,499.0',
+                         '2025-03-24 12:00:00+00:00,card,4.99',
+                         '2025-03-24 12:05:00+00:00,cash,899.0'],
+        'T3_T2_L1.csv': ['2025-03-24 12:10:00+00:00,cash,8.99',
+                         '2025-03-24 12:15:00+00:00,card,1234.56']}
+    prepared_files = [read_prepared_truck_file(filename, csv_rows)
+                      for filename, csv_rows in truck_files.items()]
+    loaded_batches = []
+    load_state = create_overlapped_load_state(rows_to_load=100)
+
+    for prepared_truck_data in prepared_files:
+        load_overlapped_batch(partial(number_and_keep_batch, loaded_batches), load_state,
+                              prepared_truck_data)
+    assert all((batch['total'] < 50).all() for batch in loaded_batches)
+    load_held_back_extreme_rows(partial(number_and_keep_batch, loaded_batches), load_state)
+
+    key_columns = TRANSACTION_KEY_COLUMNS + ['transaction_sequence']
+    overlapped_data = pd.concat(loaded_batches)[key_columns]
+    serial_data = add_transaction_sequence(finish_cleaning_truck_data(
+        combine_transaction_data_files(prepared_files)))[key_columns]
+    assert len(overlapped_data) == 5
+    assert sorted(overlapped_data['transaction_sequence']) == [0, 0, 0, 1, 2]
+    assert overlapped_data.sort_values(key_columns, ignore_index=True).astype(str).equals(
+        serial_data.sort_values(key_columns, ignore_index=True).astype(str))
+
+
+def test_held_back_extreme_rows_stop_at_the_rows_left_to_load():
+    """The held back rows count towards --number like every other row"""
+    prepared_truck_data = read_prepared_truck_file(
+        'T3_T1_L1.csv', ['2025-03-24 12:00:00+00:00,card,4.99',
+                         '2025-03-24 12:01:00+00:00,card,499.0',
+                         '2025-03-24 12:02:00+00:00,card,499.0'])
+    loaded_batches = []
+    load_state = create_overlapped_load_state(rows_to_load=2)
+
+    load_overlapped_batch(loaded_batches.append, load_state, prepared_truck_data)
+    load_held_back_extreme_rows(loaded_batches.append, load_state)
+
+    assert [len(batch) for batch in loaded_batches] == [1, 1]
+    assert load_state['rows_left'] == 0
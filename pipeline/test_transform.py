@@ -0,0 +1,151 @@
+"""
+Tests for the cleaning steps in transform.py, checked against the original row by row
+versions on the truck files checked in to data-files
+"""
+from io import BytesIO
+from pathlib import Path
+import pandas as pd
+import pytest
+from transform import load_truck_data_from_file, add_ids_to_column, \
+    combine_transaction_data_files, remove_invalid_rows_from_total_column, \
+    fix_extreme_values_that_have_a_normal_version, clean_combined_truck_data, \
+    load_and_prepare_truck_data_file, finish_cleaning_truck_data, get_normal_totals, \
+    add_transaction_sequence
+from reference_transform import remove_invalid_rows_from_total_column_by_row, \
+    fix_extreme_values_that_have_a_normal_version_by_row
+
+PATH_TO_DATA_FILES = Path(__file__).parent / 'data-files'
+VALID_FILE_GLOB = 'T3_T*.csv'
+
+
+def load_all_truck_data(typed: bool = True) -> pd.DataFrame:
+    """Returns every truck file in data-files combined into one dataframe"""
+    truck_data = []
+    for path in sorted(PATH_TO_DATA_FILES.rglob(VALID_FILE_GLOB)):
+        truck_data.extend(add_ids_to_column(
+            load_truck_data_from_file([path.name], str(path.parent), typed), [path.name]))
+    return combine_transaction_data_files(truck_data)
+
+
+@pytest.fixture(name='truck_data')
+def fixture_truck_data() -> pd.DataFrame:
+    """Every raw truck file in data-files"""
+    return load_all_truck_data()
+
+
+def test_remove_invalid_rows_matches_row_by_row_on_data_files(truck_data):
+    """The vectorised removal keeps exactly the rows, and totals, the original kept"""
+    by_row = remove_invalid_rows_from_total_column_by_row(truck_data.copy())
+    vectorised = remove_invalid_rows_from_total_column(truck_data.copy())
+    assert len(vectorised) < len(truck_data)
+    assert vectorised.index.equals(by_row.index)
+    assert vectorised.astype(str).equals(by_row.astype(str))
+
+
+@pytest.mark.parametrize('total', ['-4.99', '0', '0.00', '0.0', '0. ', '', 'VOID', 'void',
+                                   'NULL', 'None', 'Blank', 'blank', 'ERR', 'extreme'])
+def test_remove_invalid_rows_drops_placeholders_negatives_and_zeros(total):
+    """Every total the original treated as invalid is removed"""
+    truck_data = pd.DataFrame({'timestamp': ['2025-03-24 12:00:00'] * 2, 'type': ['cash'] * 2,
+                               'total': [total, '4.99'], 'truck_id': [1, 1]})
+    assert remove_invalid_rows_from_total_column_by_row(truck_data.copy())['total'].tolist() == \
+        remove_invalid_rows_from_total_column(truck_data.copy())['total'].tolist() == ['4.99']
+
+
+def test_fix_extreme_values_matches_row_by_row_on_data_files(truck_data):
+    """Every extreme value is corrected or removed exactly as the original did"""
+    valid_data = remove_invalid_rows_from_total_column(truck_data)
+    by_row = fix_extreme_values_that_have_a_normal_version_by_row(valid_data.copy())
+    vectorised = fix_extreme_values_that_have_a_normal_version(valid_data.copy())
+    assert vectorised['total'].notna().sum() < len(valid_data)
+    assert vectorised['total'].equals(by_row['total'].astype(float))
+
+
+@pytest.mark.parametrize('total, fixed_total', [
+    ('499.0', 4.99), ('1234.56', None), ('1299.0', None), ('50.0', None), ('4.99', 4.99)])
+def test_fix_extreme_values_only_corrects_the_original_normal_version(total, fixed_total):
+    """Only a total whose original normal version is a price charged elsewhere is corrected"""
+    truck_data = pd.DataFrame({'total': [total, '4.99', '12.99'], 'truck_id': [1, 1, 1]})
+    fixed_totals = fix_extreme_values_that_have_a_normal_version(truck_data)['total']
+    assert fixed_totals[0] == fixed_total if fixed_total else pd.isna(fixed_totals[0])
+
+
+def test_fix_extreme_values_looks_up_prices_of_every_truck():
+    """An extreme value is corrected by a price another truck charged, like the original"""
+    truck_data = pd.DataFrame({'total': ['499.0', '4.99'], 'truck_id': [1, 2]})
+    assert fix_extreme_values_that_have_a_normal_version(truck_data)['total'].tolist() == \
+        [4.99, 4.99]
+
+
+def test_files_prepared_separately_clean_the_same_as_combined_files():
+    """Preparing each file on its own, as worker processes do, cleans the same rows"""
+    paths = sorted(PATH_TO_DATA_FILES.rglob(VALID_FILE_GLOB))
+    prepared_data = combine_transaction_data_files(
+        [load_and_prepare_truck_data_file(str(path), path.name) for path in paths])
+    cleaned_separately = finish_cleaning_truck_data(
+        prepared_data, get_normal_totals(prepared_data['total']))
+    assert cleaned_separately.reset_index(drop=True).equals(
+        clean_combined_truck_data(load_all_truck_data()).reset_index(drop=True))
+
+
+def test_file_crossing_the_clock_change_keeps_the_local_times():
+    """A file with both UTC offsets of the 30 March clock change keeps each row's local time"""
+    truck_file = BytesIO(b'timestamp,type,total\n'
+                         b'2025-03-30 00:45:00+00:00,card,4.99\n'
+                         b'2025-03-30 02:15:00+01:00,cash,12.99\n'
+                         b'2025-03-30 03:00:00+01:00,card,499.0\n')
+    cleaned_truck_data = finish_cleaning_truck_data(
+        load_and_prepare_truck_data_file(truck_file, 'T3_T1_L1.csv'))
+    assert cleaned_truck_data['timestamp'].tolist() == [
+        pd.Timestamp('2025-03-30 00:45:00'), pd.Timestamp('2025-03-30 02:15:00'),
+        pd.Timestamp('2025-03-30 03:00:00')]
+    assert cleaned_truck_data['total'].tolist() == [4.99, 12.99, 4.99]
+
+
+def create_transactions(rows: list[tuple]) -> pd.DataFrame:
+    """Returns cleaned transactions made of (truck_id, time, type, total) rows"""
+    transactions = pd.DataFrame(rows, columns=['truck_id', 'timestamp', 'type', 'total'])
+    return transactions.assign(timestamp=pd.to_datetime(transactions['timestamp']))
+
+
+def number_transactions(truck_data: pd.DataFrame) -> list[tuple]:
+    """Returns each transaction with its sequence, in an order that does not depend on rows"""
+    return sorted(add_transaction_sequence(truck_data).astype({'timestamp': str}).itertuples(
+        index=False, name=None))
+
+
+def test_add_transaction_sequence_numbers_identical_transactions_from_zero():
+    """Identical transactions are numbered 0, 1, 2 and every other transaction 0"""
+    truck_data = create_transactions([(1, '2025-03-24 12:00', 'card', 4.99)] * 3 + [
+        (1, '2025-03-24 12:00', 'cash', 4.99), (2, '2025-03-24 12:00', 'card', 4.99)])
+    assert add_transaction_sequence(truck_data)['transaction_sequence'].tolist() == \
+        [0, 1, 2, 0, 0]
+
+
+def test_add_transaction_sequence_does_not_depend_on_the_order_of_rows():
+    """Shuffled rows get the same natural keys, so re-reading a file loads the same rows"""
+    truck_data = create_transactions([(1, '2025-03-24 12:00', 'card', 4.99)] * 2 + [
+        (1, '2025-03-24 12:05', 'cash', 8.99)] * 3 + [(1, '2025-03-24 12:00', 'card', 7.5)])
+    shuffled_data = truck_data.sample(frac=1, random_state=1)
+    assert not shuffled_data.index.equals(truck_data.index)
+    assert number_transactions(shuffled_data) == number_transactions(truck_data)
+
+
+def test_add_transaction_sequence_starts_after_the_loaded_transactions():
+    """Rows numbered after those already loaded get the sequences a single load gives them"""
+    truck_data = create_transactions([(1, '2025-03-24 12:00', 'card', 4.99)] * 3 + [
+        (1, '2025-03-24 12:05', 'cash', 8.99)])
+    loaded_data, later_data = truck_data.iloc[[0, 3]], truck_data.iloc[[1, 2]]
+    assert add_transaction_sequence(later_data, loaded_data)['transaction_sequence'].tolist() \
+        == [1, 2]
+    numbered_separately = pd.concat([add_transaction_sequence(loaded_data),
+                                     add_transaction_sequence(later_data, loaded_data)])
+    assert sorted(numbered_separately.astype({'timestamp': str}).itertuples(
+        index=False, name=None)) == number_transactions(truck_data)
+
+
+def test_add_transaction_sequence_keeps_an_existing_sequence():
+    """Data that has already been numbered, such as held back rows, is not renumbered"""
+    truck_data = create_transactions([(1, '2025-03-24 12:00', 'card', 4.99)] * 2).assign(
+        transaction_sequence=[3, 4])
+    assert add_transaction_sequence(truck_data)['transaction_sequence'].tolist() == [3, 4]
@@ -1,7 +1,10 @@
 """Module that formats and cleans the truck data before writing to a .csv file"""
 from os import listdir
 from datetime import datetime
+from io import BytesIO
+import numpy as np
 import pandas as pd
+from instrumentation import measure_stage, count_rows_and_bytes
 
 
 VALID_FILE_PATTERN = ['T3_', '.csv']
@@ -9,6 +12,15 @@ VALID_DATE = datetime.now().date().strftime('%Y-%-m/%-d')
 VALID_TIME = datetime.now().hour
 PATH_TO_LOAD_DATA = f'./data-files/{VALID_DATE}/{VALID_TIME}'
 CSV_FILENAME = 'TRUCK_HIST_DATA.csv'
+STAGING_PATH = './data-files/staging'
+STAGING_PARTITION_COLUMNS = ['event_date', 'event_hour']
+INVALID_TOTAL_VALUES = {'', 'NULL', 'None', 'ERR', 'extreme'}
+INVALID_TOTAL_VALUES_ANY_CASE = {'void', 'blank'}
+MAX_NORMAL_TOTAL = 50
+PAYMENT_TYPES = pd.CategoricalDtype(['cash', 'card'])
+TRUCK_DATA_COLUMNS = ['timestamp', 'type', 'total']
+TRUCK_DATA_TYPES = {'timestamp': 'string[pyarrow]', 'type': PAYMENT_TYPES, 'total': str}
+TRANSACTION_KEY_COLUMNS = ['truck_id', 'timestamp', 'type', 'total']
 
 
 def get_list_of_data_files(path_to_load: str):
@@ -16,12 +28,34 @@ def get_list_of_data_files(path_to_load: str):
     return listdir(path_to_load)
 
 
-def load_truck_data_from_file(filenames: list[str], path_to_load: str) -> list[pd.DataFrame]:
+def read_truck_data_csv(truck_file: str | BytesIO, typed: bool = True) -> pd.DataFrame:
+    """
+    Returns a truck file as a pandas dataframe. When typed, the payment type is read
+    as a category, and the timestamp and total are kept as raw text: a file crossing
+    a clock change mixes UTC offsets, and the total has to be validated. The timestamp
+    is held in Arrow, so cutting off its offset runs without a Python string per row
+    """
+    if not typed:
+        return pd.read_csv(truck_file)
+    return pd.read_csv(truck_file, usecols=TRUCK_DATA_COLUMNS, dtype=TRUCK_DATA_TYPES)
+
+
+def load_truck_data_from_file(filenames: list[str], path_to_load: str,
+                              typed: bool = True) -> list[pd.DataFrame]:
     """Loads all the truck data from each file into a pandas dataframe"""
     loaded_truck_data = []
     for filename in filenames:
-        loaded_truck_data.append(pd.read_csv(
-            f'{path_to_load}/{filename}'))
+        loaded_truck_data.append(read_truck_data_csv(
+            f'{path_to_load}/{filename}', typed))
+    return loaded_truck_data
+
+
+def load_truck_data_from_buffers(buffers: list[BytesIO],
+                                 typed: bool = True) -> list[pd.DataFrame]:
+    """Loads all the truck data from each in-memory file into a pandas dataframe"""
+    loaded_truck_data = []
+    for buffer in buffers:
+        loaded_truck_data.append(read_truck_data_csv(buffer, typed))
     return loaded_truck_data
 
 
@@ -38,7 +72,7 @@ def add_ids_to_column(truck_data: list[pd.DataFrame], filenames: list[str]) -> l
     """Returns all the pandas dataframes with the relevant truck id taken from filename"""
     for truck, file in zip(truck_data, filenames):
         truck_id = ''.join(file.split('T3_T')[1])[0]
-        truck['truck_id'] = truck_id
+        truck['truck_id'] = np.int16(truck_id)
         truck.columns = ['timestamp', 'type', 'total', 'truck_id']
     return truck_data
 
@@ -50,99 +84,201 @@ def combine_transaction_data_files(truck_data: list[pd.DataFrame]) -> pd.DataFra
     return data_for_csv_file
 
 
-def validate_if_invalid_row(row_value: str) -> str:
-    """Returns the value 'None' for any invalid rows otherwise it's original value"""
-    if '-' in str(row_value):
-        return 'None'
-
-    if row_value in {'0', '0.00', '0.0', '0. '}:
-        return 'None'
-
-    if (isinstance(row_value, (float, int))) and row_value in {0, 0.0, 0.00, 0.}:
-        return 'None'
-
-    if (isinstance(row_value, (float, int))):
-        return row_value
-
-    if row_value == '' or row_value.lower() == 'void' or \
-            row_value == 'NULL' or row_value == 'None':
-        return 'None'
-
-    if row_value.lower() == 'blank' \
-            or row_value == 'ERR' or '-' in row_value or row_value == 'extreme':
-        return 'None'
+def get_invalid_total_mask(totals: pd.Series) -> pd.Series:
+    """
+    Returns a boolean mask of the totals that are negative, zero or
+    a placeholder such as NULL, VOID, blank or ERR.
+    Each distinct total is only checked once as there are very few of them
+    """
+    codes, unique_totals = pd.factorize(totals.astype(str))
+    unique_totals = pd.Series(unique_totals)
 
-    return row_value
+    is_negative = unique_totals.str.contains('-', regex=False)
+    is_zero = pd.to_numeric(unique_totals.str.strip(), errors='coerce').eq(0)
+    is_placeholder = unique_totals.isin(INVALID_TOTAL_VALUES) | \
+        unique_totals.str.lower().isin(INVALID_TOTAL_VALUES_ANY_CASE)
+    is_invalid = (is_negative | is_zero | is_placeholder).to_numpy()
+    return pd.Series(is_invalid[codes], index=totals.index)
 
 
 def remove_invalid_rows_from_total_column(truck_data: pd.DataFrame) -> pd.DataFrame:
     """Removing any rows where the total column is zero, blank, NULL or VOID
     Discarding invalid rows"""
-    truck_data['total'] = truck_data['total'].map(
-        lambda row: validate_if_invalid_row(row))
-    indexes_of_invalid_columns = truck_data[truck_data['total']
-                                            == 'None'].index
-    truck_data = truck_data.drop(indexes_of_invalid_columns)
+    truck_data = truck_data[~get_invalid_total_mask(truck_data['total'])]
     truck_data = truck_data.dropna()
     return truck_data
 
 
 def remove_timezone_from_timestamp(truck_data: pd.DataFrame) -> pd.DataFrame:
-    """Returns dataframe with timestamp reduced to the format: YYYY-MM-DD HH:MM:SS"""
-    truck_data['timestamp'] = truck_data['timestamp'].map(
-        lambda row: row[:-6])
+    """
+    Returns dataframe with timestamp parsed as the local time the truck recorded,
+    YYYY-MM-DD HH:MM:SS, by cutting off its UTC offset, which changes with the clocks
+    """
+    truck_data['timestamp'] = pd.to_datetime(truck_data['timestamp'].str[:-6], format='ISO8601')
     return truck_data
 
 
 def convert_column_data_types(truck_data: pd.DataFrame) -> pd.DataFrame:
     """Converting columns to the most appropriate data type or format"""
-    truck_data = truck_data.astype({'timestamp': 'datetime64[ns]', 'type': str, 'total': float,
-                                    'truck_id': int})
+    truck_data = truck_data.astype({'timestamp': 'datetime64[ns]', 'type': PAYMENT_TYPES,
+                                    'total': float, 'truck_id': 'int16'})
     return truck_data
 
 
-def is_extreme_value_and_have_normal_version(row_value: float,
-                                             valid_normal_values: list[float]) -> float:
+def parse_total(total: str) -> float:
+    """Returns a total as a float like the original cleaning did, or NaN if it is not a number"""
+    try:
+        return float(total)
+    except ValueError:
+        return np.nan
+
+
+def parse_totals(totals: pd.Series) -> tuple[np.ndarray, pd.Index, np.ndarray]:
     """
-    Returns legitimate extreme values that could be mistyped 
-    based on other values in the truck, corrected
-    e.g: 499.0 to 4.99
+    Returns the codes of each total, its distinct values and those values as floats,
+    so each distinct total is only parsed once as there are very few of them
     """
-    if row_value < 50:
-        return row_value
+    codes, unique_totals = pd.factorize(totals)
+    return codes, unique_totals, np.array([parse_total(total) for total in unique_totals],
+                                          dtype=float)
 
-    normal_row = list(filter(lambda number: number != '.',
-                             str(row_value)))
 
-    if len(normal_row) == 3:
-        normal_row.insert(0, '0')
+def get_normal_totals(totals: pd.Series) -> set[str]:
+    """
+    Returns every distinct total, as written in the truck files, that is a normal price
+    between 0 and 50. Extreme values are corrected by looking them up in these
+    """
+    _, unique_totals, parsed_totals = parse_totals(totals)
+    return {str(total) for total, parsed_total in zip(unique_totals, parsed_totals)
+            if 0 < parsed_total < MAX_NORMAL_TOTAL}
+
+
+def get_extreme_total_mask(totals: pd.Series) -> np.ndarray:
+    """Returns a boolean mask of the totals that are at least the largest normal price"""
+    codes, _, parsed_totals = parse_totals(totals)
+    # missing totals have the code -1, so they take the value appended at the end
+    return np.append(parsed_totals >= MAX_NORMAL_TOTAL, False)[codes]
 
-    normal_row.insert(1, '.')
-    normal_row.pop(-1)
-    normal_row = ''.join(normal_row)
-    if normal_row in valid_normal_values:
-        return normal_row
-    return None
 
+def get_normal_version_of_extreme_total(extreme_total: float) -> str:
+    """
+    Returns an extreme total with its decimal point moved after the first digit and its
+    last digit dropped, written like the truck files write prices e.g: 499.0 to '4.99'
+    """
+    normal_total = list(filter(lambda number: number != '.', str(extreme_total)))
+    if len(normal_total) == 3:
+        normal_total.insert(0, '0')
+    normal_total.insert(1, '.')
+    normal_total.pop(-1)
+    return ''.join(normal_total)
 
-def fix_extreme_values_that_have_a_normal_version(truck_data: pd.DataFrame) -> pd.DataFrame:
-    """Returns a dataframe with corrected or removed extreme values"""
-    normal_values = list(truck_data['total'].unique())
-    valid_normal_values = list(
-        filter(lambda val: 0 < float(val) < 50, normal_values))
 
-    truck_data['total'] = truck_data['total'].map(
-        lambda row: is_extreme_value_and_have_normal_version(float(row), valid_normal_values))
+def fix_extreme_total(total: float, normal_totals: set[str]) -> float:
+    """
+    Returns a normal total unchanged, an extreme total corrected if its normal
+    version is one of the normal totals, and NaN otherwise
+    """
+    if total < MAX_NORMAL_TOTAL:
+        return total
+    normal_total = get_normal_version_of_extreme_total(total)
+    return float(normal_total) if normal_total in normal_totals else np.nan
+
+
+def fix_extreme_values_that_have_a_normal_version(truck_data: pd.DataFrame,
+                                                  normal_totals: set[str] = None) -> pd.DataFrame:
+    """
+    Returns a dataframe with corrected or removed extreme values. An extreme value is
+    corrected if its normal version is a price charged by any truck in the data, or is in
+    the given normal totals, e.g: 499.0 to 4.99. Each distinct total is only fixed once
+    """
+    if normal_totals is None:
+        normal_totals = get_normal_totals(truck_data['total'])
+    codes, _, parsed_totals = parse_totals(truck_data['total'])
+    fixed_totals = [fix_extreme_total(total, normal_totals) for total in parsed_totals]
+    # missing totals have the code -1, so they take the NaN appended at the end
+    truck_data['total'] = np.array(fixed_totals + [np.nan], dtype=float)[codes]
     return truck_data
 
 
+def remove_invalid_rows_and_timezone(truck_data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns the truck data without invalid totals or timezones, the cleaning steps
+    that only look at one row at a time, so each file can be prepared on its own
+    """
+    return remove_timezone_from_timestamp(remove_invalid_rows_from_total_column(truck_data))
+
+
+def finish_cleaning_truck_data(truck_data: pd.DataFrame,
+                               normal_totals: set[str] = None) -> pd.DataFrame:
+    """
+    Returns prepared truck data with its extreme values corrected, looking them up in
+    the normal totals of every truck, and its columns converted
+    """
+    cleaned_data = fix_extreme_values_that_have_a_normal_version(truck_data, normal_totals)
+    return convert_column_data_types(cleaned_data.dropna())
+
+
+def clean_combined_truck_data(truck_data: pd.DataFrame) -> pd.DataFrame:
+    """Returns the combined truck data with every cleaning step applied"""
+    return finish_cleaning_truck_data(remove_invalid_rows_and_timezone(truck_data))
+
+
+def add_transaction_sequence(truck_data: pd.DataFrame,
+                             loaded_truck_data: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    Returns the truck data with a sequence numbering identical transactions of the same
+    truck file, so every row has a natural key that is the same each time it is loaded.
+    Numbering starts after identical transactions of the file already loaded, such as
+    those the overlapped pipeline loads before their file's extreme values are corrected.
+    Data that already has a sequence keeps it
+    """
+    if 'transaction_sequence' in truck_data.columns:
+        return truck_data
+    transaction_sequence = truck_data.groupby(TRANSACTION_KEY_COLUMNS,
+                                              observed=True, sort=False).cumcount()
+    if loaded_truck_data is not None and not loaded_truck_data.empty:
+        loaded_counts = loaded_truck_data.groupby(TRANSACTION_KEY_COLUMNS,
+                                                  observed=True).size().rename('loaded')
+        transaction_sequence += truck_data[TRANSACTION_KEY_COLUMNS].join(
+            loaded_counts, on=TRANSACTION_KEY_COLUMNS)['loaded'].fillna(0).astype(int)
+    return truck_data.assign(transaction_sequence=transaction_sequence.astype(np.int16))
+
+
+def load_and_prepare_truck_data_file(truck_file: str | BytesIO, filename: str) -> pd.DataFrame:
+    """
+    Returns the data of a single truck file without invalid totals or timezones, taking
+    the truck id from its filename or S3 key, and measures the read and cleaning as the
+    transform.read_csv and transform.clean stages. Used to prepare files in parallel
+    before their extreme values are corrected against the prices of every truck
+    """
+    with measure_stage('transform.read_csv') as stage:
+        truck_data = read_truck_data_csv(truck_file)
+        stage.update(count_rows_and_bytes(truck_data))
+    with measure_stage('transform.clean', len(truck_data)) as stage:
+        prepared_truck_data = remove_invalid_rows_and_timezone(
+            add_ids_to_column([truck_data], [filename])[0])
+        stage['rows_out'] = len(prepared_truck_data)
+    return prepared_truck_data
+
+
 def write_to_csv_file(data_for_csv: pd.DataFrame, path_to_write_to: str) -> None:
     """Writes the truck data as a pandas dataframe to a csv file"""
     data_for_csv.to_csv(path_to_write_to, index=False)
 
 
+def write_to_parquet_dataset(truck_data: pd.DataFrame, path_to_write_to: str) -> None:
+    """
+    Writes the cleaned truck data to a compressed Parquet dataset partitioned by the
+    date and hour of each transaction, replacing any partitions that are written again
+    """
+    truck_data.assign(event_date=truck_data['timestamp'].dt.strftime('%Y-%m-%d'),
+                      event_hour=truck_data['timestamp'].dt.hour.astype('int8')).to_parquet(
+        path_to_write_to, engine='pyarrow', compression='zstd', index=False,
+        partition_cols=STAGING_PARTITION_COLUMNS, existing_data_behavior='delete_matching')
+
+
 def main():
-    """Transforms the truck data into a clean and single .csv file"""
+    """Transforms the truck data into a clean Parquet staging dataset"""
     filenames = get_list_of_data_files(PATH_TO_LOAD_DATA)
     print('Loading truck data...')
     filtered_filenames = filter_files_to_clean(
@@ -152,15 +288,9 @@ def main():
     print('Transforming and cleaning truck data...')
     transformed_data = add_ids_to_column(truck_data, filtered_filenames)
     combined_data = combine_transaction_data_files(transformed_data)
-    removed_invalid_rows = remove_invalid_rows_from_total_column(combined_data)
-    remove_timezone = remove_timezone_from_timestamp(removed_invalid_rows)
-    cleaned_data = fix_extreme_values_that_have_a_normal_version(
-        remove_timezone)
-    cleaned_data = cleaned_data.dropna()
-    converted_column_types = convert_column_data_types(cleaned_data)
-    print(f'Writing truck data to {PATH_TO_LOAD_DATA}/{CSV_FILENAME}...')
-    write_to_csv_file(converted_column_types,
-                      f'{PATH_TO_LOAD_DATA}/{CSV_FILENAME}')
+    converted_column_types = clean_combined_truck_data(combined_data)
+    print(f'Writing truck data to {STAGING_PATH}...')
+    write_to_parquet_dataset(converted_column_types, STAGING_PATH)
     print('Successfully transformed truck data.')
 
 
@@ -0,0 +1,65 @@
+"""
+Module that writes and reads the Parquet snapshots of AGG_Truck_Hourly the pipeline exports
+after each load, in a local directory or an S3 prefix, for the dashboard's analytics store
+"""
+from datetime import datetime, timezone
+from pathlib import Path
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pyarrow import fs
+
+SNAPSHOT_PREFIX = 'hourly_totals_'
+SNAPSHOT_SCHEMA = pa.schema([('event_hour', pa.timestamp('us')), ('truck_id', pa.int16()),
+                             ('payment_method_id', pa.int16()),
+                             ('total_transactions', pa.int64()),
+                             ('total_profits', pa.float64()), ('updated_at', pa.timestamp('us'))])
+
+
+def get_snapshot_filesystem(snapshot_path: str) -> tuple[fs.FileSystem, str]:
+    """Returns the filesystem and path of a snapshot directory given as a local path or s3:// URI"""
+    if '://' not in snapshot_path:
+        snapshot_path = str(Path(snapshot_path).resolve())
+    return fs.FileSystem.from_uri(snapshot_path)
+
+
+def write_hourly_totals_snapshot(hourly_totals: pd.DataFrame, snapshot_path: str) -> str:
+    """
+    Writes hourly totals to a new snapshot named after the current time, so snapshots
+    sort in the order they were exported, and returns its name
+    """
+    filesystem, directory = get_snapshot_filesystem(snapshot_path)
+    filesystem.create_dir(directory, recursive=True)
+    snapshot_name = f'{SNAPSHOT_PREFIX}{datetime.now(timezone.utc):%Y%m%dT%H%M%S%f}.parquet'
+    pq.write_table(pa.Table.from_pandas(hourly_totals, schema=SNAPSHOT_SCHEMA,
+                                        preserve_index=False),
+                   f'{directory}/{snapshot_name}', filesystem=filesystem, compression='zstd')
+    return snapshot_name
+
+
+def list_hourly_totals_snapshots(snapshot_path: str) -> list[str]:
+    """Returns the names of every snapshot in the order they were exported"""
+    filesystem, directory = get_snapshot_filesystem(snapshot_path)
+    snapshots = filesystem.get_file_info(fs.FileSelector(directory, allow_not_found=True))
+    return sorted(snapshot.base_name for snapshot in snapshots
+                  if snapshot.is_file and snapshot.base_name.startswith(SNAPSHOT_PREFIX))
+
+
+def read_hourly_totals_snapshot(snapshot_path: str, snapshot_name: str) -> pa.Table:
+    """Returns the hourly totals in a snapshot as an Arrow table"""
+    filesystem, directory = get_snapshot_filesystem(snapshot_path)
+    return pq.read_table(f'{directory}/{snapshot_name}', filesystem=filesystem,
+                         schema=SNAPSHOT_SCHEMA)
+
+
+def get_last_exported_update(snapshot_path: str) -> datetime | None:
+    """
+    Returns the latest updated_at in the most recent snapshot with any totals,
+    or None when nothing has been exported yet
+    """
+    for snapshot_name in reversed(list_hourly_totals_snapshots(snapshot_path)):
+        last_update = read_hourly_totals_snapshot(
+            snapshot_path, snapshot_name).column('updated_at').to_pandas().max()
+        if pd.notna(last_update):
+            return last_update.to_pydatetime()
+    return None
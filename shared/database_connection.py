@@ -0,0 +1,146 @@
+"""
+Module that hands out pooled connections to the MySQL database for the pipeline,
+dashboard and report, reusing them across Streamlit reruns and warm Lambda invocations
+"""
+from contextlib import contextmanager
+from os import environ
+from queue import LifoQueue, Empty, Full
+from threading import Lock
+from time import monotonic, perf_counter
+from typing import Iterator
+import pymysql.cursors
+import pymysql
+
+DB_CONNECT_TIMEOUT_SECONDS = int(environ.get('DB_CONNECT_TIMEOUT_SECONDS', 10))
+DB_READ_TIMEOUT_SECONDS = int(environ.get('DB_READ_TIMEOUT_SECONDS', 300))
+DB_WRITE_TIMEOUT_SECONDS = int(environ.get('DB_WRITE_TIMEOUT_SECONDS', 300))
+MAX_POOLED_CONNECTIONS = int(environ.get('MAX_POOLED_CONNECTIONS', 4))
+HEALTH_CHECK_AFTER_IDLE_SECONDS = 30
+CONNECTION_POOLS = {}
+CONNECTION_STATS = {'acquired': 0, 'created': 0, 'reused': 0, 'health_check_failures': 0,
+                    'acquire_seconds': 0.0, 'max_acquire_seconds': 0.0}
+CONNECTION_LOCK = Lock()
+
+
+def create_connection(local_infile: bool = False) -> pymysql.connections.Connection:
+    """
+    Returns a new connection to the remote MySQL database with connect and read/write
+    timeouts, optionally allowing LOAD DATA LOCAL INFILE
+    """
+    return pymysql.connections.Connection(host=environ.get('DB_HOST'),
+                                          user=environ.get('DB_USER'),
+                                          password=environ.get('DB_PASSWORD'),
+                                          database=environ.get('DB_NAME'),
+                                          port=int(environ.get('DB_PORT', 3306)),
+                                          cursorclass=pymysql.cursors.DictCursor,
+                                          connect_timeout=DB_CONNECT_TIMEOUT_SECONDS,
+                                          read_timeout=DB_READ_TIMEOUT_SECONDS,
+                                          write_timeout=DB_WRITE_TIMEOUT_SECONDS,
+                                          local_infile=local_infile)
+
+
+def get_connection_pool(local_infile: bool) -> LifoQueue:
+    """Returns the pool of idle connections for the given connection options"""
+    with CONNECTION_LOCK:
+        return CONNECTION_POOLS.setdefault(local_infile, LifoQueue(MAX_POOLED_CONNECTIONS))
+
+
+def is_connection_healthy(conn: pymysql.connections.Connection, idle_seconds: float) -> bool:
+    """Returns whether a pooled connection is open, pinging it when it has been idle a while"""
+    if not conn.open:
+        return False
+    if idle_seconds < HEALTH_CHECK_AFTER_IDLE_SECONDS:
+        return True
+    try:
+        conn.ping(reconnect=False)
+        return True
+    except pymysql.Error:
+        return False
+
+
+def close_connection(conn: pymysql.connections.Connection) -> None:
+    """Closes a connection, ignoring errors from one that has already been dropped"""
+    try:
+        conn.close()
+    except pymysql.Error:
+        pass
+
+
+def take_healthy_pooled_connection(
+        local_infile: bool) -> pymysql.connections.Connection | None:
+    """Returns the most recently used healthy connection in the pool, closing unhealthy ones"""
+    connection_pool = get_connection_pool(local_infile)
+    while True:
+        try:
+            conn, released_at = connection_pool.get_nowait()
+        except Empty:
+            return None
+        if is_connection_healthy(conn, monotonic() - released_at):
+            return conn
+        with CONNECTION_LOCK:
+            CONNECTION_STATS['health_check_failures'] += 1
+        close_connection(conn)
+
+
+def record_connection_acquired(seconds: float, reused: bool) -> None:
+    """Adds an acquired connection and the seconds it took to the connection stats"""
+    with CONNECTION_LOCK:
+        CONNECTION_STATS['acquired'] += 1
+        CONNECTION_STATS['reused' if reused else 'created'] += 1
+        CONNECTION_STATS['acquire_seconds'] += seconds
+        CONNECTION_STATS['max_acquire_seconds'] = max(CONNECTION_STATS['max_acquire_seconds'],
+                                                      seconds)
+
+
+def acquire_connection(local_infile: bool = False) -> pymysql.connections.Connection:
+    """Returns a healthy pooled connection, or a new one when none are idle"""
+    start_time = perf_counter()
+    conn = take_healthy_pooled_connection(local_infile)
+    reused = conn is not None
+    if not reused:
+        conn = create_connection(local_infile)
+    record_connection_acquired(perf_counter() - start_time, reused)
+    return conn
+
+
+def release_connection(conn: pymysql.connections.Connection, local_infile: bool = False) -> None:
+    """
+    Returns a connection to the pool after rolling back anything left uncommitted,
+    closing it instead when it has been dropped or the pool is full
+    """
+    try:
+        conn.rollback()
+        get_connection_pool(local_infile).put_nowait((conn, monotonic()))
+    except (pymysql.Error, Full):
+        close_connection(conn)
+
+
+@contextmanager
+def pooled_connection(local_infile: bool = False) -> Iterator[pymysql.connections.Connection]:
+    """Yields a pooled connection to the database and releases it back to the pool afterwards"""
+    conn = acquire_connection(local_infile)
+    try:
+        yield conn
+    finally:
+        release_connection(conn, local_infile)
+
+
+def get_connection_stats() -> dict:
+    """Returns the connection stats so far, including the average seconds to acquire one"""
+    with CONNECTION_LOCK:
+        connection_stats = dict(CONNECTION_STATS)
+    connection_stats['average_acquire_seconds'] = \
+        connection_stats['acquire_seconds'] / max(connection_stats['acquired'], 1)
+    return connection_stats
+
+
+def close_all_connections() -> None:
+    """Closes every idle connection in the pools, such as when a script is finishing"""
+    with CONNECTION_LOCK:
+        connection_pools = list(CONNECTION_POOLS.values())
+    for connection_pool in connection_pools:
+        while True:
+            try:
+                close_connection(connection_pool.get_nowait()[0])
+            except Empty:
+                break
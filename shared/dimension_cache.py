@@ -0,0 +1,117 @@
+"""
+Module that caches the small dimension tables in memory for the pipeline,
+dashboard and report, so fact queries can resolve ids without joins
+"""
+import json
+from os import environ
+from pathlib import Path
+from threading import Lock
+from time import monotonic, time
+import pymysql
+
+DIMENSION_CACHE_TTL_SECONDS = int(environ.get('DIMENSION_CACHE_TTL_SECONDS', 3600))
+DIMENSION_SNAPSHOT_PATH = environ.get('DIMENSION_SNAPSHOT_PATH')
+DIMENSION_QUERIES = {
+    'DIM_Truck': """SELECT truck_id, truck_name, truck_description, has_card_reader,
+                    fsa_rating FROM DIM_Truck;""",
+    'DIM_Payment_Method': """SELECT payment_method_id, payment_method
+                             FROM DIM_Payment_Method;"""
+}
+DIMENSION_CACHE = {}
+DIMENSION_CACHE_STATS = {'hits': 0, 'snapshot_hits': 0, 'misses': 0}
+DIMENSION_CACHE_LOCK = Lock()
+
+
+def load_dimension_snapshot(snapshot_path: str) -> dict:
+    """Returns the dimension tables saved on disk, or an empty dictionary if there are none"""
+    if snapshot_path is None or not Path(snapshot_path).exists():
+        return {}
+    with open(snapshot_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_dimension_snapshot(snapshot: dict, snapshot_path: str) -> None:
+    """Writes the dimension tables to disk, replacing the previous snapshot in one step"""
+    Path(snapshot_path).parent.mkdir(parents=True, exist_ok=True)
+    temporary_path = Path(f'{snapshot_path}.tmp')
+    with open(temporary_path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f, indent=4)
+    temporary_path.replace(snapshot_path)
+
+
+def query_dimension_table(conn: pymysql.connections.Connection, table_name: str) -> list[dict]:
+    """Returns every row of a dimension table from the database"""
+    with conn.cursor() as cursor:
+        cursor.execute(DIMENSION_QUERIES[table_name])
+        return list(cursor.fetchall())
+
+
+def get_dimension_rows_from_snapshot(table_name: str, ttl_seconds: int,
+                                     snapshot_path: str) -> list[dict] | None:
+    """Returns the rows of a dimension table saved on disk within the ttl, otherwise None"""
+    snapshot = load_dimension_snapshot(snapshot_path).get(table_name)
+    if snapshot is None or time() - snapshot['saved_at'] >= ttl_seconds:
+        return None
+    return snapshot['rows']
+
+
+def get_dimension_rows(conn: pymysql.connections.Connection, table_name: str,
+                       ttl_seconds: int = DIMENSION_CACHE_TTL_SECONDS,
+                       snapshot_path: str = DIMENSION_SNAPSHOT_PATH) -> list[dict]:
+    """
+    Returns the rows of a dimension table from memory when they were loaded within
+    the ttl, then from the snapshot on disk, and only queries the database otherwise
+    """
+    with DIMENSION_CACHE_LOCK:
+        cached_table = DIMENSION_CACHE.get(table_name)
+        if cached_table is not None and monotonic() - cached_table['loaded_at'] < ttl_seconds:
+            DIMENSION_CACHE_STATS['hits'] += 1
+            return cached_table['rows']
+
+        rows = get_dimension_rows_from_snapshot(table_name, ttl_seconds, snapshot_path)
+        if rows is not None:
+            DIMENSION_CACHE_STATS['snapshot_hits'] += 1
+        else:
+            DIMENSION_CACHE_STATS['misses'] += 1
+            rows = query_dimension_table(conn, table_name)
+            if snapshot_path is not None:
+                snapshot = load_dimension_snapshot(snapshot_path)
+                snapshot[table_name] = {'saved_at': time(), 'rows': rows}
+                write_dimension_snapshot(snapshot, snapshot_path)
+
+        DIMENSION_CACHE[table_name] = {'loaded_at': monotonic(), 'rows': rows}
+        return rows
+
+
+def get_payment_method_table(conn: pymysql.connections.Connection) -> dict:
+    """Returns the payment methods as a dictionary of payment_method to payment_method_id"""
+    return {row['payment_method']: row['payment_method_id']
+            for row in get_dimension_rows(conn, 'DIM_Payment_Method')}
+
+
+def get_payment_method_names(conn: pymysql.connections.Connection) -> dict:
+    """Returns the payment methods as a dictionary of payment_method_id to payment_method"""
+    return {row['payment_method_id']: row['payment_method']
+            for row in get_dimension_rows(conn, 'DIM_Payment_Method')}
+
+
+def get_truck_column(conn: pymysql.connections.Connection, column: str,
+                     ttl_seconds: int = DIMENSION_CACHE_TTL_SECONDS) -> dict:
+    """
+    Returns a column of the truck table as a dictionary keyed by truck_id.
+    A ttl of zero reads DIM_Truck from the database again and refreshes the caches
+    """
+    return {row['truck_id']: row[column]
+            for row in get_dimension_rows(conn, 'DIM_Truck', ttl_seconds)}
+
+
+def get_dimension_cache_stats() -> dict:
+    """Returns a copy of the number of cache hits, snapshot hits and misses so far"""
+    with DIMENSION_CACHE_LOCK:
+        return dict(DIMENSION_CACHE_STATS)
+
+
+def clear_dimension_cache() -> None:
+    """Empties the in-memory cache so the next lookup reads the snapshot or database"""
+    with DIMENSION_CACHE_LOCK:
+        DIMENSION_CACHE.clear()
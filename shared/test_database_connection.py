@@ -0,0 +1,133 @@
+"""Tests for the pool of database connections in database_connection.py"""
+import pymysql
+import pytest
+import database_connection
+from database_connection import pooled_connection, acquire_connection, release_connection, \
+    get_connection_stats, close_all_connections, HEALTH_CHECK_AFTER_IDLE_SECONDS
+
+
+class FakeConnection:
+    """Stands in for a pymysql connection, recording rollbacks, pings and whether it is open"""
+
+    def __init__(self, local_infile: bool):
+        self.local_infile = local_infile
+        self.open = True
+        self.dropped = False
+        self.pings = 0
+        self.rollbacks = 0
+
+    def ping(self, reconnect: bool) -> None:
+        """Raises like pymysql when the database has dropped the connection"""
+        assert not reconnect
+        self.pings += 1
+        if self.dropped:
+            raise pymysql.err.OperationalError(2013, 'Lost connection to MySQL server')
+
+    def rollback(self) -> None:
+        """Counts the rollbacks of uncommitted work"""
+        self.rollbacks += 1
+
+    def close(self) -> None:
+        """Closes the connection"""
+        self.open = False
+
+
+@pytest.fixture(name='clock')
+def fixture_clock(monkeypatch) -> dict:
+    """Gives each test empty pools of fake connections and a clock it can move forward"""
+    clock = {'seconds': 1000.0}
+    monkeypatch.setattr(database_connection, 'monotonic', lambda: clock['seconds'])
+    monkeypatch.setattr(database_connection, 'create_connection', FakeConnection)
+    monkeypatch.setattr(database_connection, 'CONNECTION_POOLS', {})
+    monkeypatch.setattr(database_connection, 'CONNECTION_STATS', dict(
+        database_connection.CONNECTION_STATS, acquired=0, created=0, reused=0,
+        health_check_failures=0))
+    yield clock
+    close_all_connections()
+
+
+@pytest.mark.usefixtures('clock')
+def test_the_most_recently_released_connection_is_reused_first():
+    """Idle connections are reused last in, first out, so the oldest can time out unused"""
+    first_conn, second_conn = acquire_connection(), acquire_connection()
+    release_connection(first_conn)
+    release_connection(second_conn)
+
+    with pooled_connection() as conn:
+        assert conn is second_conn
+    with pooled_connection() as conn:
+        assert conn is second_conn
+    connection_stats = get_connection_stats()
+    assert (connection_stats['created'], connection_stats['reused']) == (2, 2)
+
+
+def test_a_connection_idle_for_a_while_is_pinged_before_reuse(clock):
+    """Recently used connections are trusted, and one idle for longer is pinged first"""
+    with pooled_connection() as pooled_conn:
+        pass
+    clock['seconds'] += HEALTH_CHECK_AFTER_IDLE_SECONDS - 1
+    with pooled_connection() as conn:
+        assert conn is pooled_conn
+    assert pooled_conn.pings == 0
+
+    clock['seconds'] += HEALTH_CHECK_AFTER_IDLE_SECONDS
+    with pooled_connection() as conn:
+        assert conn is pooled_conn
+    assert pooled_conn.pings == 1
+
+
+def test_a_dropped_connection_is_closed_and_replaced(clock):
+    """A connection that fails its ping is closed and a new one is created instead"""
+    with pooled_connection() as dropped_conn:
+        dropped_conn.dropped = True
+    clock['seconds'] += HEALTH_CHECK_AFTER_IDLE_SECONDS
+
+    with pooled_connection() as conn:
+        assert conn is not dropped_conn
+    assert not dropped_conn.open
+    assert get_connection_stats()['health_check_failures'] == 1
+
+
+@pytest.mark.usefixtures('clock')
+def test_uncommitted_work_is_rolled_back_when_released():
+    """The next user of a connection never sees work its last user left uncommitted"""
+    with pytest.raises(ValueError):
+        with pooled_connection() as failed_conn:
+            raise ValueError('Invalid number of rows to insert')
+    assert failed_conn.rollbacks == 1
+    with pooled_connection() as conn:
+        assert conn is failed_conn
+
+
+@pytest.mark.usefixtures('clock')
+def test_local_infile_connections_are_pooled_separately():
+    """A connection allowing LOAD DATA LOCAL INFILE is only handed out when asked for"""
+    with pooled_connection(local_infile=True) as local_infile_conn:
+        assert local_infile_conn.local_infile
+    with pooled_connection() as conn:
+        assert conn is not local_infile_conn
+        assert not conn.local_infile
+    with pooled_connection(local_infile=True) as conn:
+        assert conn is local_infile_conn
+
+
+@pytest.mark.usefixtures('clock')
+def test_a_full_pool_closes_the_extra_connections():
+    """No more than MAX_POOLED_CONNECTIONS are kept idle"""
+    connections = [acquire_connection()
+                   for _ in range(database_connection.MAX_POOLED_CONNECTIONS + 1)]
+    for conn in connections:
+        release_connection(conn)
+    assert [conn.open for conn in connections] == \
+        [True] * database_connection.MAX_POOLED_CONNECTIONS + [False]
+
+
+@pytest.mark.usefixtures('clock')
+def test_close_all_connections_closes_every_idle_connection():
+    """Every idle connection of every pool is closed when the script finishes"""
+    with pooled_connection() as conn, pooled_connection(local_infile=True) as local_infile_conn:
+        pass
+    close_all_connections()
+    assert not conn.open and not local_infile_conn.open
+    with pooled_connection() as new_conn:
+        assert new_conn is not conn
@@ -0,0 +1,128 @@
+"""Tests for the in-memory and on-disk dimension caches in dimension_cache.py"""
+import pytest
+import dimension_cache
+from dimension_cache import get_dimension_rows, get_truck_column, get_payment_method_table, \
+    get_dimension_cache_stats, clear_dimension_cache
+
+TRUCK_ROWS = [{'truck_id': 1, 'truck_name': 'Burrito Madness', 'truck_description': '',
+               'has_card_reader': 1, 'fsa_rating': 4}]
+PAYMENT_METHOD_ROWS = [{'payment_method_id': 1, 'payment_method': 'cash'},
+                       {'payment_method_id': 2, 'payment_method': 'card'}]
+
+
+class FakeCursor:
+    """Answers the dimension queries like a pymysql dictionary cursor"""
+
+    def __init__(self, connection: 'FakeConnection'):
+        self.connection = connection
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, sql_query: str) -> None:
+        """Counts the query and keeps the rows of the table it reads"""
+        table_name = 'DIM_Truck' if 'FROM DIM_Truck' in sql_query else 'DIM_Payment_Method'
+        self.connection.queries.append(table_name)
+        self.rows = self.connection.tables[table_name]
+
+    def fetchall(self) -> list[dict]:
+        """Returns copies of the rows of the last query"""
+        return [dict(row) for row in self.rows]
+
+
+class FakeConnection:  # pylint: disable=too-few-public-methods
+    """Serves the dimension tables, recording each table queried"""
+
+    def __init__(self):
+        self.tables = {'DIM_Truck': TRUCK_ROWS, 'DIM_Payment_Method': PAYMENT_METHOD_ROWS}
+        self.queries = []
+
+    def cursor(self) -> FakeCursor:
+        """Returns a cursor over the fake tables"""
+        return FakeCursor(self)
+
+
+@pytest.fixture(name='clock')
+def fixture_clock(monkeypatch) -> dict:
+    """Freezes the cache's clocks at a time the test can move forward, with an empty cache"""
+    clock = {'seconds': 1000.0}
+    monkeypatch.setattr(dimension_cache, 'monotonic', lambda: clock['seconds'])
+    monkeypatch.setattr(dimension_cache, 'time', lambda: clock['seconds'])
+    monkeypatch.setattr(dimension_cache, 'DIMENSION_CACHE_STATS',
+                        {'hits': 0, 'snapshot_hits': 0, 'misses': 0})
+    clear_dimension_cache()
+    yield clock
+    clear_dimension_cache()
+
+
+def test_rows_are_reused_until_the_ttl_has_passed(clock):
+    """The table is queried once, then read from memory until it is older than the ttl"""
+    conn = FakeConnection()
+    for seconds in [0, 30, 59.9]:
+        clock['seconds'] = 1000 + seconds
+        assert get_dimension_rows(conn, 'DIM_Truck', ttl_seconds=60, snapshot_path=None) == \
+            TRUCK_ROWS
+    assert conn.queries == ['DIM_Truck']
+
+    clock['seconds'] = 1060
+    get_dimension_rows(conn, 'DIM_Truck', ttl_seconds=60, snapshot_path=None)
+    assert conn.queries == ['DIM_Truck'] * 2
+    assert get_dimension_cache_stats() == {'hits': 2, 'snapshot_hits': 0, 'misses': 2}
+
+
+@pytest.mark.usefixtures('clock')
+def test_each_table_is_cached_separately():
+    """Reading one table neither reads nor refreshes the other"""
+    conn = FakeConnection()
+    get_truck_column(conn, 'truck_name')
+    assert get_payment_method_table(conn) == {'cash': 1, 'card': 2}
+    get_truck_column(conn, 'fsa_rating')
+    assert conn.queries == ['DIM_Truck', 'DIM_Payment_Method']
+
+
+def test_a_zero_ttl_reads_the_table_again_and_refreshes_the_cache(clock):
+    """A truck added since the table was cached is found by a zero ttl, without the clock moving"""
+    conn = FakeConnection()
+    assert get_truck_column(conn, 'truck_name') == {1: 'Burrito Madness'}
+    conn.tables['DIM_Truck'] = TRUCK_ROWS + [dict(TRUCK_ROWS[0], truck_id=7,
+                                                  truck_name='Hartmann')]
+    assert 7 not in get_truck_column(conn, 'truck_name')
+
+    assert get_truck_column(conn, 'truck_name', ttl_seconds=0) == {
+        1: 'Burrito Madness', 7: 'Hartmann'}
+    assert 7 in get_truck_column(conn, 'truck_name')
+    assert conn.queries == ['DIM_Truck'] * 2
+    assert clock['seconds'] == 1000
+
+
+def test_snapshot_is_shared_with_the_next_process_within_the_ttl(clock, tmp_path):
+    """A new process reads the snapshot written by the last, until the snapshot is too old"""
+    snapshot_path = str(tmp_path / 'dimension_snapshot.json')
+    conn = FakeConnection()
+    get_dimension_rows(conn, 'DIM_Truck', ttl_seconds=60, snapshot_path=snapshot_path)
+
+    clear_dimension_cache()
+    clock['seconds'] = 1030
+    assert get_dimension_rows(conn, 'DIM_Truck', ttl_seconds=60,
+                              snapshot_path=snapshot_path) == TRUCK_ROWS
+    assert conn.queries == ['DIM_Truck']
+
+    clear_dimension_cache()
+    clock['seconds'] = 1061
+    get_dimension_rows(conn, 'DIM_Truck', ttl_seconds=60, snapshot_path=snapshot_path)
+    assert conn.queries == ['DIM_Truck'] * 2
+    assert get_dimension_cache_stats() == {'hits': 0, 'snapshot_hits': 1, 'misses': 2}
+
+
+@pytest.mark.usefixtures('clock')
+def test_clear_dimension_cache_makes_the_next_lookup_query_again():
+    """Clearing the cache, as the dashboard's Reload all data button does, re-reads the tables"""
+    conn = FakeConnection()
+    get_payment_method_table(conn)
+    clear_dimension_cache()
+    get_payment_method_table(conn)
+    assert conn.queries == ['DIM_Payment_Method'] * 2